@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Per-account bot registry
+One deployment serves several Instagram accounts: webhook entries are routed
+by entry id (the account's user id) to a bot holding that account's token,
+campaign index, DM rate limiter and counters. Bots are created on the first
+webhook for an account and unloaded again when idle; they all share the
+process-wide Graph API connection pools.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import Config
+from database import Database
+from instagram_bot import InstagramBot
+
+
+class AccountEntry:
+    """A loaded bot plus its routing counters"""
+
+    __slots__ = ('bot', 'pinned', 'loaded_at', 'last_used', 'comments_received', 'comments_handled')
+
+    def __init__(self, bot: InstagramBot, pinned: bool = False):
+        self.bot = bot
+        self.pinned = pinned
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.comments_received = 0
+        self.comments_handled = 0
+
+    def stats(self) -> Dict:
+        return {
+            'account_id': self.bot.user_id,
+            'logged_in': self.bot.logged_in,
+            'pinned': self.pinned,
+            'loaded_at': self.loaded_at,
+            'idle_seconds': round(time.monotonic() - self.last_used, 1),
+            'comments_received': self.comments_received,
+            'comments_handled': self.comments_handled
+        }
+
+
+class AccountRegistry:
+    """Lazily loaded, idle-evicted bots keyed by Instagram user id (one registry per worker)"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._entries: 'OrderedDict[str, AccountEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._failed_at: Dict[str, float] = {}
+
+    # Lookup
+
+    def get(self, account_id: str) -> Optional[InstagramBot]:
+        """Return the logged-in bot for an account, loading it on first use"""
+        account_id = str(account_id)
+        self.evict_idle()
+
+        entry = self._touch(account_id)
+        if entry:
+            return entry.bot
+
+        with self._load_lock(account_id):
+            # Another thread may have finished loading while we waited
+            entry = self._touch(account_id)
+            if entry:
+                return entry.bot
+
+            failed_at = self._failed_at.get(account_id)
+            if failed_at and time.monotonic() - failed_at < Config.ACCOUNT_RETRY_SECONDS:
+                return None
+
+            bot = self._load(account_id)
+            if bot is None:
+                self._failed_at[account_id] = time.monotonic()
+                return None
+
+            self._failed_at.pop(account_id, None)
+            self._add(AccountEntry(bot))
+            return bot
+
+    def _touch(self, account_id: str) -> Optional[AccountEntry]:
+        with self._lock:
+            entry = self._entries.get(account_id)
+            if entry is None or not entry.bot.logged_in:
+                return None
+            if not entry.pinned and time.time() - entry.loaded_at > Config.TOKEN_REFRESH_INTERVAL_SECONDS:
+                # Reload so the bot picks up the token refreshed by the leader worker
+                return None
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(account_id)
+            return entry
+
+    def _load_lock(self, account_id: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(account_id, threading.Lock())
+
+    def _load(self, account_id: str) -> Optional[InstagramBot]:
+        """Create and log in a bot for a stored account (or the OAuth-connected one)"""
+        account = Database().get_account(account_id)
+        if account and not account['active']:
+            self.logger.info(f"⏭️ Account {account_id} is inactive, ignoring its webhooks")
+            return None
+
+        if account_id == str(Config.INSTAGRAM_USER_ID or ''):
+            # The OAuth-connected account keeps using the token from the runtime config
+            bot = InstagramBot()
+        elif account and account['access_token']:
+            monitor_all = account['monitor_all_posts']
+            bot = InstagramBot(
+                access_token=account['access_token'],
+                user_id=account_id,
+                monitor_all_posts=None if monitor_all is None else bool(monitor_all)
+            )
+        else:
+            self.logger.warning(f"⚠️ Webhook for unknown account {account_id}")
+            return None
+
+        try:
+            bot.login()
+        except Exception as e:
+            self.logger.error(f"❌ Failed to load account {account_id}: {e}")
+            return None
+
+        self.logger.info(f"👤 Loaded bot for account {account_id}")
+        return bot
+
+    # Registration and eviction
+
+    def register(self, bot: InstagramBot, pinned: bool = True):
+        """Add an already logged-in bot (the primary account's bot is pinned and never evicted)"""
+        if not bot.user_id:
+            return
+        self._failed_at.pop(bot.user_id, None)
+        self._add(AccountEntry(bot, pinned=pinned))
+
+    def _add(self, entry: AccountEntry):
+        with self._lock:
+            previous = self._entries.get(entry.bot.user_id)
+            if previous:
+                entry.comments_received = previous.comments_received
+                entry.comments_handled = previous.comments_handled
+            self._entries[entry.bot.user_id] = entry
+            self._entries.move_to_end(entry.bot.user_id)
+            self._trim()
+
+    def _trim(self):
+        """Unload least recently used bots beyond MAX_LOADED_ACCOUNTS (caller holds the lock)"""
+        unpinned = [account_id for account_id, entry in self._entries.items() if not entry.pinned]
+        while unpinned and len(self._entries) > Config.MAX_LOADED_ACCOUNTS:
+            account_id = unpinned.pop(0)
+            del self._entries[account_id]
+            self.logger.info(f"♻️ Unloaded account {account_id} (max {Config.MAX_LOADED_ACCOUNTS} loaded)")
+
+    def evict_idle(self) -> int:
+        """Unload bots that have not received a webhook for ACCOUNT_IDLE_EVICT_SECONDS"""
+        cutoff = time.monotonic() - Config.ACCOUNT_IDLE_EVICT_SECONDS
+        with self._lock:
+            idle = [account_id for account_id, entry in self._entries.items()
+                    if not entry.pinned and entry.last_used < cutoff]
+            for account_id in idle:
+                del self._entries[account_id]
+        for account_id in idle:
+            self.logger.info(f"♻️ Unloaded idle account {account_id}")
+        return len(idle)
+
+    def invalidate(self, account_id: str):
+        """Drop an account's bot so its next webhook reloads the stored token and settings"""
+        account_id = str(account_id)
+        with self._lock:
+            self._entries.pop(account_id, None)
+        self._failed_at.pop(account_id, None)
+
+    def reset(self):
+        """Forget all bots and locks (e.g. after fork)"""
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._failed_at = {}
+
+    # Counters
+
+    def record_comment(self, account_id: str, handled: bool):
+        with self._lock:
+            entry = self._entries.get(str(account_id))
+            if entry:
+                entry.comments_received += 1
+                entry.comments_handled += int(handled)
+
+    def loaded(self) -> List[InstagramBot]:
+        with self._lock:
+            return [entry.bot for entry in self._entries.values()]
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [entry.stats() for entry in self._entries.values()]
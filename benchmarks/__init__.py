@@ -0,0 +1,7 @@
+"""
+Benchmarks for the webhook server
+Each module is a runnable scenario (python -m benchmarks.<name> --help) that
+works offline against graph_stub.py, writes its database and runtime config
+to a scratch directory and appends its results to benchmarks/results/ so
+runs can be compared between versions with --compare.
+"""
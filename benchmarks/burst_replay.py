@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Viral-burst replay with SLO checks
+Replays a burst of comment deliveries on one post against a threaded server
+(open loop: deliveries are sent on schedule whether or not earlier ones were
+acknowledged) and checks the service level objectives:
+
+  * webhook acknowledged within --slo-ack-p99-ms at p99 (measured from the
+    scheduled send time, so client-side queueing counts against the server)
+  * no comment DMed twice, even when it is delivered more than once
+  * the hourly and daily DM budgets are never exceeded
+  * no delivery answered with an error
+
+    python -m benchmarks.burst_replay --comments 20000 --duration 300 --speed 5
+    python -m benchmarks.burst_replay --recording burst.jsonl.gz
+
+A recording is JSON lines of {"at": seconds, "body": webhook_body} (gzip if
+the name ends in .gz); webhook journal segments can be replayed as they are.
+Exits 1 if any SLO fails.
+"""
+
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from benchmarks.common import (CommentStream, add_common_arguments, finish, latency_summary, load_web_app,
+                               prepare_environment, server_sender, webhook_body)
+from graph_stub import StubServer
+
+BENCHMARK = 'burst_replay'
+
+HIGHER_IS_BETTER = ('achieved_per_second',)
+
+CURVES = ('spike', 'ramp', 'flat')
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recording', help='Replay a recorded burst instead of generating one')
+    parser.add_argument('--comments', type=int, default=5000, help='Distinct comments in a generated burst')
+    parser.add_argument('--duration', type=float, default=120, help='Length of a generated burst in seconds')
+    parser.add_argument('--curve', choices=CURVES, default='spike',
+                        help='Arrival curve: spike (fast rise, long tail), ramp (steady rise) or flat')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help='Share of comments delivered twice')
+    parser.add_argument('--repeat-commenter-rate', type=float, default=0.2,
+                        help='Share of comments from someone who already commented')
+    parser.add_argument('--keyword-rate', type=float, default=0.6, help='Share of comments containing a keyword')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay this many times faster than recorded')
+    parser.add_argument('--concurrency', type=int, default=64, help='Maximum deliveries in flight')
+    parser.add_argument('--stub-profile', default='realistic', help='graph_stub profile')
+    parser.add_argument('--max-dms-per-hour', type=int, default=None, help='Override MAX_DMS_PER_HOUR')
+    parser.add_argument('--max-dms-per-day', type=int, default=None, help='Override MAX_DMS_PER_DAY')
+    parser.add_argument('--slo-ack-p99-ms', type=float, default=200.0)
+    parser.add_argument('--slo-error-rate', type=float, default=0.0, help='Largest acceptable share of non-200 acks')
+    parser.add_argument('--report', help='Also write the pass/fail report to this JSON file')
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    # The run changes into a scratch directory, so resolve user paths first
+    for name in ('recording', 'report'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    return args
+
+
+# Burst profiles
+
+def arrival_weights(curve: str, seconds: int) -> List[float]:
+    """Relative comment rate for each second of the burst"""
+    if curve == 'flat':
+        return [1.0] * seconds
+    if curve == 'ramp':
+        return [second + 1.0 for second in range(seconds)]
+    # spike: gamma-shaped, peaking at 10% of the burst and decaying over the rest
+    peak = max(1.0, seconds * 0.1)
+    return [((second + 0.5) / peak) * math.exp(1 - (second + 0.5) / peak) for second in range(seconds)]
+
+
+def generate_burst(args, keywords, media_id: str) -> List[Tuple[float, Dict]]:
+    """(offset_seconds, webhook body) pairs; duplicates are redelivered 1-30 s after the original"""
+    rng = random.Random(args.seed)
+    seconds = max(1, int(args.duration))
+    weights = arrival_weights(args.curve, seconds)
+    stream = CommentStream(keywords, [media_id], args.keyword_rate, duplicate_rate=0.0,
+                           repeat_commenter_rate=args.repeat_commenter_rate, seed=args.seed)
+
+    events = []
+    for second in rng.choices(range(seconds), weights=weights, k=args.comments):
+        at = second + rng.random()
+        comment = stream.next(media_id)
+        events.append((at, webhook_body([comment])))
+        if rng.random() < args.duplicate_rate:
+            events.append((at + rng.uniform(1, 30), webhook_body([comment])))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def load_recording(path: str) -> List[Tuple[float, Dict]]:
+    """A recording or a webhook journal segment (whose bodies are the raw request text)"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        records = [record for record in map(json.loads, f) if record]
+    events = [(float(record['at']), json.loads(record['body']) if isinstance(record['body'], str) else record['body'])
+              for record in records]
+    events.sort(key=lambda event: event[0])
+    start = events[0][0] if events else 0.0
+    return [(at - start, body) for at, body in events]
+
+
+def peak_rate(events: List[Tuple[float, Dict]]) -> int:
+    per_second = Counter(int(at) for at, _ in events)
+    return max(per_second.values()) if per_second else 0
+
+
+# Replay
+
+def replay(events: List[Tuple[float, Dict]], send, speed: float, concurrency: int) -> Dict:
+    """Send each delivery at its scheduled time; latency counts from the schedule, not the actual send"""
+    results = []
+    results_lock = threading.Lock()
+
+    def deliver(scheduled: float, body: Dict):
+        try:
+            status = send(body)
+        except Exception:
+            status = 0
+        finished = time.perf_counter()
+        with results_lock:
+            results.append((finished - scheduled, status))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for at, body in events:
+            scheduled = started + at / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(deliver, scheduled, body)
+    elapsed = time.perf_counter() - started
+
+    return {'latencies': [latency for latency, _ in results], 'statuses': [status for _, status in results],
+            'elapsed': elapsed}
+
+
+# SLO checks
+
+def max_in_window(timestamps: List[float], window: float) -> int:
+    """Largest number of timestamps inside any sliding window of the given length"""
+    times = deque()
+    best = 0
+    for at in sorted(timestamps):
+        times.append(at)
+        while times[0] <= at - window:
+            times.popleft()
+        best = max(best, len(times))
+    return best
+
+
+def duplicate_dms(db_file: str, messages: List[Dict]) -> int:
+    """
+    DMs beyond one per comment: the stub's messages per recipient compared with
+    the comments recorded as DMed for that user (one row per comment id)
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        recorded = Counter(dict(conn.execute(
+            "SELECT user_id, COUNT(*) FROM processed_comments WHERE action_taken LIKE '%dm_sent%' GROUP BY user_id"
+        ).fetchall()))
+    finally:
+        conn.close()
+    sent = Counter(message['recipient_id'] for message in messages)
+    return sum(max(0, count - recorded.get(recipient, 0)) for recipient, count in sent.items())
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    with StubServer(args.stub_profile, seed=args.seed, media_count=1) as stub:
+        workdir = prepare_environment(args.workdir, graph_base_url=stub.base_url)
+        print(f"🧪 Graph API stub at {stub.base_url} (profile {args.stub_profile}); scratch dir {workdir}")
+
+        media_id = next(iter(stub.state.media))
+        overrides = {}
+        if args.max_dms_per_hour is not None:
+            overrides['MAX_DMS_PER_HOUR'] = args.max_dms_per_hour
+        if args.max_dms_per_day is not None:
+            overrides['MAX_DMS_PER_DAY'] = args.max_dms_per_day
+        web_app = load_web_app(args.log_level, MONITOR_ALL_POSTS=True, **overrides)
+        from config import Config
+
+        events = load_recording(args.recording) if args.recording else generate_burst(args, Config.KEYWORDS, media_id)
+        span = events[-1][0] if events else 0.0
+        print(f"🌊 Replaying {len(events)} deliveries over {span:.0f}s at {args.speed}x "
+              f"(peak {peak_rate(events)}/s recorded, {peak_rate(events) * args.speed:.0f}/s replayed)")
+
+        send, server = server_sender(web_app)
+        try:
+            run = replay(events, send, args.speed, args.concurrency)
+        finally:
+            server.shutdown()
+
+        with stub.state.lock:
+            messages = list(stub.state.messages)
+        replies = len(stub.state.replies)
+        duplicated = duplicate_dms(Config.DATABASE_FILE, messages)
+        max_hour, max_day = Config.MAX_DMS_PER_HOUR, Config.MAX_DMS_PER_DAY
+
+    message_times = [message['at'] for message in messages]
+    dms_in_hour = max_in_window(message_times, 3600)
+    dms_in_day = max_in_window(message_times, 86400)
+    errors = sum(1 for status in run['statuses'] if status != 200)
+    latency = latency_summary(run['latencies'])
+
+    slos = {
+        f"ack p99 <= {args.slo_ack_p99_ms:g} ms": latency['p99_ms'] <= args.slo_ack_p99_ms,
+        'no duplicate DMs': duplicated == 0,
+        f"DMs per hour <= {max_hour}": dms_in_hour <= max_hour,
+        f"DMs per day <= {max_day}": dms_in_day <= max_day,
+        f"error rate <= {args.slo_error_rate:g}": errors <= args.slo_error_rate * len(events),
+    }
+
+    metrics = {
+        'deliveries': len(events),
+        'elapsed_seconds': round(run['elapsed'], 3),
+        'achieved_per_second': round(len(events) / run['elapsed'], 1) if run['elapsed'] else 0.0,
+        'peak_per_second': round(peak_rate(events) * args.speed, 1),
+        **{f'ack_{name}': value for name, value in latency.items()},
+        'errors': errors,
+        'dms_sent': len(messages),
+        'replies_sent': replies,
+        'duplicate_dms': duplicated,
+        'max_dms_in_hour': dms_in_hour,
+        'max_dms_in_day': dms_in_day,
+        'slos_failed': sum(1 for passed in slos.values() if not passed)
+    }
+
+    print("\n🎯 SLOs")
+    for name, passed in slos.items():
+        print(f"  {'✅ PASS' if passed else '❌ FAIL'}  {name}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'slos': slos, 'metrics': metrics, 'passed': all(slos.values())}, f, indent=2)
+
+    params = {key: getattr(args, key) for key in ('recording', 'comments', 'duration', 'curve', 'duplicate_rate',
+                                                   'repeat_commenter_rate', 'keyword_rate', 'speed', 'concurrency',
+                                                   'stub_profile', 'max_dms_per_hour', 'max_dms_per_day', 'seed')}
+    regressed = finish(BENCHMARK, args, params, metrics, HIGHER_IS_BETTER)
+    return 1 if metrics['slos_failed'] or regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Shared benchmark plumbing
+Scratch environment setup (database, status store and runtime config outside
+the repo, Graph API pointed at the stub), synthetic webhook payloads, latency
+percentiles and the results log used for --compare.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import requests
+from werkzeug.serving import make_server
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# App modules are imported from the repository root (python -m benchmarks.<name> from anywhere)
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+# Account the stub answers for (graph_stub.STUB_USER_ID)
+BENCH_USER_ID = '17841400000000000'
+BENCH_ACCESS_TOKEN = 'bench-token'
+
+# Comments that match no keyword: plain, emoji-only, mixed case and long ones
+MISS_TEXTS = [
+    'love this 😍', 'so cute!!', 'Where was this taken?', '🔥🔥🔥', 'tagging @friend',
+    'Great content as always', 'first', 'NEED THIS IN MY LIFE', 'que bonito 💕', 'wow',
+    'This reminds me of my trip last summer, we walked for hours and the view at the end was '
+    'absolutely worth every step, thank you for sharing',
+]
+
+
+# Environment
+
+def prepare_environment(workdir: Optional[str] = None, graph_base_url: Optional[str] = None) -> str:
+    """
+    Point the app at a scratch directory (and optionally the Graph API stub)
+
+    Must run before config/web_app are imported: both read the environment
+    and the working directory at import time.
+    """
+    if 'config' in sys.modules:
+        raise RuntimeError('prepare_environment() must be called before the app modules are imported')
+
+    workdir = workdir or tempfile.mkdtemp(prefix='igbot-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    os.environ['DATABASE_FILE'] = os.path.join(workdir, 'instagram_bot.db')
+    os.environ['STATUS_DATABASE_FILE'] = os.path.join(workdir, 'runtime_status.db')
+    os.environ['PROFILE_DIR'] = os.path.join(workdir, 'profiles')
+    os.environ['WEB_APP_DEFER_STARTUP'] = '1'
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    if graph_base_url:
+        os.environ['GRAPH_API_BASE_URL'] = graph_base_url
+
+    os.chdir(workdir)  # runtime_config.json and instagram_bot.log are relative paths
+    return workdir
+
+
+def load_web_app(log_level: str = 'INFO', **settings):
+    """Import the app, connect it to the stub account and activate webhook processing"""
+    import web_app
+    from config import Config
+
+    configure_logging(log_level)
+    Config.update(
+        INSTAGRAM_ACCESS_TOKEN=BENCH_ACCESS_TOKEN,
+        INSTAGRAM_USER_ID=BENCH_USER_ID,
+        **settings
+    )
+    web_app.bot_status['webhook_active'] = True
+    return web_app
+
+
+def server_sender(web_app):
+    """Serve the app on a threaded HTTP server; returns (send, server) with one session per client thread"""
+    server = make_server('127.0.0.1', 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/webhook/instagram'
+    local = threading.local()
+
+    def send(body):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session.post(url, json=body).status_code
+    return send, server
+
+
+def configure_logging(level: str):
+    """Keep the app's file log (as deployed) but drop console output"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if type(handler) is logging.StreamHandler:
+            root.removeHandler(handler)
+    root.setLevel(getattr(logging, level.upper()))
+
+
+# Synthetic traffic
+
+class CommentStream:
+    """
+    Synthetic comment webhook values
+
+    keyword_rate is the share of new comments containing a keyword,
+    duplicate_rate the share of deliveries that repeat an earlier comment
+    (webhook retries), and repeat_commenter_rate the share of comments written
+    by someone who already commented.
+    """
+
+    def __init__(self, keywords: Sequence[str], posts: Sequence[str], keyword_rate: float = 0.3,
+                 duplicate_rate: float = 0.0, repeat_commenter_rate: float = 0.1, seed: int = 0):
+        self.keywords = list(keywords)
+        self.posts = list(posts)
+        self.keyword_rate = keyword_rate
+        self.duplicate_rate = duplicate_rate
+        self.repeat_commenter_rate = repeat_commenter_rate
+        self.random = random.Random(seed)
+        self.sent: List[Dict] = []
+        self.commenters: List[str] = []
+        self._next_id = 0
+
+    def next(self, media_id: Optional[str] = None) -> Dict:
+        if self.sent and self.random.random() < self.duplicate_rate:
+            return self.random.choice(self.sent)
+
+        self._next_id += 1
+        if self.commenters and self.random.random() < self.repeat_commenter_rate:
+            author = self.random.choice(self.commenters)
+        else:
+            author = str(7000000000 + self._next_id)
+            self.commenters.append(author)
+
+        if self.keywords and self.random.random() < self.keyword_rate:
+            keyword = self.random.choice(self.keywords)
+            text = self.random.choice([keyword, f'{keyword} please', f'Can you {keyword.upper()}? 🙏',
+                                       f'omg {keyword} {keyword}'])
+        else:
+            text = self.random.choice(MISS_TEXTS)
+
+        comment = {
+            'id': f'bench_{self._next_id}',
+            'text': text,
+            'from': {'id': author, 'username': f'user_{author[-6:]}'},
+            'media': {'id': media_id or self.random.choice(self.posts)},
+            'verb': 'add'
+        }
+        self.sent.append(comment)
+        return comment
+
+
+def webhook_body(comments: Iterable[Dict], account_id: str = BENCH_USER_ID) -> Dict:
+    """Instagram webhook delivery carrying the given comment values"""
+    return {
+        'object': 'instagram',
+        'entry': [{
+            'id': account_id,
+            'time': int(time.time()),
+            'changes': [{'field': 'comments', 'value': comment} for comment in comments]
+        }]
+    }
+
+
+# Measurements
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(seconds: Iterable[float]) -> Dict[str, float]:
+    values = sorted(seconds)
+    if not values:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0, 'mean_ms': 0.0}
+    return {
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+        'mean_ms': round(sum(values) / len(values) * 1000, 2)
+    }
+
+
+# Results log
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--label', help='Name this run (e.g. a branch or change) for later --compare')
+    parser.add_argument('--compare', metavar='REF',
+                        help="Compare with an earlier run: 'last', a --label or a git commit prefix")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Relative change treated as a regression (default 0.10)')
+    parser.add_argument('--no-save', action='store_true', help='Do not append this run to the results log')
+    parser.add_argument('--workdir', help='Scratch directory (default: a new temporary directory)')
+    parser.add_argument('--log-level', default='INFO', help="App log level for the file log (default INFO)")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+        return f'{commit}-dirty' if commit and dirty else commit or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def results_file(benchmark: str) -> Path:
+    return RESULTS_DIR / f'{benchmark}.jsonl'
+
+
+def load_results(benchmark: str) -> List[Dict]:
+    path = results_file(benchmark)
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_result(benchmark: str, params: Dict, metrics: Dict, label: Optional[str] = None) -> Dict:
+    record = {
+        'benchmark': benchmark,
+        'label': label,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': params,
+        'metrics': metrics
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    with open(results_file(benchmark), 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+    return record
+
+
+def find_baseline(benchmark: str, ref: str, params: Dict) -> Optional[Dict]:
+    """Most recent stored run matching ref; 'last' prefers a run with the same parameters"""
+    runs = load_results(benchmark)
+    if ref == 'last':
+        same_params = [run for run in runs if run['params'] == params]
+        runs = same_params or runs
+        return runs[-1] if runs else None
+    for run in reversed(runs):
+        if run.get('label') == ref or (run.get('git_commit') or '').startswith(ref):
+            return run
+    return None
+
+
+def compare_metrics(current: Dict, baseline: Dict, higher_is_better: Iterable[str], tolerance: float) -> List[Dict]:
+    """Relative change of each numeric metric, flagging regressions beyond the tolerance"""
+    higher_is_better = set(higher_is_better)
+    rows = []
+    for name, value in current.items():
+        before = baseline.get(name)
+        if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or isinstance(value, bool):
+            continue
+        if before:
+            change = (value - before) / before
+        else:
+            change = 0.0 if value == before else math.copysign(math.inf, value - before)
+        worse = -change if name in higher_is_better else change
+        rows.append({'metric': name, 'baseline': before, 'current': value, 'change': change,
+                     'regression': worse > tolerance})
+    return rows
+
+
+def print_metrics(title: str, metrics: Dict):
+    print(f"\n📊 {title}")
+    width = max(len(name) for name in metrics) if metrics else 0
+    for name, value in metrics.items():
+        print(f"  {name:<{width}}  {value}")
+
+
+def finish(benchmark: str, args: argparse.Namespace, params: Dict, metrics: Dict,
+           higher_is_better: Iterable[str] = ()) -> int:
+    """Print, store and optionally compare a run; returns the process exit code"""
+    print_metrics(f'{benchmark} results', metrics)
+
+    baseline = find_baseline(benchmark, args.compare, params) if args.compare else None
+    if not args.no_save:
+        save_result(benchmark, params, metrics, args.label)
+        print(f"\n💾 Appended to {results_file(benchmark).relative_to(REPO_ROOT)}")
+
+    if not args.compare:
+        return 0
+    if baseline is None:
+        print(f"\n⚠️ No stored {benchmark} run matches '{args.compare}'")
+        return 0
+    if baseline['params'] != params:
+        print("\n⚠️ Baseline was run with different parameters; differences may not be comparable")
+
+    rows = compare_metrics(metrics, baseline['metrics'], higher_is_better, args.tolerance)
+    print(f"\n🔍 Compared with {baseline.get('label') or baseline.get('git_commit')} ({baseline['timestamp']})")
+    for row in rows:
+        flag = '❌' if row['regression'] else '  '
+        print(f"  {flag} {row['metric']:<28} {row['baseline']:>12} -> {row['current']:>12}  ({row['change']:+.1%})")
+    regressions = [row['metric'] for row in rows if row['regression']]
+    if regressions:
+        print(f"\n❌ Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    print("\n✅ No regressions")
+    return 0
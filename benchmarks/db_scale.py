@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Database queries at production volumes
+Fills processed_comments/sent_dms with a realistic dataset (millions of rows
+spread over weeks, several accounts, hot posts and repeat commenters) and
+times every Database method plus the dashboard and /api/stats routes, so
+schema and index changes can be judged on real data volumes.
+
+    python -m benchmarks.db_scale --rows 1000000
+    python -m benchmarks.db_scale --rows 10000000 --db /data/bench-10m.db --compare last
+
+Generating 10M rows takes a few minutes; --db keeps the dataset between runs
+(it is only topped up when it holds fewer than --rows comments).
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.common import (BENCH_USER_ID, MISS_TEXTS, add_common_arguments, finish, latency_summary,
+                               load_web_app, prepare_environment)
+from graph_stub import StubServer
+
+BENCHMARK = 'db_scale'
+
+# Share of processed comments per recorded action (decision_engine action_taken values)
+ACTION_MIX = (
+    ('encouraged_to_dm', 0.45),
+    ('direct_dm_sent_with_consent', 0.30),
+    ('comment_reply_fallback', 0.12),
+    ('direct_dm_sent_any_keyword', 0.08),
+    ('comment_reply_fallback_any_keyword', 0.04),
+    ('legacy_dm_sent', 0.01),
+)
+
+INSERT_BATCH = 50000
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='processed_comments rows in the dataset')
+    parser.add_argument('--days', type=float, default=90, help='Days of history the rows are spread over')
+    parser.add_argument('--accounts', type=int, default=3, help='Accounts the activity is split between')
+    parser.add_argument('--posts', type=int, default=500, help='Distinct posts commented on')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed calls per method')
+    parser.add_argument('--max-seconds', type=float, default=15.0,
+                        help='Stop repeating a method after this long (at least 3 calls are always made)')
+    parser.add_argument('--db', help='Keep the dataset in this database file and reuse it on later runs')
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.db:
+        args.db = os.path.abspath(args.db)
+    return args
+
+
+# Dataset
+
+def account_ids(count: int) -> List[str]:
+    return [BENCH_USER_ID] + [str(17841400000000001 + index) for index in range(max(0, count - 1))]
+
+
+def generate_rows(db_file: str, rows: int, days: float, accounts: List[str], posts: int, seed: int) -> Dict:
+    """
+    Append processed comments (and a sent_dms row for every DM action) until
+    the table holds `rows` comments, oldest first so row ids follow time
+    """
+    conn = sqlite3.connect(db_file)
+    existing = conn.execute('SELECT COUNT(*) FROM processed_comments').fetchone()[0]
+    missing = rows - existing
+    if missing <= 0:
+        conn.close()
+        return {'existing': existing, 'generated': 0, 'seconds': 0.0}
+
+    # Bulk load only: a crash leaves a scratch dataset to regenerate, not production data
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -200000')
+
+    rng = random.Random(seed + existing)
+    actions = [action for action, _ in ACTION_MIX]
+    weights = [weight for _, weight in ACTION_MIX]
+    # Hot posts: a few posts collect most comments
+    post_ids = [f'bench_media_{index}' for index in range(posts)]
+    post_weights = [1.0 / (index + 1) for index in range(posts)]
+    texts = ['dm me the link', 'send me info please', 'LINK 🙏', 'info?', 'Can you DM ME the details?',
+             'price please', 'interested!!', 'send link 🔥🔥'] + MISS_TEXTS
+    commenters = max(1, missing // 3)
+
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    step = (end - start).total_seconds() / missing
+
+    started = time.perf_counter()
+    generated = 0
+    while generated < missing:
+        count = min(INSERT_BATCH, missing - generated)
+        comments = []
+        dms = []
+        for index in range(generated, generated + count):
+            at = (start + timedelta(seconds=index * step)).strftime('%Y-%m-%d %H:%M:%S')
+            user_id = str(7000000000 + rng.randrange(commenters))
+            username = f'user_{user_id[-6:]}'
+            action = rng.choices(actions, weights)[0]
+            account = rng.choice(accounts)
+            text = rng.choice(texts)
+            comments.append((f'scale_{existing + index}', user_id, username, rng.choices(post_ids, post_weights)[0],
+                             text, 'link', action, account, at))
+            if 'dm_sent' in action:
+                dms.append((user_id, username, 'Here is the link you asked for: https://example.com', account, at))
+
+        conn.executemany('''
+            INSERT INTO processed_comments
+            (comment_id, user_id, username, post_id, comment_text, keyword, action_taken, account_id, processed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', comments)
+        conn.executemany('''
+            INSERT INTO sent_dms (user_id, username, message, account_id, sent_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', dms)
+        conn.commit()
+        generated += count
+        print(f"  … {existing + generated:,}/{rows:,} comments", end='\r', flush=True)
+
+    seconds = time.perf_counter() - started
+    conn.close()
+    print()
+    return {'existing': existing, 'generated': generated, 'seconds': seconds}
+
+
+def seed_small_tables(db, accounts: List[str], posts: int, count: int):
+    """Campaigns, watermarks and accounts at a realistic size, plus rows for the delete cases to remove"""
+    for index in range(min(posts, 50)):
+        media_id = f'bench_media_{index}'
+        db.save_campaign({'media_id': media_id, 'name': f'Campaign {index}', 'keywords': ['link', 'info'],
+                          'link': 'https://example.com'})
+        db.set_comment_watermark(media_id, f'scale_{index}', '2024-01-01T00:00:00+0000')
+    for user_id in accounts[1:]:
+        db.save_account({'user_id': user_id, 'username': f'account_{user_id[-4:]}', 'access_token': 'bench-token'})
+    for index in range(count):
+        db.save_campaign({'media_id': f'bench_delete_{index}', 'keywords': ['link']})
+        db.save_account({'user_id': f'bench_delete_{index}', 'access_token': 'bench-token'})
+
+
+# Measurement
+
+def time_case(call: Callable[[int], object], repeat: int, max_seconds: float) -> Dict[str, float]:
+    """One untimed call to warm the page cache, then up to `repeat` timed calls"""
+    call(-1)
+    latencies = []
+    budget_end = time.perf_counter() + max_seconds
+    for index in range(repeat):
+        started = time.perf_counter()
+        call(index)
+        latencies.append(time.perf_counter() - started)
+        if index >= 2 and time.perf_counter() > budget_end:
+            break
+    summary = latency_summary(latencies)
+    summary['calls'] = len(latencies)
+    return summary
+
+
+def build_cases(db, database_class, client, accounts: List[str],
+                rows: int) -> List[Tuple[str, Callable[[int], object]]]:
+    """(name, call) for every Database method and the routes that read the big tables"""
+    rng = random.Random(0)
+    existing_id = lambda: f'scale_{rng.randrange(rows)}'
+    last_id = db.get_last_processed_comment_row_id()
+    account = accounts[-1]
+
+    def route(path):
+        def call(_):
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f'GET {path} returned {response.status_code}')
+        return call
+
+    return [
+        ('init_database', lambda _: database_class()),
+        ('is_comment_processed_hit', lambda _: db.is_comment_processed(existing_id())),
+        ('is_comment_processed_miss', lambda i: db.is_comment_processed(f'missing_{i}')),
+        ('get_processed_comment_ids_500', lambda i: db.get_processed_comment_ids(
+            [existing_id() for _ in range(250)] + [f'missing_{i}_{n}' for n in range(250)])),
+        ('add_processed_comment', lambda i: db.add_processed_comment(
+            f'bench_add_{time.time_ns()}_{i}', 'bench_media_0', 'bench_user', '7000000001', 'dm me', 'link',
+            'direct_dm_sent_with_consent', account)),
+        ('mark_comment_processed', lambda i: db.mark_comment_processed(
+            f'bench_mark_{time.time_ns()}_{i}', '7000000001', 'bench_user', 'bench_media_0', 'link')),
+        ('log_sent_dm', lambda _: db.log_sent_dm('7000000001', 'bench_user', 'Here is the link', account)),
+        ('count_sent_dms_since_hour', lambda _: db.count_sent_dms_since(3600)),
+        ('count_sent_dms_since_day', lambda _: db.count_sent_dms_since(86400)),
+        ('count_sent_dms_since_day_account', lambda _: db.count_sent_dms_since(86400, account)),
+        ('count_sent_dms', lambda _: db.count_sent_dms()),
+        ('get_recent_processed_comments_10', lambda _: db.get_recent_processed_comments(10)),
+        ('get_recent_processed_comments_1000', lambda _: db.get_recent_processed_comments(1000)),
+        ('get_processed_comments_after', lambda _: db.get_processed_comments_after(last_id - 100)),
+        ('get_last_processed_comment_row_id', lambda _: db.get_last_processed_comment_row_id()),
+        ('count_processed_comments', lambda _: db.count_processed_comments()),
+        ('get_comment_stats', lambda _: db.get_comment_stats()),
+        ('get_comment_watermark', lambda _: db.get_comment_watermark('bench_media_0')),
+        ('set_comment_watermark', lambda i: db.set_comment_watermark(
+            'bench_media_0', f'scale_{i}', '2024-01-01T00:00:00+0000')),
+        ('get_campaigns', lambda _: db.get_campaigns()),
+        ('get_campaigns_signature', lambda _: db.get_campaigns_signature()),
+        ('save_campaign', lambda _: db.save_campaign({'media_id': 'bench_media_0', 'keywords': ['link', 'info']})),
+        ('delete_campaign', lambda i: db.delete_campaign(f'bench_delete_{i + 1}')),
+        ('get_account', lambda _: db.get_account(account)),
+        ('get_accounts', lambda _: db.get_accounts()),
+        ('save_account', lambda _: db.save_account({'user_id': account, 'access_token': 'bench-token'})),
+        ('delete_account', lambda i: db.delete_account(f'bench_delete_{i + 1}')),
+        ('route_dashboard', route('/')),
+        ('route_api_stats', route('/api/stats')),
+    ]
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    with StubServer('fast', seed=args.seed) as stub:
+        workdir = prepare_environment(args.workdir, graph_base_url=stub.base_url)
+        if args.db:
+            os.environ['DATABASE_FILE'] = args.db
+        web_app = load_web_app(args.log_level)
+        from config import Config
+        from database import Database
+
+        print(f"🧪 Dataset {Config.DATABASE_FILE}; scratch dir {workdir}")
+        db = Database()
+        accounts = account_ids(args.accounts)
+        generation = generate_rows(Config.DATABASE_FILE, args.rows, args.days, accounts, args.posts, args.seed)
+        if generation['generated']:
+            print(f"🏗️ Generated {generation['generated']:,} comments in {generation['seconds']:.1f}s")
+        else:
+            print(f"♻️ Reusing {generation['existing']:,} existing comments")
+        seed_small_tables(db, accounts, args.posts, args.repeat + 1)
+
+        client = web_app.app.test_client()
+        results = {}
+        for name, call in build_cases(db, Database, client, accounts, args.rows):
+            results[name] = time_case(call, args.repeat, args.max_seconds)
+            print(f"  ⏱️ {name:<36} p50 {results[name]['p50_ms']:>10.2f} ms   "
+                  f"p95 {results[name]['p95_ms']:>10.2f} ms   ({results[name]['calls']} calls)")
+
+        size_mb = os.path.getsize(Config.DATABASE_FILE) / 1024 / 1024
+        print(f"📦 {db.count_processed_comments():,} comments, {db.count_sent_dms():,} DMs, {size_mb:,.0f} MB")
+
+    metrics = {
+        **{f'{name}_{stat}': summary[stat] for name, summary in results.items() for stat in ('p50_ms', 'p95_ms')}
+    }
+    if generation['generated']:
+        metrics['generated_rows_per_second'] = round(generation['generated'] / generation['seconds'])
+    params = {key: getattr(args, key) for key in ('rows', 'days', 'accounts', 'posts', 'repeat', 'seed')}
+    return finish(BENCHMARK, args, params, metrics, ('generated_rows_per_second',))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
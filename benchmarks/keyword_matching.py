@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Keyword matching speed, memory and agreement
+Runs every keyword matching implementation over a synthetic comment corpus
+(multilingual, emoji, mixed case, long comments and spam) with keyword sets
+of growing size, and reports comments/second, the memory the compiled matcher
+keeps, and how often its answer agrees with the bot's configured-order
+substring check.
+
+    python -m benchmarks.keyword_matching --sizes 10,100,1000,10000
+    python -m benchmarks.keyword_matching --corpus comments.txt --matchers keyword_matcher,trie_regex
+
+--corpus reads one comment per line; --dump-corpus writes the generated one.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence
+
+from benchmarks.common import MISS_TEXTS, add_common_arguments, finish, load_web_app, prepare_environment
+
+BENCHMARK = 'keyword_matching'
+
+# Comment fragments in the languages the bot sees most, including non-Latin scripts
+LANGUAGE_TEXTS = [
+    'me encanta 😍 dónde lo compro', 'qué precio tiene?', 'quero muito isso!!', 'manda o link por favor',
+    "c'est magnifique ✨", 'wie viel kostet das?', 'कितने का है?', 'بكم هذا؟', 'これ欲しい！', 'сколько стоит?',
+    'bu ne kadar İstanbul’a kargo var mı', 'ΤΈΛΕΙΟ 🔥', 'đẹp quá', '好漂亮 💕',
+]
+
+SPAM_TEXTS = [
+    'FOLLOW ME FOR FOLLOW BACK 🔥🔥🔥', 'check my bio 💰💰💰 earn $500/day', 'www.free-followers.example',
+    '😍' * 40, 'promo promo promo promo promo promo promo promo', '@a @b @c @d @e @f @g @h @i @j @k',
+]
+
+WORDS = ['the', 'this', 'so', 'really', 'amazing', 'color', 'size', 'shipping', 'price', 'love', 'need', 'store',
+         'ordered', 'last', 'week', 'arrived', 'perfect', 'quality', 'sister', 'birthday', 'gift', 'again']
+
+# Syllables for generated keywords (product names, promo codes, campaign words)
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'sun', 'vel', 'to', 'bre', 'zen', 'qua', 'fi', 'dor', 'pix', 'ne', 'sol']
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='Comma-separated keyword set sizes')
+    parser.add_argument('--comments', type=int, default=20000, help='Comments in the generated corpus')
+    parser.add_argument('--hit-rate', type=float, default=0.3, help='Share of generated comments containing a keyword')
+    parser.add_argument('--corpus', help='Use this corpus (one comment per line) instead of generating one')
+    parser.add_argument('--dump-corpus', help='Write the generated corpus to this file and continue')
+    parser.add_argument('--matchers', help=f"Comma-separated subset of: {', '.join(MATCHERS)}")
+    parser.add_argument('--max-seconds', type=float, default=10.0,
+                        help='Stop a matcher on a keyword set after this long and rate the comments done so far')
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+    for name in ('corpus', 'dump_corpus'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    return args
+
+
+# Corpus and keyword sets
+
+def keyword_set(size: int, base: Sequence[str], seed: int) -> List[str]:
+    """The configured keywords followed by generated ones (one to three words) up to `size`"""
+    rng = random.Random(seed)
+    keywords = list(dict.fromkeys(base))[:size]
+    seen = set(keywords)
+    while len(keywords) < size:
+        words = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        keyword = ' '.join(words)
+        if rng.random() < 0.2:
+            keyword = f'{keyword}{rng.randint(10, 99)}'  # promo code style
+        if keyword not in seen:
+            seen.add(keyword)
+            keywords.append(keyword)
+    return keywords
+
+
+def random_case(rng: random.Random, text: str) -> str:
+    style = rng.random()
+    if style < 0.5:
+        return text
+    if style < 0.7:
+        return text.upper()
+    if style < 0.85:
+        return text.title()
+    return ''.join(char.upper() if rng.random() < 0.5 else char for char in text)
+
+
+def generate_corpus(count: int, keyword_sets: Sequence[Sequence[str]], hit_rate: float, seed: int) -> List[str]:
+    """
+    Short reactions, multilingual text, long stories and spam; `hit_rate` of
+    them carry a keyword in random case and position, drawn from a randomly
+    chosen set so small sets match too
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.35:
+            text = rng.choice(MISS_TEXTS)
+        elif kind < 0.6:
+            text = rng.choice(LANGUAGE_TEXTS)
+        elif kind < 0.8:
+            text = ' '.join(rng.choice(WORDS + LANGUAGE_TEXTS) for _ in range(rng.randint(40, 300)))
+        else:
+            text = ' '.join(rng.choice(SPAM_TEXTS) for _ in range(rng.randint(1, 8)))
+
+        keywords = rng.choice(keyword_sets) if keyword_sets else None
+        if keywords and rng.random() < hit_rate:
+            keyword = random_case(rng, rng.choice(keywords))
+            position = rng.randint(0, len(text))
+            text = f'{text[:position]} {keyword} {text[position:]}'.strip()
+        corpus.append(text)
+    return corpus
+
+
+def load_corpus(path: str) -> List[str]:
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+# Matchers: each factory builds from a keyword list and returns comment_text -> keyword
+
+def bot_loop(keywords: Sequence[str]) -> Callable[[str], Optional[str]]:
+    """The bot's original per-comment loop (re-lowers every keyword per comment), kept as the baseline"""
+    def match(text):
+        text = text.lower()
+        for keyword in keywords:
+            if keyword.lower() in text:
+                return keyword
+        return None
+    return match
+
+
+def keyword_matcher(keywords: Sequence[str]) -> Callable[[str], Optional[str]]:
+    """decision_engine.KeywordMatcher: configured-order check over keywords lowercased once"""
+    from decision_engine import KeywordMatcher
+    matcher = KeywordMatcher(keywords)
+    return lambda text: matcher.match(text.lower())
+
+
+def first_by_lowered(keywords: Sequence[str]) -> Dict[str, str]:
+    lowered = {}
+    for keyword in keywords:
+        lowered.setdefault(keyword.lower(), keyword)
+    return lowered
+
+
+def regex_alternation(keywords: Sequence[str]) -> Callable[[str], Optional[str]]:
+    """One case-insensitive alternation; answers with the keyword found first in the text"""
+    lowered = first_by_lowered(keywords)
+    pattern = re.compile('|'.join(map(re.escape, sorted(lowered, key=len, reverse=True))), re.IGNORECASE)
+
+    def match(text):
+        found = pattern.search(text)
+        return lowered.get(found.group(0).lower()) if found else None
+    return match
+
+
+def trie_pattern(words: Sequence[str]) -> str:
+    """Regex source for a character trie of the words (shared prefixes are tried once)"""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node: Dict) -> str:
+        end = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # Greedy optional: the longest keyword at a position wins, like the longest-first alternation
+        return f'(?:{body})?' if end else body
+
+    return build(trie)
+
+
+def trie_regex(keywords: Sequence[str]) -> Callable[[str], Optional[str]]:
+    """Trie-shaped alternation over lowercased text; answers with the keyword found first in the text"""
+    lowered = first_by_lowered(keywords)
+    pattern = re.compile(trie_pattern(list(lowered))) if lowered else None
+
+    def match(text):
+        found = pattern.search(text.lower()) if pattern else None
+        return lowered.get(found.group(0)) if found else None
+    return match
+
+
+def aho_corasick(keywords: Sequence[str]) -> Callable[[str], Optional[str]]:
+    """Pure-Python Aho-Corasick automaton; one pass per comment, configured-order answer"""
+    goto: List[Dict[str, int]] = [{}]
+    best: List[int] = [len(keywords)]  # smallest configured index ending at each state
+    for index, keyword in enumerate(keywords):
+        state = 0
+        for char in keyword.lower():
+            if char not in goto[state]:
+                goto.append({})
+                best.append(len(keywords))
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        best[state] = min(best[state], index)
+
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, child in goto[state].items():
+            queue.append(child)
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[child] = goto[fallback].get(char, 0) if goto[fallback].get(char) != child else 0
+            best[child] = min(best[child], best[fail[child]])
+
+    missing = len(keywords)
+
+    def match(text):
+        state = 0
+        found = missing
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if best[state] < found:
+                found = best[state]
+        return keywords[found] if found < missing else None
+    return match
+
+
+MATCHERS = {
+    'bot_loop': bot_loop,
+    'keyword_matcher': keyword_matcher,
+    'regex_alternation': regex_alternation,
+    'trie_regex': trie_regex,
+    'aho_corasick': aho_corasick,
+}
+
+
+# Measurement
+
+def build_matcher(factory, keywords: Sequence[str]):
+    """Build under tracemalloc: (matcher, build seconds, bytes still held after the build)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    matcher = factory(keywords)
+    seconds = time.perf_counter() - started
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return matcher, seconds, retained
+
+
+def run_matcher(matcher: Callable[[str], object], corpus: Sequence[str], max_seconds: float):
+    """Answers for as much of the corpus as fits in max_seconds (checked every 100 comments)"""
+    answers = []
+    started = time.perf_counter()
+    for start in range(0, len(corpus), 100):
+        answers.extend(map(matcher, corpus[start:start + 100]))
+        if time.perf_counter() - started > max_seconds:
+            break
+    return answers, time.perf_counter() - started
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    names = args.matchers.split(',') if args.matchers else list(MATCHERS)
+    unknown = [name for name in names if name not in MATCHERS]
+    if unknown:
+        print(f"❌ Unknown matchers: {', '.join(unknown)}")
+        return 2
+
+    prepare_environment(args.workdir)
+    load_web_app(args.log_level)
+    from config import Config
+    from decision_engine import KeywordMatcher
+
+    base = Config.CONSENT_KEYWORDS + Config.INTEREST_KEYWORDS
+    keyword_sets = {size: keyword_set(size, base, args.seed) for size in sizes}
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = generate_corpus(args.comments, list(keyword_sets.values()), args.hit_rate, args.seed)
+        if args.dump_corpus:
+            with open(args.dump_corpus, 'w', encoding='utf-8') as f:
+                f.writelines(text.replace('\n', ' ') + '\n' for text in corpus)
+    print(f"📚 {len(corpus)} comments, {sum(map(len, corpus)) / max(1, len(corpus)):.0f} characters on average")
+
+    metrics = {}
+    higher_is_better = []
+    for size in sizes:
+        keywords = keyword_sets[size]
+        reference = KeywordMatcher(keywords)
+        expected = [reference.match(text.lower()) for text in corpus]
+        hits = sum(1 for answer in expected if answer)
+        print(f"\n🔑 {size} keywords ({hits / max(1, len(corpus)):.0%} of comments match)")
+
+        for name in names:
+            matcher, build_seconds, retained = build_matcher(MATCHERS[name], keywords)
+            answers, seconds = run_matcher(matcher, corpus, args.max_seconds)
+            agreeing = sum(1 for answer, want in zip(answers, expected) if answer == want)
+
+            rate = len(answers) / seconds if seconds else 0.0
+            agreement = agreeing / len(answers) if answers else 0.0
+            print(f"  {name:<18} {rate:>12,.0f} comments/s   build {build_seconds * 1000:>9.1f} ms   "
+                  f"{retained / 1024:>9,.0f} KB   agreement {agreement:.2%}"
+                  f"{'' if len(answers) == len(corpus) else f'   ({len(answers)} comments in the time limit)'}")
+
+            prefix = f'{name}_{size}'
+            metrics[f'{prefix}_comments_per_second'] = round(rate, 1)
+            metrics[f'{prefix}_build_ms'] = round(build_seconds * 1000, 2)
+            metrics[f'{prefix}_memory_kb'] = round(retained / 1024, 1)
+            metrics[f'{prefix}_agreement'] = round(agreement, 4)
+            higher_is_better += [f'{prefix}_comments_per_second', f'{prefix}_agreement']
+
+    params = {key: getattr(args, key) for key in ('sizes', 'comments', 'hit_rate', 'corpus', 'seed')}
+    params['matchers'] = names
+    return finish(BENCHMARK, args, params, metrics, higher_is_better)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
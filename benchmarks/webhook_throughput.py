@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+End-to-end webhook throughput
+Drives POST /webhook/instagram with synthetic comment deliveries against the
+Graph API stub and reports comments/second and delivery latency percentiles.
+
+    python -m benchmarks.webhook_throughput --comments 2000 --keyword-rate 0.3
+    python -m benchmarks.webhook_throughput --mode server --concurrency 16 --compare last
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from benchmarks.common import (CommentStream, add_common_arguments, finish, latency_summary, load_web_app,
+                               prepare_environment, server_sender, webhook_body)
+from graph_stub import StubServer
+
+BENCHMARK = 'webhook_throughput'
+
+HIGHER_IS_BETTER = ('comments_per_second', 'deliveries_per_second')
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=1000, help='Comment deliveries to send')
+    parser.add_argument('--batch', type=int, default=1, help='Comments per webhook delivery')
+    parser.add_argument('--keyword-rate', type=float, default=0.3, help='Share of comments containing a keyword')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help='Share of repeated deliveries')
+    parser.add_argument('--posts', type=int, default=10, help='Distinct posts commented on')
+    parser.add_argument('--monitored-share', type=float, default=1.0,
+                        help='Share of posts that are monitored (1.0 = MONITOR_ALL_POSTS)')
+    parser.add_argument('--mode', choices=('test-client', 'server'), default='test-client',
+                        help='Flask test client in this thread, or a threaded HTTP server with concurrent clients')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads in server mode')
+    parser.add_argument('--stub-profile', default='fast', help='graph_stub profile (fast, realistic, degraded, ...)')
+    parser.add_argument('--warmup', type=int, default=50, help='Deliveries sent before measuring')
+    add_common_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def test_client_sender(web_app) -> Callable[[Dict], int]:
+    client = web_app.app.test_client()
+    return lambda body: client.post('/webhook/instagram', json=body).status_code
+
+
+def run_deliveries(send: Callable[[Dict], int], bodies: List[Dict], concurrency: int) -> Dict:
+    """Send every body, timing each delivery; returns latencies, statuses and wall time"""
+    latencies = []
+    statuses = []
+
+    def deliver(body):
+        started = time.perf_counter()
+        status = send(body)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        results = [deliver(body) for body in bodies]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(deliver, bodies))
+    elapsed = time.perf_counter() - started
+
+    for latency, status in results:
+        latencies.append(latency)
+        statuses.append(status)
+    return {'latencies': latencies, 'statuses': statuses, 'elapsed': elapsed}
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    with StubServer(args.stub_profile, seed=args.seed, media_count=args.posts) as stub:
+        workdir = prepare_environment(args.workdir, graph_base_url=stub.base_url)
+        print(f"🧪 Graph API stub at {stub.base_url} (profile {args.stub_profile}); scratch dir {workdir}")
+
+        posts = list(stub.state.media)
+        monitored = posts[:max(1, round(len(posts) * args.monitored_share))]
+        web_app = load_web_app(
+            args.log_level,
+            MONITOR_ALL_POSTS=args.monitored_share >= 1.0,
+            MONITORED_POST_IDS=[] if args.monitored_share >= 1.0 else monitored,
+            MAX_DMS_PER_HOUR=10 ** 9,
+            MAX_DMS_PER_DAY=10 ** 9
+        )
+        from config import Config
+        from database import Database
+
+        stream = CommentStream(Config.KEYWORDS, posts, args.keyword_rate, args.duplicate_rate, seed=args.seed)
+        warmup_bodies = [webhook_body([stream.next() for _ in range(args.batch)]) for _ in range(args.warmup)]
+        bodies = [webhook_body([stream.next() for _ in range(args.batch)])
+                  for _ in range(max(1, args.comments // args.batch))]
+
+        if args.mode == 'server':
+            send, server = server_sender(web_app)
+            concurrency = args.concurrency
+        else:
+            server = None
+            send = test_client_sender(web_app)
+            concurrency = 1
+
+        try:
+            run_deliveries(send, warmup_bodies, concurrency)
+            stub_before = stub.state.stats()
+            processed_before = Database().count_processed_comments()
+
+            run = run_deliveries(send, bodies, concurrency)
+
+            stub_after = stub.state.stats()
+            processed = Database().count_processed_comments() - processed_before
+        finally:
+            if server:
+                server.shutdown()
+
+    comments = len(bodies) * args.batch
+    errors = sum(1 for status in run['statuses'] if status != 200)
+    metrics = {
+        'comments': comments,
+        'deliveries': len(bodies),
+        'elapsed_seconds': round(run['elapsed'], 3),
+        'comments_per_second': round(comments / run['elapsed'], 1),
+        'deliveries_per_second': round(len(bodies) / run['elapsed'], 1),
+        **latency_summary(run['latencies']),
+        'errors': errors,
+        'comments_acted_on': processed,
+        'dms_sent': stub_after['messages_sent'] - stub_before['messages_sent'],
+        'replies_sent': stub_after['replies_sent'] - stub_before['replies_sent'],
+        'graph_calls': sum(stub_after['calls'].values()) - sum(stub_before['calls'].values())
+    }
+    params = {key: getattr(args, key) for key in ('comments', 'batch', 'keyword_rate', 'duplicate_rate', 'posts',
+                                                   'monitored_share', 'mode', 'concurrency', 'stub_profile',
+                                                   'log_level', 'seed')}
+    if args.mode != 'server':
+        params.pop('concurrency')
+    return finish(BENCHMARK, args, params, metrics, HIGHER_IS_BETTER)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Per-post campaign rules
+Each campaign overrides keywords, link, templates and strategy for one post.
+Campaigns are indexed by media id with their matchers compiled on load, so
+finding the rules for a comment is a dict lookup however many are active.
+"""
+
+import logging
+import time
+from typing import Dict, Optional
+
+import metrics
+from decision_engine import DecisionConfig, KeywordMatcher
+from message_templates import DM_PLACEHOLDERS, REPLY_PLACEHOLDERS, compile_template, validate_template
+
+VALID_STRATEGIES = ('consent_required', 'any_keyword')
+
+REPLY_FIELDS = ('reply_consent', 'reply_interest', 'reply_encouragement')
+
+# How often workers check the campaigns table for changes
+CAMPAIGN_REFRESH_SECONDS = 5
+
+
+class Campaign:
+    """Compiled overrides for one post"""
+
+    def __init__(self, row: Dict):
+        self.media_id = row['media_id']
+        self.name = row.get('name') or self.media_id
+        self.overrides = {}
+
+        if row.get('keywords'):
+            self.overrides['keyword_matcher'] = KeywordMatcher(row['keywords'])
+        if row.get('consent_keywords'):
+            self.overrides['consent_matcher'] = KeywordMatcher(row['consent_keywords'])
+        if row.get('strategy'):
+            self.overrides['strategy'] = row['strategy']
+        if row.get('link'):
+            self.overrides['link'] = row['link']
+        if row.get('dm_message'):
+            self.overrides['dm_templates'] = (compile_template(row['dm_message'], DM_PLACEHOLDERS),)
+        for field in REPLY_FIELDS:
+            if row.get(field):
+                self.overrides[field] = compile_template(row[field], REPLY_PLACEHOLDERS)
+
+    def apply(self, base: DecisionConfig) -> DecisionConfig:
+        """Layer this campaign's overrides on top of the global settings"""
+        return base._replace(**self.overrides) if self.overrides else base
+
+
+class CampaignIndex:
+    """Hash index of active campaigns keyed by media id"""
+
+    def __init__(self, db):
+        self.db = db
+        self.campaigns: Dict[str, Campaign] = {}
+        self.logger = logging.getLogger(__name__)
+
+        self._signature = None
+        self._checked_at = 0.0
+        self._base = None
+        self._merged: Dict[str, DecisionConfig] = {}
+
+    def refresh(self, force: bool = False):
+        """Reload campaigns if the table changed (checked at most every few seconds)"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < CAMPAIGN_REFRESH_SECONDS:
+            return
+        self._checked_at = now
+
+        signature = self.db.get_campaigns_signature()
+        if not force and signature == self._signature:
+            return
+
+        campaigns = {}
+        for row in self.db.get_campaigns(active_only=True):
+            try:
+                campaigns[row['media_id']] = Campaign(row)
+            except Exception as e:
+                self.logger.error(f"❌ Skipping invalid campaign for post {row.get('media_id')}: {e}")
+
+        self.campaigns = campaigns
+        self._merged = {}
+        self._signature = signature
+        self.logger.info(f"📣 Loaded {len(campaigns)} active campaigns")
+
+    def has_campaign(self, media_id: str) -> bool:
+        return media_id in self.campaigns
+
+    def config_for(self, media_id: str, base: DecisionConfig) -> DecisionConfig:
+        """Decision settings for a post: its campaign merged over base, or base itself"""
+        campaign = self.campaigns.get(media_id)
+        if campaign is None:
+            return base
+
+        if base is not self._base:
+            self._base = base
+            self._merged = {}
+
+        merged = self._merged.get(media_id)
+        metrics.cache_hit('campaign_config', merged is not None)
+        if merged is None:
+            merged = campaign.apply(base)
+            self._merged[media_id] = merged
+        return merged
+
+
+def validate_campaign(data: Dict) -> Optional[str]:
+    """Return an error message for an invalid campaign payload, or None"""
+    if not data.get('media_id'):
+        return 'media_id is required'
+    if data.get('strategy') and data['strategy'] not in VALID_STRATEGIES:
+        return f"strategy must be one of: {', '.join(VALID_STRATEGIES)}"
+    for field in ('keywords', 'consent_keywords'):
+        value = data.get(field)
+        if value is not None and (not isinstance(value, list) or not all(isinstance(k, str) for k in value)):
+            return f'{field} must be a list of strings'
+    if data.get('dm_message'):
+        error = validate_template(data['dm_message'], DM_PLACEHOLDERS)
+        if error:
+            return f'dm_message: {error}'
+    for field in REPLY_FIELDS:
+        if data.get(field):
+            error = validate_template(data[field], REPLY_PLACEHOLDERS)
+            if error:
+                return f'{field}: {error}'
+    return None
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Unified comment pipeline
+Every comment source (webhook, poll, reconcile, replay) runs through the same
+stages: normalize -> filter -> dedupe -> decide -> dispatch -> record
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+import metrics
+import tracing
+from campaigns import CampaignIndex
+from config import Config
+from decision_engine import Action, Decision, DecisionConfig, decide_batch
+
+STAGES = ('normalize', 'filter', 'dedupe', 'decide', 'dispatch', 'record')
+
+# Recently handled comment ids kept in memory to absorb duplicate deliveries
+RECENT_IDS_CACHE_SIZE = 10000
+
+
+class NormalizedComment:
+    """Source-independent view of a comment"""
+
+    __slots__ = ('comment_id', 'text', 'author_id', 'author_username', 'media_id', 'verb', 'source')
+
+    def __init__(self, comment_id, text, author_id, author_username, media_id, verb, source):
+        self.comment_id = comment_id
+        self.text = text
+        self.author_id = author_id
+        self.author_username = author_username
+        self.media_id = media_id
+        self.verb = verb
+        self.source = source
+
+
+class DMRateLimiter:
+    """
+    Enforces MAX_DMS_PER_HOUR / MAX_DMS_PER_DAY using the sent_dms log shared by all workers
+
+    With an account_id the budget applies to that account's DMs only; without
+    one it reports the deployment-wide totals.
+    """
+
+    def __init__(self, db, account_id: Optional[str] = None):
+        self.db = db
+        self.account_id = account_id
+
+    def remaining(self) -> Dict[str, int]:
+        """DMs left in the hourly and daily windows (also published as a gauge)"""
+        budget = {
+            'hour': Config.MAX_DMS_PER_HOUR - self.db.count_sent_dms_since(3600, self.account_id),
+            'day': Config.MAX_DMS_PER_DAY - self.db.count_sent_dms_since(86400, self.account_id)
+        }
+        for window, left in budget.items():
+            metrics.DM_BUDGET_REMAINING.labels(self.account_id or 'all', window).set(max(left, 0))
+        return budget
+
+    def reserve(self, user_id: str, username: str, message: str) -> Optional[int]:
+        """
+        Take one DM from the budget before sending (logged in sent_dms right away)
+
+        Returns the reservation id to release() if the send fails, or None when
+        the hourly or daily limit is reached.
+        """
+        reservation = self.db.reserve_dm(user_id, username, message, Config.MAX_DMS_PER_HOUR,
+                                         Config.MAX_DMS_PER_DAY, self.account_id)
+        if reservation is None:
+            logging.warning(f"⏳ DM limit reached ({Config.MAX_DMS_PER_HOUR}/hour, {Config.MAX_DMS_PER_DAY}/day) "
+                            f"for account {self.account_id}")
+        self.remaining()
+        return reservation
+
+    def release(self, reservation: int):
+        self.db.release_dm(reservation)
+        self.remaining()
+
+
+class CommentPipeline:
+    """Staged comment processing shared by all sources"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.db = bot.db
+        self.account_id = getattr(bot, 'user_id', None)
+        self.rate_limiter = DMRateLimiter(self.db, self.account_id)
+        self.campaigns = CampaignIndex(self.db)
+        self.stage_timings = {stage: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0} for stage in STAGES}
+
+        # Webhook deliveries run process_batch concurrently on request threads
+        self._lock = threading.Lock()
+        self._recent_ids = OrderedDict()
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Accumulate wall time spent in a stage (and record it as a span of the current trace)"""
+        started = time.perf_counter()
+        try:
+            with tracing.span(stage):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.STAGE_LATENCY.labels(stage).observe(elapsed)
+            elapsed_ms = elapsed * 1000
+            with self._lock:
+                timing = self.stage_timings[stage]
+                timing['count'] += 1
+                timing['total_ms'] += elapsed_ms
+                timing['max_ms'] = max(timing['max_ms'], elapsed_ms)
+
+    def get_stage_timings(self) -> Dict:
+        """Average and max milliseconds per stage"""
+        with self._lock:
+            timings = {stage: dict(timing) for stage, timing in self.stage_timings.items()}
+        return {
+            stage: {
+                'count': timing['count'],
+                'avg_ms': round(timing['total_ms'] / timing['count'], 3) if timing['count'] else 0.0,
+                'max_ms': round(timing['max_ms'], 3)
+            }
+            for stage, timing in timings.items()
+        }
+
+    # Entry points
+
+    def process(self, raw: Dict, source: str = 'webhook', media_id: Optional[str] = None) -> bool:
+        """
+        Run a single comment through the pipeline
+
+        Returns:
+            True if an action (DM or reply) was taken for the comment
+        """
+        return self.process_batch([raw], source=source, media_id=media_id) > 0
+
+    def process_batch(self, raws: Iterable[Dict], source: str, media_id: Optional[str] = None,
+                      raise_errors: bool = False) -> int:
+        """
+        Run several comments through the pipeline, deduplicating them with one query
+
+        Args:
+            raws: Webhook 'value' payloads or comments-edge records
+            source: Where the comments came from ('webhook', 'poll', 'reconcile', 'replay')
+            media_id: Post id for records that do not carry one (comments edge)
+            raise_errors: Re-raise after logging instead of returning 0, for
+                callers that must not move a watermark past a failed batch
+
+        Returns:
+            Number of comments an action was taken for
+        """
+        queued = 0
+        try:
+            Config.refresh_if_changed()
+            self.campaigns.refresh()
+
+            # One snapshot per batch: every stage sees the same config version
+            snapshot = Config.snapshot()
+
+            with self.timed('normalize'):
+                comments = [self.normalize(raw, source, media_id) for raw in raws]
+
+            queued = len(comments)
+            metrics.adjust_queue_depth('pipeline_pending', queued)
+            metrics.COMMENTS_PROCESSED.labels(source).inc(queued)
+
+            with self.timed('filter'):
+                comments = [comment for comment in comments if self.filter(comment, snapshot)]
+
+            with self.timed('dedupe'):
+                comments = self.dedupe(comments)
+
+            with self.timed('decide'):
+                decisions = self.decide(comments, Config.derived('decision_config', DecisionConfig.from_config))
+
+            handled = 0
+            for comment, decision in zip(comments, decisions):
+                if not decision.actions:
+                    continue
+
+                with self.timed('dispatch'):
+                    if not self.claim(comment, decision.keyword):
+                        continue
+                    action = None
+                    try:
+                        action = self.dispatch(comment, decision)
+                    finally:
+                        if action is None:
+                            self.db.release_comment(comment.comment_id)
+                if action is None:
+                    continue
+
+                with self.timed('record'):
+                    self.record(comment, decision.keyword, action)
+                handled += 1
+
+            return handled
+
+        except Exception as e:
+            logging.error(f"❌ Error processing {source} comments: {e}")
+            if raise_errors:
+                raise
+            return 0
+
+        finally:
+            metrics.adjust_queue_depth('pipeline_pending', -queued)
+
+    def dry_run(self, raws: Iterable[Dict], source: str = 'replay', media_id: Optional[str] = None) -> List[Decision]:
+        """Decide what would happen to comments without sending, recording or deduplicating"""
+        Config.refresh_if_changed()
+        self.campaigns.refresh()
+        snapshot = Config.snapshot()
+        comments = [self.normalize(raw, source, media_id) for raw in raws]
+        comments = [comment for comment in comments if self.filter(comment, snapshot)]
+        return decide_batch(comments, Config.derived('decision_config', DecisionConfig.from_config),
+                            self.campaigns.config_for)
+
+    # Stages
+
+    def normalize(self, raw: Dict, source: str, media_id: Optional[str] = None) -> NormalizedComment:
+        """Map webhook and comments-edge records onto one shape"""
+        author = raw.get('from') or {}
+        return NormalizedComment(
+            comment_id=raw.get('id'),
+            text=raw.get('text') or '',
+            author_id=author.get('id'),
+            author_username=author.get('username') or raw.get('username') or 'user',
+            media_id=(raw.get('media') or {}).get('id') or media_id or '',
+            verb=raw.get('verb', 'add'),
+            source=source
+        )
+
+    def filter(self, comment: NormalizedComment, snapshot) -> bool:
+        """Drop removal events and comments on posts with no campaign that we do not monitor"""
+        logging.info(f"🔔 {comment.source.upper()}: New comment from @{comment.author_username}: {comment.text[:50]}...")
+
+        if not comment.comment_id:
+            return False
+
+        if comment.verb in ('remove', 'hide'):
+            logging.info(f"⏭️ Skipping {comment.verb} comment event")
+            return False
+
+        monitor_all = getattr(self.bot, 'monitor_all_posts', None)
+        if monitor_all is None:
+            monitor_all = snapshot.MONITOR_ALL_POSTS
+
+        if (not monitor_all and comment.media_id not in self.monitored_post_ids()
+                and not self.campaigns.has_campaign(comment.media_id)):
+            logging.info(f"⏭️ SKIPPING: Post {comment.media_id} not in monitored posts list")
+            return False
+
+        return True
+
+    def monitored_post_ids(self) -> frozenset:
+        """Set view of MONITORED_POST_IDS, rebuilt once per config change"""
+        return Config.derived('monitored_post_ids', lambda snapshot: frozenset(snapshot.MONITORED_POST_IDS))
+
+    def dedupe(self, comments: List[NormalizedComment]) -> List[NormalizedComment]:
+        """Drop comments already handled, checking memory first and then the database in one query"""
+        fresh = []
+        seen = set()
+        with self._lock:
+            recent = [comment.comment_id in self._recent_ids for comment in comments]
+        for comment, cached in zip(comments, recent):
+            metrics.cache_hit('recent_comment_ids', cached)
+            if cached or comment.comment_id in seen:
+                logging.info(f"Comment {comment.comment_id} already processed, skipping")
+                continue
+            seen.add(comment.comment_id)
+            fresh.append(comment)
+
+        if not fresh:
+            return fresh
+
+        processed = self.db.get_processed_comment_ids((comment.comment_id for comment in fresh),
+                                                      Config.COMMENT_CLAIM_TIMEOUT_SECONDS)
+        for comment_id, action_taken in processed.items():
+            logging.info(f"Comment {comment_id} already processed, skipping")
+            if action_taken != 'pending':  # a claim may still be released or go stale
+                self._remember(comment_id)
+
+        return [comment for comment in fresh if comment.comment_id not in processed]
+
+    def decide(self, comments: List[NormalizedComment], cfg: DecisionConfig) -> List[Decision]:
+        """Evaluate the whole batch with the pure decision engine, applying per-post campaigns"""
+        decisions = decide_batch(comments, cfg, self.campaigns.config_for)
+        for comment, decision in zip(comments, decisions):
+            if decision.keyword:
+                logging.info(f"🎯 KEYWORD MATCH: '{decision.keyword}' from @{comment.author_username} ({decision.reason})")
+            else:
+                logging.info(f"⏭️ No keywords matched in comment: '{comment.text[:50]}...'")
+        return decisions
+
+    def claim(self, comment: NormalizedComment, keyword: str) -> bool:
+        """
+        Take ownership of a comment before acting on it
+
+        A concurrent delivery of the same comment (another thread or worker)
+        passes dedupe too; only the one that inserts the pending row proceeds.
+        A claim older than COMMENT_CLAIM_TIMEOUT_SECONDS belongs to a worker
+        that died mid-dispatch and is taken over.
+        """
+        claimed = self.db.claim_comment(
+            comment_id=comment.comment_id,
+            post_id=comment.media_id,
+            username=comment.author_username,
+            user_id=comment.author_id,
+            comment_text=comment.text,
+            keyword=keyword,
+            account_id=self.account_id,
+            claim_timeout=Config.COMMENT_CLAIM_TIMEOUT_SECONDS
+        )
+        if not claimed:
+            logging.info(f"Comment {comment.comment_id} already claimed, skipping")
+        return claimed
+
+    def dispatch(self, comment: NormalizedComment, decision: Decision) -> Optional[Action]:
+        """
+        Try each decided action until one succeeds
+
+        Returns:
+            The action that succeeded, or None
+        """
+        for action in decision.actions:
+            if action.kind == 'dm':
+                reservation = self.rate_limiter.reserve(action.target, comment.author_username, action.message)
+                if reservation is None:
+                    metrics.ACTIONS.labels('dm', 'rate_limited').inc()
+                    logging.info(f"🔄 DM budget exhausted, trying next action for @{comment.author_username}")
+                    continue
+                if self.bot.send_direct_message(action.target, action.message):
+                    metrics.ACTIONS.labels('dm', 'sent').inc()
+                    logging.info(f"✅ DM sent to @{comment.author_username}")
+                    return action
+                self.rate_limiter.release(reservation)
+                metrics.ACTIONS.labels('dm', 'failed').inc()
+                logging.info(f"🔄 DM failed, trying comment reply fallback for @{comment.author_username}")
+
+            elif action.kind == 'reply':
+                if self.bot.reply_to_comment(action.target, action.message):
+                    metrics.ACTIONS.labels('reply', 'sent').inc()
+                    logging.info(f"✅ Comment reply sent to @{comment.author_username}")
+                    return action
+                metrics.ACTIONS.labels('reply', 'failed').inc()
+
+        logging.error(f"❌ All actions failed for @{comment.author_username}")
+        return None
+
+    def record(self, comment: NormalizedComment, keyword: str, action: Action):
+        """Persist the outcome over the pending claim so the comment is never handled twice"""
+        self.db.add_processed_comment(
+            comment_id=comment.comment_id,
+            post_id=comment.media_id,
+            username=comment.author_username,
+            user_id=comment.author_id,
+            comment_text=comment.text,
+            keyword=keyword,
+            action_taken=action.action_taken,
+            account_id=self.account_id
+        )
+        # DMs were already logged in sent_dms when their budget was reserved
+        self._remember(comment.comment_id)
+
+    def _remember(self, comment_id: str):
+        with self._lock:
+            self._recent_ids[comment_id] = True
+            self._recent_ids.move_to_end(comment_id)
+            while len(self._recent_ids) > RECENT_IDS_CACHE_SIZE:
+                self._recent_ids.popitem(last=False)
@@ -1,9 +1,56 @@
 import os
+import fcntl
 import json
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
 from dotenv import load_dotenv
+import metrics
 
 load_dotenv()
 
+RUNTIME_CONFIG_FILE = 'runtime_config.json'
+RUNTIME_CONFIG_LOCK_FILE = RUNTIME_CONFIG_FILE + '.lock'
+
+@contextmanager
+def runtime_config_file_lock():
+    """Exclusive lock on a sidecar file, held across processes for read-modify-write of the runtime config"""
+    with open(RUNTIME_CONFIG_LOCK_FILE, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class ConfigSnapshot:
+    """
+    Immutable, versioned view of the runtime configuration
+    
+    Read settings as attributes (snapshot.KEYWORDS); lists are frozen to
+    tuples. Take one snapshot per unit of work so every value comes from the
+    same configuration version.
+    """
+    __slots__ = ('version', '_values')
+    
+    def __init__(self, version, values):
+        frozen = {key: tuple(value) if isinstance(value, list) else value for key, value in values.items()}
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, '_values', MappingProxyType(frozen))
+    
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot is immutable - use Config.update()")
+    
+    def as_dict(self):
+        return dict(self._values)
+
 class Config:
     # Instagram Business API credentials (OAuth method)
     INSTAGRAM_APP_ID = os.getenv('INSTAGRAM_APP_ID')
@@ -17,6 +64,11 @@ class Config:
     WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', 'https://instagram-dm-bot-tk4d.onrender.com')
     WEBHOOK_VERIFY_TOKEN = os.getenv('WEBHOOK_VERIFY_TOKEN', 'your-webhook-verify-token')
     
+    # GRAPH API ENDPOINT (point at graph_stub.py to run without Instagram)
+    # ===================================================================
+    GRAPH_API_BASE_URL = os.getenv('GRAPH_API_BASE_URL', 'https://graph.instagram.com')
+    GRAPH_API_VERSION = os.getenv('GRAPH_API_VERSION', 'v21.0')
+    
     # POST MONITORING CONFIGURATION
     # ============================
     MONITOR_ALL_POSTS = False  # Set to True to monitor ALL posts, False to monitor specific posts
@@ -71,10 +123,33 @@ Let me know if you have any questions! 🙂"""
     DEFAULT_LINK = "https://your-website.com"
     
     # Database file
-    DATABASE_FILE = "instagram_bot.db"
+    DATABASE_FILE = os.getenv('DATABASE_FILE', 'instagram_bot.db')
+    STATUS_DATABASE_FILE = os.getenv('STATUS_DATABASE_FILE', 'runtime_status.db')  # Status shared by all workers
     
-    # REMOVED: Polling-related settings (no longer needed with webhooks)
-    # CHECK_INTERVAL, MAX_POSTS_TO_CHECK, MONITOR_ALL_POSTS, etc.
+    # POLLING CONFIGURATION (fallback path, webhooks are primary)
+    # ===========================================================
+    MAX_POSTS_TO_CHECK = 3  # Number of recent posts fetched per polling cycle
+    COMMENTS_PAGE_SIZE = 50  # Comments requested per page when paging
+    MAX_COMMENT_PAGES = 20  # Safety cap on pages followed for a single post per cycle
+    POLL_MAX_WORKERS = 8  # Posts fetched concurrently per polling cycle
+    GRAPH_API_MAX_CONCURRENCY_PER_HOST = 4  # In-flight Graph API requests allowed per host
+    
+    # Adaptive scheduling: the media list is read every tick, comments only when worthwhile
+    POLL_TICK_SECONDS = 10  # How often the media list (with comments_count) is checked
+    POLL_HOT_COMMENTS_PER_MINUTE = 5  # Comment rate at which a post counts as hot
+    POLL_INTERVAL_HOT = 10  # Seconds between polls of a hot post
+    POLL_INTERVAL_WARM = 60  # Seconds between polls of a post with some new comments
+    POLL_INTERVAL_COOL = 600  # Re-check interval for quiet recent posts
+    POLL_INTERVAL_COLD = 3600  # Re-check interval for quiet older posts
+    POLL_COLD_AFTER_DAYS = 7  # Quiet posts older than this are re-checked hourly
+    POLL_MAX_POST_AGE_DAYS = 30  # Quiet posts older than this are only polled when their count changes
+    
+    # RECONCILIATION (backfills comments whose webhook was missed)
+    # ===========================================================
+    RECONCILE_INTERVAL_SECONDS = 900  # How often the sweeper walks monitored posts
+    RECONCILE_LOOKBACK_HOURS = 24  # How far back the first sweep of a post looks
+    RECONCILE_GRACE_SECONDS = 120  # Leave very recent comments to their in-flight webhook
+    COMMENT_CLAIM_TIMEOUT_SECONDS = 600  # Retry a comment whose worker died after claiming it
     
     # FOLLOWER REQUIREMENTS
     # ====================
@@ -86,12 +161,134 @@ Let me know if you have any questions! 🙂"""
     MAX_DMS_PER_HOUR = 30  # Instagram rate limit compliance
     MAX_DMS_PER_DAY = 200  # Conservative daily limit
     
+    # MULTI-ACCOUNT ROUTING (accounts beyond the OAuth one live in the accounts table)
+    # ===========================================================================
+    ACCOUNT_IDLE_EVICT_SECONDS = 1800  # Unload an account's bot after this long without webhooks
+    MAX_LOADED_ACCOUNTS = 50  # Least recently used bots are unloaded beyond this many per worker
+    ACCOUNT_RETRY_SECONDS = 60  # Wait before retrying an account whose login failed
+    
+    # SINGLETON JOBS (run by one elected worker)
+    # ==========================================
+    LEADER_LEASE_SECONDS = 30  # A dead leader's jobs move to another worker within this long
+    TOKEN_REFRESH_INTERVAL_SECONDS = 86400  # How often long-lived access tokens are extended
+    WEBHOOK_SUBSCRIPTION_CHECK_SECONDS = 86400  # How often the comments webhook subscription is re-asserted
+    
+    # LIVE DASHBOARD EVENTS (/api/events server-sent event streams)
+    # ============================================================
+    LIVE_EVENTS_MAX_STREAMS = 8  # Open streams per worker (each holds a request thread); more get a 503
+    LIVE_EVENTS_STREAM_SECONDS = 300  # A stream ends after this long and the browser reconnects
+    LIVE_EVENTS_RETRY_SECONDS = 5  # Reconnect delay sent in the retry field and Retry-After header
+    
+    # WEBHOOK JOURNAL (raw deliveries kept for audit and replay)
+    # ==========================================================
+    WEBHOOK_JOURNAL_DIR = os.getenv('WEBHOOK_JOURNAL_DIR', '')  # Set to a directory to enable the journal
+    WEBHOOK_JOURNAL_MAX_BYTES = 1024 * 1024 * 1024  # Oldest sealed segments are deleted beyond this many bytes
+    WEBHOOK_JOURNAL_SEGMENT_BYTES = 64 * 1024 * 1024  # Active file is sealed into a gzip segment at this size
+    WEBHOOK_JOURNAL_SEGMENT_SECONDS = 3600  # ...or this long after it was opened
+    WEBHOOK_JOURNAL_BUFFER_BYTES = 256 * 1024  # Deliveries are written in chunks of about this size
+    WEBHOOK_JOURNAL_FLUSH_SECONDS = 1.0  # Longest a delivery waits in memory before it is written
+    
+    # PROFILING (admin-only diagnostics)
+    # =================================
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # Required by admin endpoints; when unset they are disabled
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')  # Where profiles are written
+    PROFILE_EVERY_N_WEBHOOKS = int(os.getenv('PROFILE_EVERY_N_WEBHOOKS', '0'))  # cProfile every Nth webhook (0 = off)
+    PROFILE_MAX_SECONDS = 120  # Longest on-demand sampling run
+    PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+    PROFILE_KEEP_FILES = 50  # Older profiles are deleted beyond this many
+    
+    # SNAPSHOT STATE (managed by the classmethods below)
+    # =================================================
+    REFRESH_CHECK_SECONDS = 1.0  # How often a worker stats runtime_config.json for changes
+    _lock = threading.RLock()
+    _snapshot = None
+    _version = 0
+    _file_mtime = None
+    _last_refresh_check = 0.0
+    _derived = {}
+    
+    @classmethod
+    def snapshot(cls):
+        """Current immutable configuration snapshot"""
+        if cls._snapshot is None:
+            cls._publish()
+        return cls._snapshot
+    
+    @classmethod
+    def derived(cls, name, builder):
+        """
+        Value computed from the current snapshot, cached until the next config change
+        
+        builder(snapshot) is called at most once per snapshot, so matchers,
+        post sets and compiled templates are rebuilt once per change instead
+        of once per comment.
+        """
+        snapshot = cls.snapshot()
+        cached = cls._derived.get(name)
+        hit = cached is not None and cached[0] is snapshot
+        metrics.cache_hit('config_derived', hit)
+        if hit:
+            return cached[1]
+        
+        value = builder(snapshot)
+        cls._derived[name] = (snapshot, value)
+        return value
+    
+    @classmethod
+    def _publish(cls):
+        """Swap in a new snapshot built from the class attributes"""
+        cls._derived = {}
+        cls._snapshot = ConfigSnapshot(cls._version, cls._runtime_values())
+    
+    @classmethod
+    def refresh_if_changed(cls, force=False):
+        """
+        Reload runtime_config.json if another worker rewrote it
+        
+        Costs one os.stat at most every REFRESH_CHECK_SECONDS.
+        """
+        now = time.monotonic()
+        if not force and now - cls._last_refresh_check < cls.REFRESH_CHECK_SECONDS:
+            return False
+        cls._last_refresh_check = now
+        
+        try:
+            mtime = os.stat(RUNTIME_CONFIG_FILE).st_mtime_ns
+        except OSError:
+            return False
+        
+        if mtime == cls._file_mtime:
+            return False
+        
+        with cls._lock:
+            return cls.load_runtime_config()
+    
+    @classmethod
+    def update(cls, **changes):
+        """Apply several settings at once, persist them and publish a new snapshot"""
+        with cls._lock:
+            unknown = [key for key in changes if not hasattr(cls, key) or key.startswith('_')]
+            if unknown:
+                print(f"❌ Unknown configuration keys: {', '.join(unknown)}")
+                return False
+            
+            # Other workers write the same file: hold the file lock from reading
+            # the latest saved state until ours is written, so no keys are lost
+            with runtime_config_file_lock():
+                cls.refresh_if_changed(force=True)
+                
+                for key, value in changes.items():
+                    setattr(cls, key, value)
+                
+                return cls.save_runtime_config()
+    
     @classmethod
     def load_runtime_config(cls):
         """Load configuration from runtime_config.json if it exists"""
         try:
-            if os.path.exists('runtime_config.json'):
-                with open('runtime_config.json', 'r') as f:
+            if os.path.exists(RUNTIME_CONFIG_FILE):
+                with open(RUNTIME_CONFIG_FILE, 'r') as f:
+                    file_mtime = os.fstat(f.fileno()).st_mtime_ns
                     config_data = json.load(f)
                 
                 # Update class attributes with loaded values
@@ -128,9 +325,14 @@ Let me know if you have any questions! 🙂"""
                 cls.COMMENT_REPLY_INTEREST = config_data.get('COMMENT_REPLY_INTEREST', cls.COMMENT_REPLY_INTEREST)
                 cls.COMMENT_REPLY_ENCOURAGEMENT = config_data.get('COMMENT_REPLY_ENCOURAGEMENT', cls.COMMENT_REPLY_ENCOURAGEMENT)
                 
-                print("✅ Runtime configuration loaded successfully")
+                cls._version = config_data.get('CONFIG_VERSION', cls._version)
+                cls._file_mtime = file_mtime
+                cls._publish()
+                
+                print(f"✅ Runtime configuration loaded successfully (version {cls._version})")
                 return True
             else:
+                cls._publish()
                 print("ℹ️ No runtime configuration file found - using defaults")
                 return False
                 
@@ -140,58 +342,105 @@ Let me know if you have any questions! 🙂"""
     
     @classmethod
     def save_runtime_config(cls):
-        """Save current configuration to runtime_config.json"""
+        """
+        Save current configuration to runtime_config.json
+        
+        The file is written to a temporary file and renamed into place, so
+        other workers never read a partially written config.
+        """
         try:
-            config_data = {
-                # Keywords
-                'KEYWORDS': cls.KEYWORDS,
-                'CONSENT_KEYWORDS': cls.CONSENT_KEYWORDS,
-                'INTEREST_KEYWORDS': cls.INTEREST_KEYWORDS,
-                
-                # DM Settings
-                'DM_MESSAGE': cls.DM_MESSAGE,
-                'DEFAULT_LINK': cls.DEFAULT_LINK,
-                'ENABLE_DIRECT_DM': cls.ENABLE_DIRECT_DM,
-                
-                # Comment Reply Templates
-                'COMMENT_REPLY_CONSENT': getattr(cls, 'COMMENT_REPLY_CONSENT', "Hi @{username}! I saw your request. Please DM me and I'll send you the link! 📩"),
-                'COMMENT_REPLY_INTEREST': getattr(cls, 'COMMENT_REPLY_INTEREST', "Hi @{username}! I saw your interest in '{keyword}'. Please DM me and I'll send you the details! 📩"),
-                'COMMENT_REPLY_ENCOURAGEMENT': getattr(cls, 'COMMENT_REPLY_ENCOURAGEMENT', "Great question @{username}! DM me '{keyword}' for the full details 📩"),
-                
-                # Webhook Settings
-                'WEBHOOK_BASE_URL': cls.WEBHOOK_BASE_URL,
-                'WEBHOOK_VERIFY_TOKEN': cls.WEBHOOK_VERIFY_TOKEN,
-                
-                # Instagram Business API OAuth
-                'INSTAGRAM_APP_ID': cls.INSTAGRAM_APP_ID,
-                'INSTAGRAM_APP_SECRET': cls.INSTAGRAM_APP_SECRET,
-                'INSTAGRAM_ACCESS_TOKEN': cls.INSTAGRAM_ACCESS_TOKEN,
-                'INSTAGRAM_USER_ID': cls.INSTAGRAM_USER_ID,
-                'OAUTH_STATE_SECRET': cls.OAUTH_STATE_SECRET,
+            with cls._lock:
+                cls._version += 1
+                config_data = cls._runtime_values()
+                config_data['CONFIG_VERSION'] = cls._version
                 
-                # Rate Limiting
-                'MAX_DMS_PER_HOUR': cls.MAX_DMS_PER_HOUR,
-                'MAX_DMS_PER_DAY': cls.MAX_DMS_PER_DAY,
-                'MIN_FOLLOWER_COUNT': cls.MIN_FOLLOWER_COUNT,
-                'ONLY_VERIFIED_ACCOUNTS': cls.ONLY_VERIFIED_ACCOUNTS,
+                directory = os.path.dirname(os.path.abspath(RUNTIME_CONFIG_FILE))
+                fd, temp_path = tempfile.mkstemp(prefix='.runtime_config.', suffix='.tmp', dir=directory)
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(config_data, f, indent=2)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(temp_path, RUNTIME_CONFIG_FILE)
+                except Exception:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
                 
-                # Post Monitoring
-                'MONITOR_ALL_POSTS': cls.MONITOR_ALL_POSTS,
-                'MONITORED_POST_IDS': cls.MONITORED_POST_IDS,
-                
-                # Keyword Strategy
-                'KEYWORD_STRATEGY': getattr(cls, 'KEYWORD_STRATEGY', 'consent_required')
-            }
-            
-            with open('runtime_config.json', 'w') as f:
-                json.dump(config_data, f, indent=2)
+                cls._file_mtime = os.stat(RUNTIME_CONFIG_FILE).st_mtime_ns
+                cls._publish()
             
-            print("✅ Runtime configuration saved")
+            print(f"✅ Runtime configuration saved (version {cls._version})")
             return True
             
         except Exception as e:
             print(f"❌ Error saving runtime configuration: {e}")
             return False
+    
+    @classmethod
+    def _runtime_values(cls):
+        """Settings that are persisted to runtime_config.json and captured in snapshots"""
+        return {
+            # Keywords
+            'KEYWORDS': cls.KEYWORDS,
+            'CONSENT_KEYWORDS': cls.CONSENT_KEYWORDS,
+            'INTEREST_KEYWORDS': cls.INTEREST_KEYWORDS,
+            
+            # DM Settings
+            'DM_MESSAGE': cls.DM_MESSAGE,
+            'DEFAULT_LINK': cls.DEFAULT_LINK,
+            'ENABLE_DIRECT_DM': cls.ENABLE_DIRECT_DM,
+            
+            # Comment Reply Templates
+            'COMMENT_REPLY_CONSENT': getattr(cls, 'COMMENT_REPLY_CONSENT', "Hi @{username}! I saw your request. Please DM me and I'll send you the link! 📩"),
+            'COMMENT_REPLY_INTEREST': getattr(cls, 'COMMENT_REPLY_INTEREST', "Hi @{username}! I saw your interest in '{keyword}'. Please DM me and I'll send you the details! 📩"),
+            'COMMENT_REPLY_ENCOURAGEMENT': getattr(cls, 'COMMENT_REPLY_ENCOURAGEMENT', "Great question @{username}! DM me '{keyword}' for the full details 📩"),
+            
+            # Webhook Settings
+            'WEBHOOK_BASE_URL': cls.WEBHOOK_BASE_URL,
+            'WEBHOOK_VERIFY_TOKEN': cls.WEBHOOK_VERIFY_TOKEN,
+            
+            # Instagram Business API OAuth
+            'INSTAGRAM_APP_ID': cls.INSTAGRAM_APP_ID,
+            'INSTAGRAM_APP_SECRET': cls.INSTAGRAM_APP_SECRET,
+            'INSTAGRAM_ACCESS_TOKEN': cls.INSTAGRAM_ACCESS_TOKEN,
+            'INSTAGRAM_USER_ID': cls.INSTAGRAM_USER_ID,
+            'OAUTH_STATE_SECRET': cls.OAUTH_STATE_SECRET,
+            
+            # Rate Limiting
+            'MAX_DMS_PER_HOUR': cls.MAX_DMS_PER_HOUR,
+            'MAX_DMS_PER_DAY': cls.MAX_DMS_PER_DAY,
+            'MIN_FOLLOWER_COUNT': cls.MIN_FOLLOWER_COUNT,
+            'ONLY_VERIFIED_ACCOUNTS': cls.ONLY_VERIFIED_ACCOUNTS,
+            
+            # Post Monitoring
+            'MONITOR_ALL_POSTS': cls.MONITOR_ALL_POSTS,
+            'MONITORED_POST_IDS': cls.MONITORED_POST_IDS,
+            
+            # Polling
+            'MAX_POSTS_TO_CHECK': cls.MAX_POSTS_TO_CHECK,
+            'COMMENTS_PAGE_SIZE': cls.COMMENTS_PAGE_SIZE,
+            'MAX_COMMENT_PAGES': cls.MAX_COMMENT_PAGES,
+            'POLL_MAX_WORKERS': cls.POLL_MAX_WORKERS,
+            'GRAPH_API_MAX_CONCURRENCY_PER_HOST': cls.GRAPH_API_MAX_CONCURRENCY_PER_HOST,
+            'POLL_TICK_SECONDS': cls.POLL_TICK_SECONDS,
+            'POLL_HOT_COMMENTS_PER_MINUTE': cls.POLL_HOT_COMMENTS_PER_MINUTE,
+            'POLL_INTERVAL_HOT': cls.POLL_INTERVAL_HOT,
+            'POLL_INTERVAL_WARM': cls.POLL_INTERVAL_WARM,
+            'POLL_INTERVAL_COOL': cls.POLL_INTERVAL_COOL,
+            'POLL_INTERVAL_COLD': cls.POLL_INTERVAL_COLD,
+            'POLL_COLD_AFTER_DAYS': cls.POLL_COLD_AFTER_DAYS,
+            'POLL_MAX_POST_AGE_DAYS': cls.POLL_MAX_POST_AGE_DAYS,
+            
+            # Reconciliation
+            'RECONCILE_INTERVAL_SECONDS': cls.RECONCILE_INTERVAL_SECONDS,
+            'RECONCILE_LOOKBACK_HOURS': cls.RECONCILE_LOOKBACK_HOURS,
+            'RECONCILE_GRACE_SECONDS': cls.RECONCILE_GRACE_SECONDS,
+            'COMMENT_CLAIM_TIMEOUT_SECONDS': cls.COMMENT_CLAIM_TIMEOUT_SECONDS,
+            
+            # Keyword Strategy
+            'KEYWORD_STRATEGY': getattr(cls, 'KEYWORD_STRATEGY', 'consent_required')
+        }
 
 # Load runtime configuration on import
-Config.load_runtime_config() 
\ No newline at end of file
+Config.load_runtime_config() 
@@ -1,5 +1,12 @@
 import sqlite3
+import json
 from config import Config
+from metrics import timed_query
+
+CAMPAIGN_LIST_FIELDS = ('keywords', 'consent_keywords')
+CAMPAIGN_FIELDS = ('media_id', 'name', 'keywords', 'consent_keywords', 'strategy', 'link', 'dm_message',
+                   'reply_consent', 'reply_interest', 'reply_encouragement', 'active')
+ACCOUNT_FIELDS = ('user_id', 'username', 'access_token', 'monitor_all_posts', 'active')
 
 class Database:
     def __init__(self):
@@ -37,6 +44,55 @@ class Database:
             )
         ''')
         
+        # DM budget checks count recent rows
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sent_dms_sent_at ON sent_dms (sent_at)')
+        
+        # Table to track the newest comment seen per post (incremental polling);
+        # a walk cut short by the page cap leaves a cursor to resume from
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS comment_watermarks (
+                post_id TEXT,
+                source TEXT DEFAULT 'poll',
+                last_comment_id TEXT,
+                last_comment_timestamp TEXT,
+                resume_after TEXT,
+                head_comment_id TEXT,
+                head_comment_timestamp TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (post_id, source)
+            )
+        ''')
+        
+        # Per-post campaign rules (NULL columns fall back to the global settings)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS campaigns (
+                media_id TEXT PRIMARY KEY,
+                name TEXT,
+                keywords TEXT,
+                consent_keywords TEXT,
+                strategy TEXT,
+                link TEXT,
+                dm_message TEXT,
+                reply_consent TEXT,
+                reply_interest TEXT,
+                reply_encouragement TEXT,
+                active INTEGER DEFAULT 1,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Instagram accounts served by this deployment (webhooks are routed by entry id = user_id)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS accounts (
+                user_id TEXT PRIMARY KEY,
+                username TEXT,
+                access_token TEXT,
+                monitor_all_posts INTEGER,
+                active INTEGER DEFAULT 1,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
         # Add missing columns to existing table if they don't exist
         cursor.execute("PRAGMA table_info(processed_comments)")
         columns = [column[1] for column in cursor.fetchall()]
@@ -47,9 +103,30 @@ class Database:
         if 'action_taken' not in columns:
             cursor.execute('ALTER TABLE processed_comments ADD COLUMN action_taken TEXT')
         
+        if 'account_id' not in columns:
+            cursor.execute('ALTER TABLE processed_comments ADD COLUMN account_id TEXT')
+        
+        # DM budgets are enforced per account
+        cursor.execute("PRAGMA table_info(sent_dms)")
+        columns = [column[1] for column in cursor.fetchall()]
+        
+        if 'account_id' not in columns:
+            cursor.execute('ALTER TABLE sent_dms ADD COLUMN account_id TEXT')
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sent_dms_account_sent_at ON sent_dms (account_id, sent_at)')
+        
+        # Resume points of partial comment walks
+        cursor.execute("PRAGMA table_info(comment_watermarks)")
+        columns = [column[1] for column in cursor.fetchall()]
+        
+        for column in ('resume_after', 'head_comment_id', 'head_comment_timestamp'):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE comment_watermarks ADD COLUMN {column} TEXT')
+        
         conn.commit()
         conn.close()
     
+    @timed_query
     def is_comment_processed(self, comment_id):
         """Check if a comment has already been processed"""
         conn = sqlite3.connect(self.db_file)
@@ -61,16 +138,94 @@ class Database:
         conn.close()
         return result is not None
     
-    def add_processed_comment(self, comment_id, post_id, username, user_id, comment_text, keyword, action_taken):
+    @timed_query
+    def get_processed_comment_ids(self, comment_ids, claim_timeout=None):
+        """
+        Return {comment_id: action_taken} for the ids already processed or claimed (one query per 500 ids)
+        
+        With claim_timeout, pending claims older than that many seconds are left
+        out: their worker died and claim_comment() will hand them to the next caller.
+        """
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return {}
+        
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        stale_filter = ''
+        stale_params = ()
+        if claim_timeout is not None:
+            stale_filter = "AND NOT (action_taken = 'pending' AND processed_at < datetime('now', ?))"
+            stale_params = (f'-{int(claim_timeout)} seconds',)
+        
+        processed = {}
+        for start in range(0, len(comment_ids), 500):
+            chunk = comment_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(
+                f'SELECT comment_id, action_taken FROM processed_comments WHERE comment_id IN ({placeholders}) {stale_filter}',
+                tuple(chunk) + stale_params
+            )
+            processed.update(cursor.fetchall())
+        
+        conn.close()
+        return processed
+    
+    @timed_query
+    def add_processed_comment(self, comment_id, post_id, username, user_id, comment_text, keyword, action_taken,
+                              account_id=None):
         """Add a processed comment with detailed tracking"""
         conn = sqlite3.connect(self.db_file)
         cursor = conn.cursor()
         
         cursor.execute('''
             INSERT OR REPLACE INTO processed_comments 
-            (comment_id, user_id, username, post_id, comment_text, keyword, action_taken)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (comment_id, user_id, username, post_id, comment_text, keyword, action_taken))
+            (comment_id, user_id, username, post_id, comment_text, keyword, action_taken, account_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (comment_id, user_id, username, post_id, comment_text, keyword, action_taken, account_id))
+        
+        conn.commit()
+        conn.close()
+    
+    @timed_query
+    def claim_comment(self, comment_id, post_id, username, user_id, comment_text, keyword, account_id=None,
+                      claim_timeout=None):
+        """
+        Mark a comment as being handled before any action is taken on it
+        
+        Returns True if this caller inserted the claim, False if another worker
+        already claimed or processed the comment. A pending row's processed_at is
+        its claim time; with claim_timeout, a claim older than that many seconds
+        (left by a worker that died mid-dispatch) is taken over.
+        """
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        cursor = conn.cursor()
+        
+        stale_before = f'-{int(claim_timeout)} seconds' if claim_timeout is not None else None
+        cursor.execute('''
+            INSERT INTO processed_comments
+            (comment_id, user_id, username, post_id, comment_text, keyword, action_taken, account_id)
+            VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)
+            ON CONFLICT(comment_id) DO UPDATE SET
+                user_id = excluded.user_id, username = excluded.username, post_id = excluded.post_id,
+                comment_text = excluded.comment_text, keyword = excluded.keyword,
+                account_id = excluded.account_id, processed_at = CURRENT_TIMESTAMP
+            WHERE action_taken = 'pending' AND ? IS NOT NULL AND processed_at < datetime('now', ?)
+        ''', (comment_id, user_id, username, post_id, comment_text, keyword, account_id, stale_before, stale_before))
+        claimed = cursor.rowcount == 1
+        
+        conn.commit()
+        conn.close()
+        return claimed
+    
+    @timed_query
+    def release_comment(self, comment_id):
+        """Drop a pending claim whose actions all failed so the comment can be retried"""
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        cursor = conn.cursor()
+        
+        cursor.execute("DELETE FROM processed_comments WHERE comment_id = ? AND action_taken = 'pending'", (comment_id,))
         
         conn.commit()
         conn.close()
@@ -79,19 +234,104 @@ class Database:
         """Mark a comment as processed (backward compatibility)"""
         self.add_processed_comment(comment_id, post_id, username, user_id, '', keyword, 'legacy_dm_sent')
     
-    def log_sent_dm(self, user_id, username, message):
+    @timed_query
+    def log_sent_dm(self, user_id, username, message, account_id=None):
         """Log a sent DM"""
         conn = sqlite3.connect(self.db_file)
         cursor = conn.cursor()
         
         cursor.execute('''
-            INSERT INTO sent_dms (user_id, username, message)
-            VALUES (?, ?, ?)
-        ''', (user_id, username, message))
+            INSERT INTO sent_dms (user_id, username, message, account_id)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, username, message, account_id))
         
         conn.commit()
         conn.close()
     
+    @timed_query
+    def count_sent_dms_since(self, seconds, account_id=None):
+        """Count DMs sent in the last `seconds` seconds (by one account, or by all when account_id is None)"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        if account_id is None:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sent_dms WHERE sent_at >= datetime('now', ?)",
+                (f'-{int(seconds)} seconds',)
+            )
+        else:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sent_dms WHERE account_id = ? AND sent_at >= datetime('now', ?)",
+                (account_id, f'-{int(seconds)} seconds')
+            )
+        count = cursor.fetchone()[0]
+        
+        conn.close()
+        return count
+    
+    @timed_query
+    def reserve_dm(self, user_id, username, message, hourly_limit, daily_limit, account_id=None):
+        """
+        Log a DM before it is sent if the hourly and daily budgets allow it
+        
+        Counting and inserting happen in one write transaction, so concurrent
+        senders (threads or workers) can never reserve past the limits.
+        Returns the reservation's row id, or None when the budget is spent.
+        """
+        conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            account_filter = '' if account_id is None else 'AND account_id = ?'
+            account_params = () if account_id is None else (account_id,)
+            for seconds, limit in ((3600, hourly_limit), (86400, daily_limit)):
+                cursor.execute(
+                    f"SELECT COUNT(*) FROM sent_dms WHERE sent_at >= datetime('now', ?) {account_filter}",
+                    (f'-{int(seconds)} seconds',) + account_params
+                )
+                if cursor.fetchone()[0] >= limit:
+                    cursor.execute('ROLLBACK')
+                    return None
+            
+            cursor.execute('''
+                INSERT INTO sent_dms (user_id, username, message, account_id)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, username, message, account_id))
+            row_id = cursor.lastrowid
+            cursor.execute('COMMIT')
+            return row_id
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+    
+    @timed_query
+    def release_dm(self, row_id):
+        """Give back a reservation whose DM was not sent"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM sent_dms WHERE id = ?', (row_id,))
+        
+        conn.commit()
+        conn.close()
+    
+    @timed_query
+    def count_sent_dms(self):
+        """Count all DMs ever sent"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT COUNT(*) FROM sent_dms')
+        count = cursor.fetchone()[0]
+        
+        conn.close()
+        return count
+    
+    @timed_query
     def get_recent_processed_comments(self, limit=50):
         """Get recent processed comments for monitoring"""
         conn = sqlite3.connect(self.db_file)
@@ -100,6 +340,7 @@ class Database:
         cursor.execute('''
             SELECT username, keyword, action_taken, processed_at 
             FROM processed_comments 
+            WHERE action_taken IS NOT 'pending'
             ORDER BY processed_at DESC 
             LIMIT ?
         ''', (limit,))
@@ -108,6 +349,50 @@ class Database:
         conn.close()
         return results
     
+    @timed_query
+    def get_processed_comments_after(self, last_id, limit=100):
+        """Processed comments with a row id above last_id, oldest first (for tailing new activity)"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id, username, keyword, action_taken, processed_at, comment_text, post_id
+            FROM processed_comments
+            WHERE id > ? AND action_taken IS NOT 'pending'
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, limit))
+        
+        columns = [column[0] for column in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        conn.close()
+        return results
+    
+    @timed_query
+    def get_last_processed_comment_row_id(self):
+        """Highest processed_comments row id (0 when empty)"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT MAX(id) FROM processed_comments')
+        last_id = cursor.fetchone()[0] or 0
+        
+        conn.close()
+        return last_id
+    
+    @timed_query
+    def count_processed_comments(self):
+        """Count all processed comments"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT COUNT(*) FROM processed_comments')
+        count = cursor.fetchone()[0]
+        
+        conn.close()
+        return count
+    
+    @timed_query
     def get_comment_stats(self):
         """Get statistics about processed comments"""
         conn = sqlite3.connect(self.db_file)
@@ -131,4 +416,215 @@ class Database:
         return {
             'total_processed': total_count,
             'action_counts': action_counts
-        } 
\ No newline at end of file
+        }
+    
+    @timed_query
+    def get_comment_watermark(self, post_id, source='poll'):
+        """Get the newest comment seen on a post as (comment_id, timestamp), or None"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT last_comment_id, last_comment_timestamp
+            FROM comment_watermarks
+            WHERE post_id = ? AND source = ? AND (last_comment_id IS NOT NULL OR last_comment_timestamp IS NOT NULL)
+        ''', (post_id, source))
+        result = cursor.fetchone()
+        
+        conn.close()
+        return result
+    
+    @timed_query
+    def get_comment_walk(self, post_id, source='poll'):
+        """
+        Get where the next comment walk of a post starts, in one query
+        
+        Returns:
+            (watermark as (comment_id, timestamp) or None,
+             resume point as (after cursor, head comment_id, head timestamp) or None)
+        """
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT last_comment_id, last_comment_timestamp, resume_after, head_comment_id, head_comment_timestamp
+            FROM comment_watermarks
+            WHERE post_id = ? AND source = ?
+        ''', (post_id, source))
+        result = cursor.fetchone()
+        
+        conn.close()
+        if not result:
+            return None, None
+        
+        last_id, last_timestamp, resume_after, head_id, head_timestamp = result
+        watermark = (last_id, last_timestamp) if last_id is not None or last_timestamp is not None else None
+        resume = (resume_after, head_id, head_timestamp) if resume_after else None
+        return watermark, resume
+    
+    @timed_query
+    def set_comment_resume(self, post_id, resume_after, head_comment_id, head_timestamp, source='poll'):
+        """
+        Record a partial walk: the paging cursor below the last page read and the
+        newest comment handled so far (the watermark stays where it was)
+        """
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO comment_watermarks
+            (post_id, source, resume_after, head_comment_id, head_comment_timestamp, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(post_id, source) DO UPDATE SET
+                resume_after = excluded.resume_after,
+                head_comment_id = excluded.head_comment_id,
+                head_comment_timestamp = excluded.head_comment_timestamp,
+                updated_at = excluded.updated_at
+        ''', (post_id, source, resume_after, head_comment_id, head_timestamp))
+        
+        conn.commit()
+        conn.close()
+    
+    @timed_query
+    def set_comment_watermark(self, post_id, comment_id, timestamp, source='poll'):
+        """Advance the watermark for a post to the given comment (dropping any resume point)"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT OR REPLACE INTO comment_watermarks
+            (post_id, source, last_comment_id, last_comment_timestamp, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (post_id, source, comment_id, timestamp))
+        
+        conn.commit()
+        conn.close()
+    
+    @timed_query
+    def get_campaigns(self, active_only=False):
+        """Get campaign rules as dictionaries (keyword columns decoded to lists)"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        query = f"SELECT {', '.join(CAMPAIGN_FIELDS)} FROM campaigns"
+        if active_only:
+            query += " WHERE active = 1"
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        
+        conn.close()
+        
+        campaigns = []
+        for row in rows:
+            campaign = dict(zip(CAMPAIGN_FIELDS, row))
+            for field in CAMPAIGN_LIST_FIELDS:
+                if campaign[field] is not None:
+                    campaign[field] = json.loads(campaign[field])
+            campaign['active'] = bool(campaign['active'])
+            campaigns.append(campaign)
+        return campaigns
+    
+    @timed_query
+    def get_campaigns_signature(self):
+        """Cheap change marker for the campaigns table: (row count, last update)"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT COUNT(*), MAX(updated_at) FROM campaigns')
+        result = cursor.fetchone()
+        
+        conn.close()
+        return result
+    
+    @timed_query
+    def save_campaign(self, campaign):
+        """Insert or replace the campaign for campaign['media_id']"""
+        values = []
+        for field in CAMPAIGN_FIELDS:
+            value = campaign.get(field)
+            if field in CAMPAIGN_LIST_FIELDS and value is not None:
+                value = json.dumps(list(value))
+            if field == 'active':
+                value = 1 if value is None or value else 0
+            values.append(value)
+        
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO campaigns ({', '.join(CAMPAIGN_FIELDS)}, updated_at)
+            VALUES ({', '.join('?' * len(CAMPAIGN_FIELDS))}, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ''', values)
+        
+        conn.commit()
+        conn.close()
+    
+    @timed_query
+    def delete_campaign(self, media_id):
+        """Delete a campaign; returns True if one existed"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM campaigns WHERE media_id = ?', (media_id,))
+        deleted = cursor.rowcount > 0
+        
+        conn.commit()
+        conn.close()
+        return deleted
+    
+    @timed_query
+    def get_account(self, user_id):
+        """Get one account as a dict, or None"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'SELECT {", ".join(ACCOUNT_FIELDS)} FROM accounts WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        
+        conn.close()
+        return dict(zip(ACCOUNT_FIELDS, row)) if row else None
+    
+    @timed_query
+    def get_accounts(self, active_only=False):
+        """Get all accounts as dicts"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        query = f'SELECT {", ".join(ACCOUNT_FIELDS)} FROM accounts'
+        if active_only:
+            query += ' WHERE active = 1'
+        cursor.execute(query + ' ORDER BY username')
+        
+        accounts = [dict(zip(ACCOUNT_FIELDS, row)) for row in cursor.fetchall()]
+        conn.close()
+        return accounts
+    
+    @timed_query
+    def save_account(self, account):
+        """Insert or update the account for account['user_id']"""
+        values = [account.get(field) for field in ACCOUNT_FIELDS]
+        values[ACCOUNT_FIELDS.index('active')] = 0 if account.get('active') in (False, 0) else 1
+        
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO accounts ({', '.join(ACCOUNT_FIELDS)}, updated_at)
+            VALUES ({', '.join('?' * len(ACCOUNT_FIELDS))}, CURRENT_TIMESTAMP)
+        ''', values)
+        
+        conn.commit()
+        conn.close()
+    
+    @timed_query
+    def delete_account(self, user_id):
+        """Delete an account; returns True if one existed"""
+        conn = sqlite3.connect(self.db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM accounts WHERE user_id = ?', (user_id,))
+        deleted = cursor.rowcount > 0
+        
+        conn.commit()
+        conn.close()
+        return deleted
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Side-effect-free decision engine
+Maps a normalized comment plus a config snapshot to the actions to take.
+Nothing here sends requests, writes to the database or reads mutable state,
+so strategies can be benchmarked and dry-run over large comment batches.
+"""
+
+import logging
+import zlib
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from config import Config
+from message_templates import (DM_PLACEHOLDERS, REPLY_PLACEHOLDERS, MessageTemplate, TemplateError,
+                               compile_template, compile_templates)
+
+# Direct DM messages for ManyChat strategy
+DIRECT_DM_MESSAGES = (
+    "Hi {username}! I saw your comment '{comment}' - here's the info you requested: {link} 🚀",
+    "Hey {username}! Thanks for your interest! Here's what you're looking for: {link} ✨",
+    "Hi there! I noticed you commented '{comment}' - sending you the details now: {link} 📩",
+    "Hello {username}! Here's the link you asked about: {link} Hope this helps! 🙌"
+)
+
+# Encouragement messages for public replies (fallback)
+DM_ENCOURAGEMENT_MESSAGES = (
+    "Great question! DM us '{keyword}' for the full details 📩",
+    "Interested? Send us a DM with '{keyword}' and we'll share the link! 💌",
+    "Perfect! DM '{keyword}' and we'll send you all the info privately 🔗",
+    "Thanks for asking! Send '{keyword}' in a DM and we'll hook you up! ✨",
+    "Love the interest! DM us '{keyword}' for exclusive access 🚀"
+)
+
+COMPILED_DIRECT_DM_MESSAGES = compile_templates(DIRECT_DM_MESSAGES, DM_PLACEHOLDERS)
+COMPILED_DM_ENCOURAGEMENT_MESSAGES = compile_templates(DM_ENCOURAGEMENT_MESSAGES, REPLY_PLACEHOLDERS)
+
+# Used when a saved reply template no longer compiles (e.g. edited by hand in runtime_config.json)
+FALLBACK_REPLY_TEMPLATE = compile_template("Hi @{username}! Please DM me and I'll send you the details! 📩",
+                                           REPLY_PLACEHOLDERS)
+
+
+def compile_reply_template(source: str, name: str) -> MessageTemplate:
+    """Compile a configured reply template, falling back to a safe default if it is invalid"""
+    try:
+        return compile_template(source, REPLY_PLACEHOLDERS)
+    except TemplateError as e:
+        logging.error(f"❌ Invalid {name} template, using fallback: {e}")
+        return FALLBACK_REPLY_TEMPLATE
+
+
+class KeywordMatcher:
+    """
+    Keyword matcher with the keywords lowercased once
+
+    Keywords are checked in configured order so the first listed keyword wins.
+    A plain substring loop beats a regex alternation prefilter at the keyword
+    counts campaigns use (see benchmarks/keyword_matching.py).
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = tuple(keyword for keyword in keywords if keyword)
+        self._lowered = tuple((keyword.lower(), keyword) for keyword in self.keywords)
+
+    def match(self, text_lower: str) -> Optional[str]:
+        """Return the first configured keyword contained in already-lowercased text"""
+        for lowered, keyword in self._lowered:
+            if lowered in text_lower:
+                return keyword
+        return None
+
+
+class DecisionConfig(NamedTuple):
+    """Immutable view of the settings a decision depends on"""
+    strategy: str
+    enable_direct_dm: bool
+    link: str
+    keyword_matcher: KeywordMatcher
+    consent_matcher: KeywordMatcher
+    dm_templates: Tuple[MessageTemplate, ...]
+    reply_consent: MessageTemplate
+    reply_interest: MessageTemplate
+    reply_encouragement: MessageTemplate
+
+    @classmethod
+    def from_config(cls, config=Config) -> 'DecisionConfig':
+        """Build from Config or a ConfigSnapshot (preferably via Config.derived so it is built once per version)"""
+        return cls(
+            strategy=config.KEYWORD_STRATEGY,
+            enable_direct_dm=config.ENABLE_DIRECT_DM,
+            link=config.DEFAULT_LINK,
+            keyword_matcher=KeywordMatcher(config.KEYWORDS),
+            consent_matcher=KeywordMatcher(config.CONSENT_KEYWORDS),
+            dm_templates=COMPILED_DIRECT_DM_MESSAGES,
+            reply_consent=compile_reply_template(config.COMMENT_REPLY_CONSENT, 'COMMENT_REPLY_CONSENT'),
+            reply_interest=compile_reply_template(config.COMMENT_REPLY_INTEREST, 'COMMENT_REPLY_INTEREST'),
+            reply_encouragement=compile_reply_template(config.COMMENT_REPLY_ENCOURAGEMENT,
+                                                       'COMMENT_REPLY_ENCOURAGEMENT')
+        )
+
+
+class Action(NamedTuple):
+    """A single side effect for the dispatch layer to perform"""
+    kind: str  # 'dm' (target is a user id) or 'reply' (target is a comment id)
+    target: str
+    message: str
+    action_taken: str  # Recorded in processed_comments when this action succeeds
+
+
+class Decision(NamedTuple):
+    """
+    Outcome for one comment
+
+    actions are alternatives tried in order until one succeeds (e.g. a DM
+    followed by its public reply fallback); an empty tuple means no action.
+    """
+    comment_id: str
+    keyword: Optional[str]
+    actions: Tuple[Action, ...]
+    reason: str
+
+
+def render_direct_dm(cfg: DecisionConfig, comment_id: str, username: str, comment_text: str, keyword: str) -> str:
+    """Render a DM, picking the template deterministically from the comment id"""
+    template = cfg.dm_templates[zlib.crc32(comment_id.encode('utf-8')) % len(cfg.dm_templates)]
+    return template.render({
+        'username': username,
+        'comment': comment_text[:30] + "..." if len(comment_text) > 30 else comment_text,
+        'keyword': keyword.upper(),
+        'link': cfg.link
+    })
+
+
+def decide(comment, cfg: DecisionConfig) -> Decision:
+    """
+    Decide what to do about a comment
+
+    Args:
+        comment: Object with comment_id, text, author_id and author_username
+        cfg: DecisionConfig snapshot
+
+    Returns:
+        Decision listing the actions to attempt
+    """
+    text = comment.text
+    text_lower = text.lower()
+
+    keyword = cfg.keyword_matcher.match(text_lower)
+    if not keyword:
+        return Decision(comment.comment_id, None, (), 'no_keyword')
+
+    if not cfg.enable_direct_dm or not comment.author_id:
+        return Decision(comment.comment_id, keyword, (), 'dm_disabled_or_no_author')
+
+    username = comment.author_username
+    reply_values = {'username': username, 'keyword': keyword, 'link': cfg.link}
+
+    if cfg.strategy == 'consent_required':
+        if cfg.consent_matcher.match(text_lower):
+            return Decision(comment.comment_id, keyword, (
+                Action('dm', comment.author_id,
+                       render_direct_dm(cfg, comment.comment_id, username, text, keyword),
+                       'direct_dm_sent_with_consent'),
+                Action('reply', comment.comment_id,
+                       cfg.reply_consent.render(reply_values),
+                       'comment_reply_fallback')
+            ), 'consent')
+
+        return Decision(comment.comment_id, keyword, (
+            Action('reply', comment.comment_id,
+                   cfg.reply_encouragement.render(reply_values),
+                   'encouraged_to_dm'),
+        ), 'no_consent')
+
+    if cfg.strategy == 'any_keyword':
+        return Decision(comment.comment_id, keyword, (
+            Action('dm', comment.author_id,
+                   render_direct_dm(cfg, comment.comment_id, username, text, keyword),
+                   'direct_dm_sent_any_keyword'),
+            Action('reply', comment.comment_id,
+                   cfg.reply_interest.render(reply_values),
+                   'comment_reply_fallback_any_keyword')
+        ), 'any_keyword')
+
+    return Decision(comment.comment_id, keyword, (), 'unknown_strategy')
+
+
+def decide_batch(comments: Iterable, cfg: DecisionConfig,
+                 config_for: Optional[Callable[[str, DecisionConfig], DecisionConfig]] = None) -> List[Decision]:
+    """
+    Evaluate many comments against one config snapshot
+
+    Args:
+        comments: Normalized comments
+        cfg: Global DecisionConfig
+        config_for: Optional (media_id, cfg) -> DecisionConfig lookup for
+            per-post rules such as CampaignIndex.config_for
+    """
+    if config_for is None:
+        return [decide(comment, cfg) for comment in comments]
+    return [decide(comment, config_for(comment.media_id, cfg)) for comment in comments]
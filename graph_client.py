@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for Instagram Graph API calls
+Pools connections, caps the number of concurrent requests per host and
+records latency and status per endpoint
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import tracing
+from config import Config
+
+_session = None
+_session_lock = threading.Lock()
+
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+def api_url(path: str, versioned: bool = True) -> str:
+    """Absolute Graph API URL for a path such as 'me/messages' (honours GRAPH_API_BASE_URL)"""
+    base = Config.GRAPH_API_BASE_URL.rstrip('/')
+    if versioned:
+        base = f"{base}/{Config.GRAPH_API_VERSION}"
+    return f"{base}/{str(path).lstrip('/')}"
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                pool_size = max(Config.GRAPH_API_MAX_CONCURRENCY_PER_HOST, 1)
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def reset_after_fork():
+    """Drop the session and per-host slots inherited from a parent process"""
+    global _session, _session_lock, _host_limits_lock
+    _session = None
+    _session_lock = threading.Lock()
+    _host_limits.clear()
+    _host_limits_lock = threading.Lock()
+
+
+def _host_semaphore(host: str) -> threading.BoundedSemaphore:
+    """Get the semaphore limiting in-flight requests to a host"""
+    semaphore = _host_limits.get(host)
+    if semaphore is None:
+        with _host_limits_lock:
+            semaphore = _host_limits.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(max(Config.GRAPH_API_MAX_CONCURRENCY_PER_HOST, 1))
+                _host_limits[host] = semaphore
+    return semaphore
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """Send a request, waiting for a free slot on the target host first"""
+    host = urlsplit(url).netloc
+    endpoint = metrics.endpoint_label(url)
+
+    metrics.adjust_queue_depth('graph_api_waiting', 1)
+    semaphore = _host_semaphore(host)
+    semaphore.acquire()
+    metrics.adjust_queue_depth('graph_api_waiting', -1)
+
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        with tracing.span(f'graph {method} {endpoint}') as span:
+            response = get_session().request(method, url, **kwargs)
+            status = str(response.status_code)
+            if span is not None:
+                span.attributes['status'] = status
+            return response
+    finally:
+        semaphore.release()
+        metrics.GRAPH_API_LATENCY.labels(method, endpoint).observe(time.perf_counter() - started)
+        metrics.GRAPH_API_RESPONSES.labels(method, endpoint, status).inc()
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request('POST', url, **kwargs)
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parse a Graph API timestamp such as 2024-05-01T10:00:00+0000"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    except ValueError:
+        return None
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Local Instagram Graph API stub
+Implements the endpoints the bot uses with synthetic data, configurable
+latency, injected 429/5xx responses and X-App-Usage headers, so the bot and
+the benchmarks can run offline:
+
+    python graph_stub.py --port 5055 --profile realistic
+    GRAPH_API_BASE_URL=http://127.0.0.1:5055 python web_app.py
+
+Control endpoints: GET/POST /_stub/profile, GET /_stub/stats, POST /_stub/reset,
+POST /_stub/comments (seed comments on a post).
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+# Latency in ms (base + uniform jitter), failure rates as fractions of requests,
+# and the hourly call budget behind X-App-Usage (None = unlimited)
+PROFILES = {
+    'fast': {'latency_ms': 0, 'jitter_ms': 0, 'error_rate': 0.0, 'throttle_rate': 0.0, 'calls_per_hour': None},
+    'realistic': {'latency_ms': 120, 'jitter_ms': 80, 'error_rate': 0.002, 'throttle_rate': 0.0,
+                  'calls_per_hour': 4800},
+    'degraded': {'latency_ms': 400, 'jitter_ms': 400, 'error_rate': 0.05, 'throttle_rate': 0.02,
+                 'calls_per_hour': 4800},
+    'throttled': {'latency_ms': 80, 'jitter_ms': 40, 'error_rate': 0.0, 'throttle_rate': 0.0,
+                  'calls_per_hour': 600},
+}
+
+STUB_USER_ID = '17841400000000000'
+STUB_USERNAME = 'stub_account'
+DEFAULT_MEDIA_COUNT = 10
+DEFAULT_COMMENTS_PER_MEDIA = 120
+
+
+class StubState:
+    """Synthetic account data, the active fault profile and call accounting"""
+
+    def __init__(self, profile: str = 'fast', seed: int = 0, media_count: int = DEFAULT_MEDIA_COUNT,
+                 comments_per_media: int = DEFAULT_COMMENTS_PER_MEDIA):
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.media_count = media_count
+        self.comments_per_media = comments_per_media
+        self.set_profile(profile)
+        self.reset()
+
+    def set_profile(self, name: str, **overrides):
+        """Switch to a named profile, optionally overriding some of its settings"""
+        self.profile = dict(PROFILES[name])
+        self.profile_name = name
+        self.update_profile(**overrides)
+
+    def update_profile(self, **overrides):
+        overrides = {key: value for key, value in overrides.items() if key in self.profile}
+        if overrides:
+            self.profile.update(overrides)
+            self.profile_name = f"{self.profile_name.split('+')[0]}+custom"
+
+    def reset(self):
+        with self.lock:
+            self.calls = Counter()
+            self.responses = Counter()
+            self.call_times = deque()
+            self.messages: List[Dict] = []
+            self.replies: List[Dict] = []
+            self.media = self._generate_media()
+
+    def _generate_media(self) -> Dict[str, Dict]:
+        """Posts (newest first) with comments (newest first), deterministic for a seed"""
+        rng = random.Random(self.seed)
+        now = datetime.now(timezone.utc)
+        media = {}
+        for index in range(self.media_count):
+            media_id = str(18000000000000000 + index)
+            posted = now - timedelta(hours=6 * index + 1)
+            comments = []
+            for number in range(self.comments_per_media):
+                author = rng.randint(1, 5000)
+                comments.append({
+                    'id': f'{media_id}_{number}',
+                    'text': rng.choice(['link please', 'info', 'wow 😍', 'send it', 'how much?', 'nice']),
+                    'username': f'user{author}',
+                    'timestamp': (posted + timedelta(seconds=30 * number)).strftime('%Y-%m-%dT%H:%M:%S+0000'),
+                    'from': {'id': str(9000000 + author), 'username': f'user{author}'}
+                })
+            comments.reverse()
+            media[media_id] = {
+                'id': media_id,
+                'caption': f'Stub post {index}',
+                'media_type': 'CAROUSEL_ALBUM' if index % 3 == 0 else 'IMAGE',
+                'media_url': f'https://example.invalid/{media_id}.jpg',
+                'permalink': f'https://www.instagram.com/p/stub{index}/',
+                'timestamp': posted.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+                'like_count': rng.randint(0, 5000),
+                'comments': comments
+            }
+        return media
+
+    # Fault injection
+
+    def usage_percent(self) -> int:
+        budget = self.profile['calls_per_hour']
+        if not budget:
+            return 0
+        return min(100, int(len(self.call_times) * 100 / budget))
+
+    def admit(self, endpoint: str):
+        """Account for one call; returns an error response tuple if one is injected"""
+        with self.lock:
+            now = time.monotonic()
+            self.calls[endpoint] += 1
+            self.call_times.append(now)
+            while self.call_times and self.call_times[0] < now - 3600:
+                self.call_times.popleft()
+            usage = self.usage_percent()
+            roll = self.random.random()
+            delay = (self.profile['latency_ms'] + self.random.uniform(0, self.profile['jitter_ms'])) / 1000
+
+        if delay:
+            time.sleep(delay)
+
+        if usage >= 100 or roll < self.profile['throttle_rate']:
+            return graph_error(429, 4, 'Application request limit reached', 'OAuthException')
+        if roll < self.profile['throttle_rate'] + self.profile['error_rate']:
+            return graph_error(500, 2, 'An unexpected error has occurred. Please retry your request later.',
+                               'OAuthException')
+        return None
+
+    def stats(self) -> Dict:
+        with self.lock:
+            recipients = Counter(message['recipient_id'] for message in self.messages)
+            return {
+                'profile': self.profile_name,
+                'settings': dict(self.profile),
+                'calls': dict(self.calls),
+                'responses': dict(self.responses),
+                'usage_percent': self.usage_percent(),
+                'messages_sent': len(self.messages),
+                'replies_sent': len(self.replies),
+                'duplicate_message_recipients': sum(1 for count in recipients.values() if count > 1)
+            }
+
+
+def graph_error(status: int, code: int, message: str, error_type: str):
+    return jsonify({'error': {'message': message, 'type': error_type, 'code': code,
+                              'fbtrace_id': f'stub{random.getrandbits(32):08x}'}}), status
+
+
+def paginate(items: List[Dict], limit: int, after: Optional[str], base_url: str, params: Dict) -> Dict:
+    """Cursor paging in Graph API shape (cursors are list offsets)"""
+    start = int(after or 0)
+    page = items[start:start + limit]
+    result = {'data': page}
+    if page:
+        result['paging'] = {'cursors': {'before': str(start), 'after': str(start + len(page))}}
+        if start + len(page) < len(items):
+            result['paging']['next'] = f"{base_url}?{urlencode({**params, 'after': start + len(page)})}"
+    return result
+
+
+def parse_fields(fields: str) -> Dict[str, Optional[int]]:
+    """Top-level field names, with the limit of an expanded edge such as comments.limit(50){...}"""
+    parsed = {}
+    depth = 0
+    current = ''
+    for char in fields + ',':
+        if char in '{(':
+            depth += 1
+        elif char in '})':
+            depth -= 1
+        if char == ',' and depth == 0:
+            name, _, rest = current.partition('.limit(')
+            parsed[name.split('{')[0]] = int(rest.split(')')[0]) if rest else None
+            current = ''
+        else:
+            current += char
+    return parsed
+
+
+def create_app(state: StubState) -> Flask:
+    app = Flask(__name__)
+    app.config['STUB_STATE'] = state
+
+    def payload() -> Dict:
+        return request.get_json(silent=True) or request.form.to_dict() or {}
+
+    def guarded(endpoint: str):
+        """Apply latency, faults and the access-token check; returns an error response or None"""
+        injected = state.admit(endpoint)
+        if injected:
+            return injected
+        if not (request.values.get('access_token') or payload().get('access_token')
+                or request.headers.get('Authorization')):
+            return graph_error(400, 190, 'Invalid OAuth access token - Cannot parse access token', 'OAuthException')
+        return None
+
+    @app.after_request
+    def usage_headers(response):
+        if not request.path.startswith('/_stub'):
+            with state.lock:
+                state.responses[str(response.status_code)] += 1
+                usage = state.usage_percent()
+            response.headers['X-App-Usage'] = json.dumps(
+                {'call_count': usage, 'total_cputime': usage // 2, 'total_time': usage // 2})
+        return response
+
+    # Graph API
+
+    @app.route('/refresh_access_token')
+    def refresh_access_token():
+        error = guarded('refresh_access_token')
+        if error:
+            return error
+        return jsonify({'access_token': f'stub-token-{int(time.time())}', 'token_type': 'bearer',
+                        'expires_in': 5184000})
+
+    @app.route('/<version>/me/messages', methods=['POST'])
+    @app.route('/<version>/<user_id>/messages', methods=['POST'])
+    def send_message(version, user_id='me'):
+        error = guarded('messages')
+        if error:
+            return error
+        data = payload()
+        recipient = data.get('recipient') or {}
+        if isinstance(recipient, str):
+            recipient = json.loads(recipient)
+        with state.lock:
+            message_id = f'm_stub_{len(state.messages) + 1}'
+            state.messages.append({'recipient_id': str(recipient.get('id') or recipient.get('comment_id')),
+                                   'message_id': message_id, 'at': time.time()})
+        return jsonify({'recipient_id': recipient.get('id'), 'message_id': message_id})
+
+    @app.route('/<version>/<comment_id>/replies', methods=['POST'])
+    def reply(version, comment_id):
+        error = guarded('replies')
+        if error:
+            return error
+        with state.lock:
+            reply_id = f'{comment_id}_reply_{len(state.replies) + 1}'
+            state.replies.append({'comment_id': comment_id, 'id': reply_id, 'message': payload().get('message')})
+        return jsonify({'id': reply_id})
+
+    @app.route('/<version>/<user_id>/subscribed_apps', methods=['POST'])
+    def subscribed_apps(version, user_id):
+        error = guarded('subscribed_apps')
+        return error or jsonify({'success': True})
+
+    @app.route('/<version>/<user_id>/media')
+    def media(version, user_id):
+        error = guarded('media')
+        if error:
+            return error
+        fields = parse_fields(request.args.get('fields', 'id'))
+        comments_limit = fields.get('comments') or 25
+        posts = []
+        for post in state.media.values():
+            item = {key: value for key, value in post.items() if key in fields and key != 'comments'}
+            item['id'] = post['id']
+            if 'comments_count' in fields:
+                item['comments_count'] = len(post['comments'])
+            if 'comments' in fields:
+                item['comments'] = paginate(post['comments'], comments_limit, None,
+                                            request.host_url + f"{version}/{post['id']}/comments",
+                                            {'limit': comments_limit, 'access_token': request.args.get('access_token', '')})
+            posts.append(item)
+        limit = int(request.args.get('limit', 25))
+        return jsonify(paginate(posts, limit, request.args.get('after'), request.base_url, {
+            'fields': request.args.get('fields', 'id'), 'limit': limit,
+            'access_token': request.args.get('access_token', '')}))
+
+    @app.route('/<version>/<media_id>/comments')
+    def comments(version, media_id):
+        error = guarded('comments')
+        if error:
+            return error
+        post = state.media.get(media_id)
+        if post is None:
+            return graph_error(400, 100, f'Unsupported get request. Object with ID \'{media_id}\' does not exist',
+                               'GraphMethodException')
+        limit = int(request.args.get('limit', 25))
+        return jsonify(paginate(post['comments'], limit, request.args.get('after'), request.base_url, {
+            'fields': request.args.get('fields', 'id,text'), 'limit': limit,
+            'access_token': request.args.get('access_token', '')}))
+
+    @app.route('/<version>/<object_id>')
+    def user(version, object_id):
+        error = guarded('user')
+        if error:
+            return error
+        return jsonify({'id': object_id if object_id != 'me' else STUB_USER_ID, 'username': STUB_USERNAME,
+                        'account_type': 'BUSINESS', 'media_count': len(state.media),
+                        'followers_count': 1234})
+
+    # Stub control
+
+    @app.route('/_stub/profile', methods=['GET', 'POST'])
+    def profile():
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            name = data.pop('profile', None)
+            if name and name not in PROFILES:
+                return jsonify({'error': f'Unknown profile {name}', 'profiles': sorted(PROFILES)}), 400
+            if name:
+                state.set_profile(name, **data)
+            else:
+                state.update_profile(**data)
+        return jsonify({'profile': state.profile_name, 'settings': state.profile})
+
+    @app.route('/_stub/stats')
+    def stub_stats():
+        return jsonify(state.stats())
+
+    @app.route('/_stub/reset', methods=['POST'])
+    def reset():
+        state.reset()
+        return jsonify({'success': True})
+
+    @app.route('/_stub/comments', methods=['POST'])
+    def seed_comments():
+        """Prepend comments to a post: {"media_id": ..., "comments": [{"id", "text", "from": {...}}]}"""
+        data = request.get_json(silent=True) or {}
+        post = state.media.get(str(data.get('media_id')))
+        if post is None:
+            return jsonify({'error': 'Unknown media_id', 'media_ids': list(state.media)}), 404
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+0000')
+        seeded = [{'timestamp': now, 'username': (comment.get('from') or {}).get('username'), **comment}
+                  for comment in data.get('comments', [])]
+        with state.lock:
+            post['comments'][:0] = list(reversed(seeded))
+        return jsonify({'success': True, 'comments': len(post['comments'])})
+
+    return app
+
+
+class StubServer:
+    """Run the stub on a background thread (for benchmarks and scripts)"""
+
+    def __init__(self, profile: str = 'fast', host: str = '127.0.0.1', port: int = 0, **state_options):
+        self.state = StubState(profile, **state_options)
+        self.server = make_server(host, port, create_app(self.state), threaded=True)
+        self.base_url = f'http://{host}:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever, name='graph-stub', daemon=True)
+
+    def __enter__(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Instagram Graph API stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='realistic')
+    parser.add_argument('--latency-ms', type=float, help='Override the profile base latency')
+    parser.add_argument('--error-rate', type=float, help='Override the fraction of 500 responses')
+    parser.add_argument('--throttle-rate', type=float, help='Override the fraction of 429 responses')
+    parser.add_argument('--media', type=int, default=DEFAULT_MEDIA_COUNT, help='Synthetic posts')
+    parser.add_argument('--comments', type=int, default=DEFAULT_COMMENTS_PER_MEDIA, help='Synthetic comments per post')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stub_state = StubState(args.profile, seed=args.seed, media_count=args.media, comments_per_media=args.comments)
+    overrides = {'latency_ms': args.latency_ms, 'error_rate': args.error_rate, 'throttle_rate': args.throttle_rate}
+    stub_state.update_profile(**{key: value for key, value in overrides.items() if value is not None})
+
+    print(f"🧪 Graph API stub on http://{args.host}:{args.port} (profile: {args.profile})")
+    print(f"   Point the bot at it with GRAPH_API_BASE_URL=http://{args.host}:{args.port}")
+    create_app(stub_state).run(host=args.host, port=args.port, threaded=True)
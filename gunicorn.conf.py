@@ -0,0 +1,66 @@
+# Gunicorn configuration for the webhook server
+# Usage: gunicorn -c gunicorn.conf.py web_app:app (see Procfile)
+#
+# The app is imported once in the master (preload_app) and forked into
+# workers, which then reset inherited pools/handles and start their own
+# background threads. Workers are threaded (gthread) because the workload is
+# I/O-bound: a slow Graph API call or an open /api/events stream occupies one
+# thread, not a whole worker.
+
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# gthread (default) or a cooperative worker such as gevent (requires gevent installed)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '500'))  # gevent/eventlet only
+
+# Cooperative workers must monkey-patch before the app is imported, so they load it per worker
+preload_app = worker_class not in ('gevent', 'eventlet')
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically; with preload a new worker is a cheap fork
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = 500
+
+accesslog = '-'
+errorlog = '-'
+
+# Metrics from all workers are aggregated through this directory; start clean
+# (must be set before the app, and therefore prometheus_client, is imported)
+PROMETHEUS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+shutil.rmtree(PROMETHEUS_DIR, ignore_errors=True)
+os.makedirs(PROMETHEUS_DIR, exist_ok=True)
+
+if preload_app:
+    # Don't start warm-up threads in the master; each worker starts its own
+    os.environ['WEB_APP_DEFER_STARTUP'] = '1'
+
+
+def when_ready(server):
+    server.log.info(f"🚀 Master ready: {workers} {worker_class} workers x {threads} threads (preload={preload_app})")
+
+
+def post_fork(server, worker):
+    """Reset state copied from the master before the worker serves anything"""
+    if preload_app:
+        import web_app
+        web_app.after_fork()
+
+
+def post_worker_init(worker):
+    """Start background threads and signal handlers (after gunicorn installs its own)"""
+    import web_app
+    web_app.start_background_work()
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the aggregated metrics"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -4,22 +4,57 @@ Instagram Business API Client
 Uses official Instagram Graph API for professional DM automation
 """
 
-import requests
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import graph_client
 from config import Config
+from database import Database
+from instagram_bot import InstagramBot
+
+COMMENT_FIELDS = 'id,text,username,timestamp,from{id,username}'
+
+class CommentWalk(NamedTuple):
+    """Result of walking a post's comments from the newest towards the watermark"""
+    comments: List[Dict]  # comments not handled by earlier walks, newest first
+    complete: bool  # read down to the watermark (or the oldest comment)
+    resume_after: Optional[str]  # paging cursor the next walk continues from when incomplete
+    head: Optional[Tuple[str, str]]  # newest comment handled by an earlier partial walk, if any
+
+def request_token_refresh(access_token: str) -> Optional[Tuple[str, int]]:
+    """
+    Exchange a long-lived access token for a fresh one
+    
+    Returns:
+        (new_token, expires_in_seconds), or None if the refresh failed
+    """
+    response = graph_client.get(graph_client.api_url('refresh_access_token', versioned=False), params={
+        'grant_type': 'ig_refresh_token',
+        'access_token': access_token
+    })
+    if response.status_code != 200:
+        logging.error(f"❌ Token refresh failed: {response.status_code} - {response.text}")
+        return None
+    
+    token_data = response.json()
+    if not token_data.get('access_token'):
+        logging.error("❌ No new access token in refresh response")
+        return None
+    return token_data['access_token'], token_data.get('expires_in', 5184000)  # 60 days
 
 class InstagramBusinessAPI:
     """Instagram Business API client for DM automation using official Graph API"""
     
-    def __init__(self):
+    def __init__(self, pipeline=None):
         self.access_token = Config.INSTAGRAM_ACCESS_TOKEN
         self.user_id = Config.INSTAGRAM_USER_ID
-        self.base_url = "https://graph.instagram.com/v21.0"
+        self.base_url = graph_client.api_url('').rstrip('/')
         self.logged_in = False
         self.last_login_check = None
+        self.db = Database()
+        self.pipeline = pipeline
         
         # Configure logging
         self.logger = logging.getLogger(__name__)
@@ -41,7 +76,7 @@ class InstagramBusinessAPI:
                 'access_token': self.access_token
             }
             
-            response = requests.get(url, params=params)
+            response = graph_client.get(url, params=params)
             
             if response.status_code == 200:
                 user_data = response.json()
@@ -78,7 +113,7 @@ class InstagramBusinessAPI:
                 'access_token': self.access_token
             }
             
-            response = requests.get(url, params=params)
+            response = graph_client.get(url, params=params)
             
             if response.status_code == 200:
                 conversations = response.json().get('data', [])
@@ -123,7 +158,7 @@ class InstagramBusinessAPI:
                 }
             }
             
-            response = requests.post(url, headers=headers, json=data)
+            response = graph_client.post(url, headers=headers, json=data)
             
             if response.status_code == 200:
                 self.logger.info(f"✅ Message sent successfully to {recipient_id}")
@@ -136,12 +171,14 @@ class InstagramBusinessAPI:
             self.logger.error(f"❌ Error sending message: {e}")
             return False
     
-    def get_media_posts(self, limit: int = 25) -> List[Dict]:
+    def get_media_posts(self, limit: int = 25, with_comments: bool = False) -> List[Dict]:
         """
         Get Instagram posts using Business API
         
         Args:
             limit: Maximum number of posts to retrieve
+            with_comments: Expand the first page of each post's comments into
+                the same request (returned under post['comments'])
             
         Returns:
             List of post data dictionaries
@@ -151,14 +188,18 @@ class InstagramBusinessAPI:
                 if not self.login():
                     return []
             
+            fields = 'id,caption,media_type,media_url,permalink,timestamp,comments_count,like_count'
+            if with_comments:
+                fields += f",comments.limit({Config.COMMENTS_PAGE_SIZE}){{{COMMENT_FIELDS}}}"
+            
             url = f"{self.base_url}/{self.user_id}/media"
             params = {
-                'fields': 'id,caption,media_type,media_url,permalink,timestamp,comments_count,like_count',
+                'fields': fields,
                 'limit': limit,
                 'access_token': self.access_token
             }
             
-            response = requests.get(url, params=params)
+            response = graph_client.get(url, params=params)
             
             if response.status_code == 200:
                 posts = response.json().get('data', [])
@@ -172,40 +213,142 @@ class InstagramBusinessAPI:
             self.logger.error(f"Error getting media posts: {e}")
             return []
     
-    def get_post_comments(self, post_id: str) -> List[Dict]:
+    def get_post_comments(self, post_id: str, since: Optional[Tuple[str, str]] = None,
+                          first_page: Optional[Dict] = None,
+                          resume: Optional[Tuple[str, str, str]] = None) -> CommentWalk:
         """
-        Get comments on a specific post
+        Get comments on a specific post, following paging cursors
+        
+        The comments edge returns the newest comments first, so paging stops
+        as soon as a page reaches the watermark instead of walking the whole
+        comment history. At most MAX_COMMENT_PAGES requests are made; a walk
+        cut short returns the cursor to continue from, and the next walk
+        (given it as resume) reads the newest comments down to the head of the
+        partial walk and then carries on from the cursor towards the watermark.
         
         Args:
             post_id: Instagram media ID
+            since: Optional (comment_id, timestamp) watermark; only comments
+                newer than it are returned
+            first_page: Comments page already fetched through field expansion;
+                paging continues from its cursor only if it does not reach
+                the watermark
+            resume: Optional (after cursor, head comment_id, head timestamp)
+                left by an earlier partial walk (Database.get_comment_walk)
             
         Returns:
-            List of comment data dictionaries
+            CommentWalk; it is incomplete when it stopped at MAX_COMMENT_PAGES
+            or on a failed request
         """
+        head = (resume[1], resume[2]) if resume else None
         try:
             if not self.logged_in:
                 if not self.login():
-                    return []
+                    return CommentWalk([], False, resume[0] if resume else None, head)
             
-            url = f"{self.base_url}/{post_id}/comments"
-            params = {
-                'fields': 'id,text,username,timestamp,from{id,username}',
-                'access_token': self.access_token
-            }
+            budget = Config.MAX_COMMENT_PAGES
             
-            response = requests.get(url, params=params)
+            # Newest comments first, down to what the partial walk already handled
+            comments, reached, resume_after, pages = self._walk_comments(post_id, head or since, first_page, None,
+                                                                         budget)
             
-            if response.status_code == 200:
-                comments = response.json().get('data', [])
-                self.logger.info(f"Retrieved {len(comments)} comments for post {post_id}")
-                return comments
-            else:
-                self.logger.warning(f"Failed to get comments for post {post_id}: {response.status_code}")
-                return []
+            # Then the gap the partial walk left above the watermark
+            if reached and resume:
+                older, reached, resume_after, more_pages = self._walk_comments(
+                    post_id, since, None, resume[0], budget - pages
+                )
+                comments.extend(older)
+                pages += more_pages
+            
+            if not reached:
+                self.logger.warning(f"⚠️ Comments for post {post_id} not read back to the watermark ({pages} page(s)), "
+                                    f"the next walk resumes below them")
+            
+            self.logger.info(f"Retrieved {len(comments)} new comments for post {post_id} ({pages} page(s))")
+            return CommentWalk(comments, reached, None if reached else resume_after, head)
                 
         except Exception as e:
             self.logger.error(f"Error getting comments for post {post_id}: {e}")
-            return []
+            return CommentWalk([], False, resume[0] if resume else None, head)
+    
+    def _walk_comments(self, post_id: str, stop_at: Optional[Tuple[str, str]], first_page: Optional[Dict],
+                       after: Optional[str], max_pages: int) -> Tuple[List[Dict], bool, Optional[str], int]:
+        """
+        Page down a post's comments until stop_at (or the oldest comment)
+        
+        Starts from first_page, from the after cursor, or from the newest comment.
+        
+        Returns:
+            (comments newer than stop_at, whether stop_at or the oldest comment
+            was reached, cursor of the first unread page, requests made)
+        """
+        comments = []
+        pages = 0
+        url = f"{self.base_url}/{post_id}/comments"
+        params = {
+            'fields': COMMENT_FIELDS,
+            'limit': Config.COMMENTS_PAGE_SIZE,
+            'access_token': self.access_token
+        }
+        if after:
+            params['after'] = after
+        
+        if first_page is not None:
+            new_comments, reached = self._comments_after_watermark(first_page.get('data', []), stop_at)
+            comments.extend(new_comments)
+            paging = first_page.get('paging', {})
+            if reached or not paging.get('next'):
+                return comments, True, None, pages
+            params['after'] = after = paging.get('cursors', {}).get('after')
+        
+        while pages < max_pages:
+            response = graph_client.get(url, params=params)
+            pages += 1
+            
+            if response.status_code != 200:
+                self.logger.warning(f"Failed to get comments for post {post_id}: {response.status_code}")
+                return comments, False, after, pages
+            
+            payload = response.json()
+            new_comments, reached = self._comments_after_watermark(payload.get('data', []), stop_at)
+            comments.extend(new_comments)
+            
+            paging = payload.get('paging', {})
+            if reached or not paging.get('next'):
+                return comments, True, None, pages
+            
+            # Rebuilt from the cursor (not the 'next' URL) so a stored resume point carries no token
+            params['after'] = after = paging.get('cursors', {}).get('after')
+        
+        return comments, False, after, pages
+    
+    def _comments_after_watermark(self, page: List[Dict], since: Optional[Tuple[str, str]]) -> Tuple[List[Dict], bool]:
+        """
+        Split a page of comments at the watermark
+        
+        Returns:
+            (comments newer than the watermark, whether the watermark was reached)
+        """
+        if not since:
+            return page, False
+        
+        last_id, last_timestamp = since
+        last_time = graph_client.parse_timestamp(last_timestamp)
+        
+        newer = []
+        for comment in page:
+            if comment.get('id') == last_id:
+                return newer, True
+            
+            # Timestamps have one-second resolution: comments from the watermark's
+            # second are kept and the pipeline's dedupe drops the ones already seen
+            comment_time = graph_client.parse_timestamp(comment.get('timestamp'))
+            if last_time and comment_time and comment_time < last_time:
+                return newer, True
+            
+            newer.append(comment)
+        
+        return newer, False
     
     def refresh_access_token(self) -> bool:
         """
@@ -216,43 +359,36 @@ class InstagramBusinessAPI:
             True if token was refreshed successfully
         """
         try:
-            url = "https://graph.instagram.com/refresh_access_token"
-            params = {
-                'grant_type': 'ig_refresh_token',
-                'access_token': self.access_token
-            }
+            refreshed = request_token_refresh(self.access_token)
+            if not refreshed:
+                return False
             
-            response = requests.get(url, params=params)
+            new_token, expires_in = refreshed
             
-            if response.status_code == 200:
-                token_data = response.json()
-                new_token = token_data.get('access_token')
-                expires_in = token_data.get('expires_in', 5184000)  # 60 days
-                
-                if new_token:
-                    # Update configuration with new token
-                    Config.INSTAGRAM_ACCESS_TOKEN = new_token
-                    Config.save_runtime_config()
-                    
-                    self.access_token = new_token
-                    self.logger.info(f"✅ Access token refreshed successfully (expires in {expires_in} seconds)")
-                    return True
-                else:
-                    self.logger.error("❌ No new access token in refresh response")
-                    return False
-            else:
-                self.logger.error(f"❌ Token refresh failed: {response.status_code} - {response.text}")
-                return False
+            # Update configuration with new token
+            Config.update(INSTAGRAM_ACCESS_TOKEN=new_token)
+            
+            self.access_token = new_token
+            self.logger.info(f"✅ Access token refreshed successfully (expires in {expires_in} seconds)")
+            return True
                 
         except Exception as e:
             self.logger.error(f"❌ Error refreshing access token: {e}")
             return False
     
-    def run_monitoring_cycle(self) -> bool:
+    def run_monitoring_cycle(self, scheduler=None) -> bool:
         """
         Run a complete monitoring cycle using Business API
         This replaces the screen scraping approach with official API calls
         
+        Args:
+            scheduler: Optional AdaptivePollScheduler; when given, only the
+                posts it marks as due have their comments fetched
+        
+        New comments are handed to the shared CommentPipeline, so keyword
+        matching, deduplication, DM limits and recording behave exactly as
+        they do for webhooks.
+        
         Returns:
             True if cycle completed successfully
         """
@@ -263,8 +399,12 @@ class InstagramBusinessAPI:
                 if not self.login():
                     return False
             
-            # Get recent posts
-            posts = self.get_media_posts(Config.MAX_POSTS_TO_CHECK)
+            if self.pipeline is None:
+                self.pipeline = InstagramBot().pipeline
+            self.pipeline.campaigns.refresh()
+            
+            # Get recent posts with the first page of their comments in one call
+            posts = self.get_media_posts(Config.MAX_POSTS_TO_CHECK, with_comments=True)
             
             if not posts:
                 self.logger.warning("No posts retrieved from API")
@@ -272,23 +412,25 @@ class InstagramBusinessAPI:
             
             processed_count = 0
             
-            for post in posts:
+            # Fetch stage: all monitored posts concurrently, results in post order
+            monitored_posts = [post for post in posts if self.should_monitor_post(post)]
+            if scheduler is not None:
+                monitored_posts = scheduler.due_posts(monitored_posts)
+            
+            for post, walk in self.fetch_new_comments(monitored_posts, expanded=True):
                 try:
                     post_id = post['id']
-                    caption = post.get('caption', '')
-                    timestamp = post.get('timestamp', '')
                     
-                    # Check if post matches monitoring criteria
-                    if self.should_monitor_post(post):
-                        # Get comments for this post
-                        comments = self.get_post_comments(post_id)
-                        
-                        # Process comments that match keywords
-                        for comment in comments:
-                            if self.should_process_comment(comment):
-                                success = self.process_comment(comment, post)
-                                if success:
-                                    processed_count += 1
+                    # Process oldest first so the watermark only moves forward
+                    processed_count += self.pipeline.process_batch(
+                        reversed(walk.comments), source='poll', media_id=post_id, raise_errors=True
+                    )
+                    
+                    self.save_walk(post_id, walk, walk.comments[0] if walk.comments else None)
+                    
+                    # Only a poll that got through its comments counts for scheduling
+                    if walk.complete and scheduler is not None:
+                        scheduler.mark_polled(post_id, post.get('comments_count') or 0)
                 
                 except Exception as e:
                     self.logger.error(f"Error processing post {post.get('id', 'unknown')}: {e}")
@@ -301,51 +443,70 @@ class InstagramBusinessAPI:
             self.logger.error(f"❌ Error in monitoring cycle: {e}")
             return False
     
-    def should_monitor_post(self, post: Dict) -> bool:
-        """Check if a post should be monitored based on configuration"""
-        # Add your post filtering logic here
-        # For now, monitor all posts
-        return True
-    
-    def should_process_comment(self, comment: Dict) -> bool:
-        """Check if a comment should be processed based on keywords"""
-        comment_text = comment.get('text', '').lower()
+    def fetch_new_comments(self, posts: List[Dict], expanded: bool = False) -> List[Tuple[Dict, CommentWalk]]:
+        """
+        Fetch new comments for several posts concurrently
         
-        # Check for configured keywords
-        for keyword in Config.KEYWORDS:
-            if keyword.lower() in comment_text:
-                return True
+        Requests run on a bounded thread pool and are further capped per host
+        by graph_client, so a cycle takes roughly as long as its slowest posts.
         
-        return False
+        Args:
+            posts: Media dictionaries
+            expanded: Posts came from get_media_posts(with_comments=True); their
+                embedded first page is used and only posts with more new
+                comments than fit on it cost an extra request
+        
+        Returns:
+            List of (post, CommentWalk) in the same order as posts
+        """
+        if not posts:
+            return []
+        
+        walks = [self.db.get_comment_walk(post['id']) for post in posts]
+        # The comments field is omitted entirely for posts without comments
+        first_pages = [post.get('comments', {'data': []}) if expanded else None for post in posts]
+        workers = max(1, min(Config.POLL_MAX_WORKERS, len(posts)))
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poll-fetch') as executor:
+            results = list(executor.map(
+                lambda args: self.get_post_comments(args[0]['id'], since=args[1][0], first_page=args[2],
+                                                    resume=args[1][1]),
+                zip(posts, walks, first_pages)
+            ))
+        
+        return list(zip(posts, results))
     
-    def process_comment(self, comment: Dict, post: Dict) -> bool:
-        """Process a comment that matches criteria and send DM"""
-        try:
-            comment_author = comment.get('from', {})
-            author_id = comment_author.get('id')
-            author_username = comment_author.get('username', 'unknown')
-            
-            if not author_id:
-                self.logger.warning(f"No author ID found for comment from @{author_username}")
-                return False
-            
-            # Prepare DM message
-            message = Config.DM_MESSAGE.replace('{link}', Config.DEFAULT_LINK)
-            
-            # Send DM
-            success = self.send_message(author_id, message)
-            
-            if success:
-                self.logger.info(f"✅ DM sent to @{author_username} for comment: {comment.get('text', '')[:50]}...")
-                
-                # Save to database (if you have database integration)
-                # self.save_processed_comment(comment, post)
-                
-            return success
-            
-        except Exception as e:
-            self.logger.error(f"❌ Error processing comment: {e}")
-            return False
+    def save_walk(self, post_id: str, walk: CommentWalk, newest: Optional[Dict], source: str = 'poll'):
+        """
+        Store where the next walk of a post starts, once its comments were processed
+        
+        newest is the newest comment of the walk that was processed (None if
+        none was). A complete walk moves the watermark up to it, or to the
+        head of the earlier partial walk if that is newer; a partial one
+        leaves the watermark alone, since moving it would skip the unread
+        comments for good, and records the cursor to continue from instead.
+        """
+        head = walk.head
+        if newest is not None:
+            newest_time = graph_client.parse_timestamp(newest.get('timestamp'))
+            head_time = graph_client.parse_timestamp(head[1]) if head else None
+            # Comments from the gap below an earlier head are older than it
+            if head_time is None or newest_time is None or newest_time >= head_time:
+                head = (newest.get('id'), newest.get('timestamp'))
+        if head is None:
+            return
+        if walk.complete:
+            self.db.set_comment_watermark(post_id, head[0], head[1], source=source)
+        elif walk.resume_after:
+            self.db.set_comment_resume(post_id, walk.resume_after, head[0], head[1], source=source)
+    
+    def should_monitor_post(self, post: Dict) -> bool:
+        """Check if a post should be monitored based on configuration"""
+        if Config.MONITOR_ALL_POSTS:
+            return True
+        if self.pipeline is not None and self.pipeline.campaigns.has_campaign(post.get('id')):
+            return True
+        return post.get('id') in Config.MONITORED_POST_IDS
 
 # Example usage
 if __name__ == "__main__":
@@ -361,7 +522,7 @@ if __name__ == "__main__":
         
         # Test getting comments
         if posts:
-            comments = client.get_post_comments(posts[0]['id'])
-            print(f"Retrieved {len(comments)} comments for first post")
+            walk = client.get_post_comments(posts[0]['id'])
+            print(f"Retrieved {len(walk.comments)} comments for first post")
     else:
         print("❌ Instagram Business API login failed") 
\ No newline at end of file
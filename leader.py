@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Leader election for singleton background jobs
+Every worker registers the same jobs, but a job only runs in the worker that
+holds its lease: a row in the shared status database naming the holder and an
+expiry time. The holder renews its leases every third of the lease period; if
+it dies (or stalls) the lease expires and another worker takes the job over on
+its next renewal round.
+
+The time of each job's last run is kept in its lease row too, so a job's
+schedule survives worker restarts and leadership changes.
+"""
+
+import atexit
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import metrics
+
+
+class SingletonJob:
+    """A periodic job that should run in exactly one worker"""
+
+    def __init__(self, name: str, func: Callable[[], object], interval: float, initial_delay: float = 0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.initial_delay = initial_delay  # wait before the first run ever (no run recorded in the lease row)
+
+        self.runs = 0
+        self.last_duration_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            self.func()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            logging.error(f"❌ Singleton job '{self.name}' failed: {e}")
+        finally:
+            self.runs += 1
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def status(self) -> Dict:
+        return {
+            'interval_seconds': self.interval,
+            'runs': self.runs,
+            'last_duration_ms': self.last_duration_ms,
+            'last_error': self.last_error
+        }
+
+
+class LeaderElection:
+    """SQLite lease rows (one per job) shared by every worker using the same database file"""
+
+    def __init__(self, db_file: str, lease_seconds: float = 30):
+        self.db_file = db_file
+        self.lease_seconds = lease_seconds
+        self.jobs: Dict[str, SingletonJob] = {}
+        self.logger = logging.getLogger(__name__)
+
+        self.identity = None
+        self._held: Dict[str, float] = {}  # job name -> local monotonic deadline
+        self._thread = None
+        self._thread_pid = None
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                acquired_at REAL NOT NULL,
+                renewed_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_run_at REAL
+            )
+        ''')
+        if not self._schema_ready:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(leases)')]
+            if 'last_run_at' not in columns:
+                try:
+                    conn.execute('ALTER TABLE leases ADD COLUMN last_run_at REAL')
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+            self._schema_ready = True
+        return conn
+
+    # Jobs
+
+    def add_job(self, name: str, func: Callable[[], object], interval: float, initial_delay: float = 0):
+        self.jobs[name] = SingletonJob(name, func, interval, initial_delay)
+
+    def is_leader(self, name: str) -> bool:
+        """True while this process holds an unexpired lease for the job"""
+        deadline = self._held.get(name)
+        return deadline is not None and time.monotonic() < deadline
+
+    # Leases
+
+    def try_acquire(self, name: str) -> bool:
+        """Take the lease if it is free or expired, or renew it if we already hold it"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                INSERT INTO leases (name, holder, acquired_at, renewed_at, expires_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    holder = excluded.holder,
+                    acquired_at = CASE WHEN leases.holder = excluded.holder
+                                       THEN leases.acquired_at ELSE excluded.acquired_at END,
+                    renewed_at = excluded.renewed_at,
+                    expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < excluded.renewed_at
+            ''', (name, self.identity, now, now, now + self.lease_seconds))
+            acquired = cursor.rowcount > 0
+        finally:
+            conn.close()
+
+        was_leader = self.is_leader(name)
+        if acquired:
+            # Stop trusting the lease a little before other workers may take it over
+            self._held[name] = time.monotonic() + self.lease_seconds * 0.9
+            if not was_leader:
+                self.logger.info(f"👑 Worker {self.identity} is now leader for '{name}'")
+        else:
+            self._held.pop(name, None)
+            if was_leader:
+                self.logger.warning(f"⚠️ Worker {self.identity} lost leadership for '{name}'")
+        metrics.LEADER.labels(name).set(1 if acquired else 0)
+        return acquired
+
+    def last_run_at(self, name: str) -> Optional[float]:
+        """Wall-clock time the job last ran in any worker (None if it never has)"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT last_run_at FROM leases WHERE name = ?', (name,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def record_run(self, name: str, ran_at: float):
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE leases SET last_run_at = ? WHERE name = ? AND holder = ?',
+                         (ran_at, name, self.identity))
+        finally:
+            conn.close()
+
+    def release_all(self):
+        """Give up held leases so another worker can take over immediately (the rows keep last_run_at)"""
+        held = [name for name in list(self._held) if self.is_leader(name)]
+        self._held.clear()
+        if not held or self._thread_pid != os.getpid():
+            return
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany('UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?',
+                                 [(name, self.identity) for name in held])
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            self.logger.error(f"❌ Failed to release leases: {e}")
+
+    def leaders(self) -> Dict[str, Dict]:
+        """Current holder of every job's lease, as seen in the shared database"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT name, holder, acquired_at, renewed_at, expires_at, last_run_at '
+                                'FROM leases').fetchall()
+        finally:
+            conn.close()
+
+        leases = {name: {'holder': holder, 'since': acquired_at, 'renewed_at': renewed_at,
+                         'expires_in_seconds': round(expires_at - now, 1), 'expired': expires_at < now,
+                         'last_run_at': last_run_at}
+                  for name, holder, acquired_at, renewed_at, expires_at, last_run_at in rows}
+
+        result = {}
+        for name, job in self.jobs.items():
+            result[name] = dict(leases.get(name) or {'holder': None})
+            result[name]['this_worker'] = self.is_leader(name)
+            result[name].update(job.status())
+        return result
+
+    # Background threads
+
+    def start(self):
+        """Start lease renewal and job runners (once per process; safe to call again after a fork)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self.identity = f"{socket.gethostname()}:{os.getpid()}"
+            self._held = {}
+            self._stop = threading.Event()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._renew_loop, name='leader-election', daemon=True)
+            self._thread.start()
+            for job in self.jobs.values():
+                threading.Thread(target=self._job_loop, args=(job,), name=f'job-{job.name}', daemon=True).start()
+            atexit.register(self.release_all)
+
+    def stop(self):
+        self._stop.set()
+        self.release_all()
+
+    def _renew_loop(self):
+        while not self._stop.is_set():
+            for name in self.jobs:
+                try:
+                    self.try_acquire(name)
+                except sqlite3.Error as e:
+                    self._held.pop(name, None)
+                    self.logger.error(f"❌ Lease renewal for '{name}' failed: {e}")
+            self._stop.wait(self.lease_seconds / 3)
+
+    def _job_loop(self, job: SingletonJob):
+        """Run the job whenever this worker leads it and the interval since the last recorded run has passed"""
+        stop = self._stop
+        check_every = self.lease_seconds / 3
+        first_run_at = time.time() + job.initial_delay
+        wait = 0.0
+        while not stop.wait(wait):
+            wait = check_every
+            if not self.is_leader(job.name):
+                continue
+            try:
+                last_run_at = self.last_run_at(job.name)
+                due_at = first_run_at if last_run_at is None else last_run_at + job.interval
+                if time.time() < due_at:
+                    wait = min(check_every, due_at - time.time())
+                    continue
+                ran_at = time.time()
+                job.run()
+                self.record_run(job.name, ran_at)
+            except sqlite3.Error as e:
+                self.logger.error(f"❌ Could not schedule '{job.name}': {e}")
+
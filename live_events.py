@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Live dashboard feed
+One producer thread per worker tails processed_comments and samples counters,
+then fans events out to every open /api/events stream through in-memory
+queues. Open dashboards therefore cost one small query per tick instead of
+each re-running the dashboard queries.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+import metrics
+from comment_pipeline import DMRateLimiter
+from config import Config
+from database import Database
+
+# Seconds between producer ticks
+EVENTS_POLL_SECONDS = 1.0
+
+# Events buffered per subscriber before a slow client starts losing events
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Processed comments pushed per tick at most (the rest follow on the next tick)
+MAX_COMMENTS_PER_TICK = 50
+
+# Idle streams send a comment line this often so proxies keep them open
+KEEPALIVE_SECONDS = 15
+
+
+def format_event(event: str, data: Dict) -> str:
+    """Serialize one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class LiveFeed:
+    """In-memory fan-out of dashboard events with a lazily started producer"""
+
+    def __init__(self, status):
+        self.status = status
+        self.subscribers = set()
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._has_subscribers = threading.Event()
+        self._producer = None
+        self._last_stats = None
+        self._last_row_id = None
+        self._totals = None
+
+    # Subscribers
+
+    def subscribe(self, limit: Optional[int] = None) -> Optional[queue.Queue]:
+        """New subscriber queue, or None when limit subscribers are already open"""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if limit is not None and len(self.subscribers) >= limit:
+                return None
+            self.subscribers.add(subscriber)
+            self._has_subscribers.set()
+            self._ensure_producer()
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            self.subscribers.discard(subscriber)
+            if not self.subscribers:
+                self._has_subscribers.clear()
+
+    def publish(self, event: str, data: Dict):
+        """Queue an event for every subscriber, dropping the oldest event of any that lag behind"""
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(message)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def current_stats(self) -> Optional[Dict]:
+        """Latest published stats, or None when no stream is keeping them current"""
+        return self._last_stats if self.subscribers else None
+
+    # Producer
+
+    def _ensure_producer(self):
+        if self._producer and self._producer.is_alive():
+            return
+        self._producer = threading.Thread(target=self._run, name='live-feed', daemon=True)
+        self._producer.start()
+
+    def _run(self):
+        db = Database()
+        rate_limiter = DMRateLimiter(db)
+
+        while True:
+            self._has_subscribers.wait()
+            try:
+                self.tick(db, rate_limiter)
+            except Exception as e:
+                self.logger.error(f"❌ Live feed producer error: {e}")
+            time.sleep(EVENTS_POLL_SECONDS)
+
+    def tick(self, db: Database, rate_limiter: DMRateLimiter):
+        """Publish comments processed since the last tick and any changed counters"""
+        if self._last_row_id is None:
+            # Full counts once per worker; afterwards totals advance with the tailed rows
+            self._last_row_id = db.get_last_processed_comment_row_id()
+            self._totals = {
+                'total_processed': db.count_processed_comments(),
+                'total_dms_sent': db.count_sent_dms()
+            }
+
+        for row in db.get_processed_comments_after(self._last_row_id, MAX_COMMENTS_PER_TICK):
+            self._last_row_id = row.pop('id')
+            self._totals['total_processed'] += 1
+            if 'dm_sent' in (row.get('action_taken') or ''):
+                self._totals['total_dms_sent'] += 1
+            self.publish('comment', row)
+
+        status = self.status.snapshot()
+        stats = {
+            'total_processed': self._totals['total_processed'],
+            'total_dms_sent': self._totals['total_dms_sent'],
+            'total_webhooks_processed': status.get('total_webhooks_processed', 0),
+            'webhook_active': status.get('webhook_active', False),
+            'last_webhook_received': status.get('last_webhook_received'),
+            'queue_depths': metrics.queue_depths(),
+            'dm_budget': rate_limiter.remaining()
+        }
+        if stats != self._last_stats:
+            self._last_stats = stats
+            self.publish('stats', stats)
+
+    def stream(self, subscriber: queue.Queue, max_seconds: float, retry_seconds: float):
+        """
+        Generator of server-sent events for one subscribed client
+
+        The stream ends after max_seconds so it does not hold a request thread
+        forever; the retry field tells the browser to reconnect after retry_seconds.
+        """
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f"retry: {int(retry_seconds * 1000)}\n\n"
+            if self._last_stats:
+                yield format_event('stats', self._last_stats)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    yield subscriber.get(timeout=min(KEEPALIVE_SECONDS, remaining))
+                except queue.Empty:
+                    if deadline > time.monotonic():
+                        yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -3,6 +3,8 @@ import time
 import schedule
 import logging
 from instagram_bot import InstagramBot
+from instagram_business_api import InstagramBusinessAPI
+from polling_scheduler import AdaptivePollScheduler
 from config import Config
 
 def main():
@@ -10,70 +12,65 @@ def main():
     print("Instagram DM Bot Starting...")
     print("="*50)
     
-    # Initialize bot
-    bot = InstagramBot()
+    # Initialize polling client and scheduler
+    client = InstagramBusinessAPI()
+    scheduler = AdaptivePollScheduler()
     
     # Initial login
-    if not bot.login():
-        print("Failed to login. Please check your credentials in .env file")
+    if not client.login():
+        print("Failed to login. Please authenticate via the web dashboard first")
         return
     
     print(f"Bot is now monitoring for keywords: {', '.join(Config.KEYWORDS)}")
-    print(f"Checking every {Config.CHECK_INTERVAL} seconds")
+    print(f"Checking post activity every {Config.POLL_TICK_SECONDS} seconds")
+    print(f"Hot posts polled every {Config.POLL_INTERVAL_HOT}s, quiet posts every "
+          f"{Config.POLL_INTERVAL_COOL}-{Config.POLL_INTERVAL_COLD}s")
     
     # Show filtering status
     if Config.MONITOR_ALL_POSTS:
         print("📌 Monitoring: ALL posts")
+    elif Config.MONITORED_POST_IDS:
+        print(f"📌 Monitoring: {len(Config.MONITORED_POST_IDS)} specific posts")
     else:
-        filters_active = []
-        if Config.SPECIFIC_POST_IDS:
-            filters_active.append(f"Specific posts ({len(Config.SPECIFIC_POST_IDS)})")
-        if Config.REQUIRED_HASHTAGS:
-            filters_active.append(f"Posts with hashtags: {', '.join(Config.REQUIRED_HASHTAGS)}")
-        if Config.REQUIRED_CAPTION_WORDS:
-            filters_active.append(f"Posts with phrases: {', '.join(Config.REQUIRED_CAPTION_WORDS)}")
-        if Config.MAX_POST_AGE_DAYS:
-            filters_active.append(f"Posts newer than {Config.MAX_POST_AGE_DAYS} days")
-        if Config.ONLY_POSTS_WITH_LINKS:
-            filters_active.append("Posts with links only")
-        
-        if filters_active:
-            print("📌 Active filters:")
-            for f in filters_active:
-                print(f"   • {f}")
-        else:
-            print("⚠️  No filters active - will not monitor any posts")
-            print("   Configure filters in config.py or set MONITOR_ALL_POSTS = True")
+        print("⚠️  No posts selected - will not monitor any posts")
+        print("   Select posts on the Manage Posts page or set MONITOR_ALL_POSTS = True")
     
     print("Press Ctrl+C to stop")
     print("="*50)
     
     # Schedule the monitoring
-    schedule.every(Config.CHECK_INTERVAL).seconds.do(bot.run_monitoring_cycle)
+    schedule.every(Config.POLL_TICK_SECONDS).seconds.do(client.run_monitoring_cycle, scheduler)
+    schedule.every().hour.do(report_scheduler, scheduler)
     
     # Run initial cycle
-    bot.run_monitoring_cycle()
+    client.run_monitoring_cycle(scheduler)
     
     # Keep running
     try:
         while True:
             schedule.run_pending()
-            time.sleep(30)  # Check every 30 seconds
+            time.sleep(1)
     except KeyboardInterrupt:
         print("\nBot stopped by user")
         logging.info("Bot stopped by user")
 
+def report_scheduler(scheduler):
+    """Log how many post polls the adaptive scheduler skipped"""
+    report = scheduler.report()
+    logging.info(f"📉 Adaptive polling: {report['posts_skipped_last_hour']} post polls skipped in the last hour "
+                 f"across {report['tracked_posts']} posts (tiers: {report['tiers']})")
+
 def run_once():
     """Run the bot once for testing"""
-    bot = InstagramBot()
-    if bot.login():
-        bot.run_monitoring_cycle()
+    client = InstagramBusinessAPI()
+    if client.login():
+        client.run_monitoring_cycle()
         
         # Show stats
-        stats = bot.get_stats()
+        stats = client.pipeline.bot.get_stats()
         print(f"\nRecent activity:")
-        for comment in stats['recent_processed']:
-            print(f"- @{comment[0]} (keyword: {comment[1]}) at {comment[2]}")
+        for comment in stats['recent_activity']:
+            print(f"- @{comment[0]} (keyword: {comment[1]}) at {comment[3]}")
 
 def show_stats():
     """Show bot statistics"""
@@ -83,49 +80,35 @@ def show_stats():
     print("Instagram DM Bot Statistics")
     print("="*30)
     print(f"Status: {'Online' if stats['logged_in'] else 'Offline'}")
-    if stats['username']:
-        print(f"Account: @{stats['username']}")
     
     print(f"\nMonitored Keywords: {', '.join(Config.KEYWORDS)}")
-    print(f"Check Interval: {Config.CHECK_INTERVAL} seconds")
+    print(f"Keyword Strategy: {Config.KEYWORD_STRATEGY}")
+    print(f"Polling Tick: {Config.POLL_TICK_SECONDS} seconds")
     
     # Show filtering configuration
     print(f"\nPost Filtering:")
     if Config.MONITOR_ALL_POSTS:
         print("  • Monitoring ALL posts")
     else:
-        print("  • Selective monitoring enabled:")
-        if Config.SPECIFIC_POST_IDS:
-            print(f"    - Specific posts: {len(Config.SPECIFIC_POST_IDS)} configured")
-        if Config.REQUIRED_HASHTAGS:
-            print(f"    - Required hashtags: {', '.join(Config.REQUIRED_HASHTAGS)}")
-        if Config.REQUIRED_CAPTION_WORDS:
-            print(f"    - Required phrases: {', '.join(Config.REQUIRED_CAPTION_WORDS)}")
-        if Config.MAX_POST_AGE_DAYS:
-            print(f"    - Max age: {Config.MAX_POST_AGE_DAYS} days")
-        if Config.ONLY_POSTS_WITH_LINKS:
-            print("    - Posts with links only: Yes")
+        print(f"  • Specific posts: {len(Config.MONITORED_POST_IDS)} configured")
     
     print(f"\nRecent Processed Comments:")
-    recent = stats['recent_processed']
+    recent = stats['recent_activity']
     if recent:
         for comment in recent[:5]:
-            print(f"  @{comment[0]} - '{comment[1]}' - {comment[2]}")
+            print(f"  @{comment[0]} - '{comment[1]}' - {comment[2]} - {comment[3]}")
     else:
         print("  No recent activity")
 
 def list_posts():
     """List recent posts for easy selection"""
-    bot = InstagramBot()
-    if bot.login():
-        bot.list_recent_posts_for_selection()
-        print("\nTo monitor specific posts, copy the Post IDs and add them to")
-        print("the SPECIFIC_POST_IDS list in config.py")
-        print("\nExample:")
-        print("SPECIFIC_POST_IDS = [")
-        print('    "ABC123DEF",  # Replace with actual post ID')
-        print('    "XYZ789GHI",')
-        print("]")
+    client = InstagramBusinessAPI()
+    if client.login():
+        for post in client.get_media_posts(25):
+            caption = (post.get('caption') or 'No caption').replace('\n', ' ')[:60]
+            print(f"{post['id']}  {post.get('timestamp', '')}  {post.get('comments_count', 0):>5} comments  {caption}")
+        print("\nTo monitor specific posts, select them on the Manage Posts page")
+        print("or add their IDs to MONITORED_POST_IDS in runtime_config.json")
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Precompiled message templates
+Templates are parsed once per config version into literal and placeholder
+parts, validated against the placeholders each message type supports, and
+rendered by joining the parts - no format-string parsing per comment.
+"""
+
+from string import Formatter
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+# Placeholders available to each kind of message
+DM_PLACEHOLDERS = frozenset({'username', 'comment', 'keyword', 'link'})
+REPLY_PLACEHOLDERS = frozenset({'username', 'keyword', 'link'})
+
+
+class TemplateError(ValueError):
+    """Raised when a template cannot be parsed or uses an unknown placeholder"""
+
+
+class MessageTemplate:
+    """A template split into (literal, placeholder) parts"""
+
+    __slots__ = ('source', 'placeholders', '_parts')
+
+    def __init__(self, source: str, allowed: Optional[FrozenSet[str]] = None):
+        self.source = source
+        parts = []
+        placeholders = set()
+
+        try:
+            parsed = list(Formatter().parse(source))
+        except ValueError as e:
+            raise TemplateError(f"Invalid template: {e}")
+
+        for literal, field, spec, conversion in parsed:
+            if field is None:
+                if literal:
+                    parts.append((literal, None))
+                continue
+
+            if not field.isidentifier():
+                raise TemplateError(f"Invalid placeholder '{{{field}}}' - use plain names like {{username}}")
+            if spec or conversion:
+                raise TemplateError(f"Formatting options are not supported in '{{{field}}}'")
+            if allowed is not None and field not in allowed:
+                raise TemplateError(f"Unknown placeholder '{{{field}}}' - available: "
+                                    + ', '.join(f'{{{name}}}' for name in sorted(allowed)))
+
+            placeholders.add(field)
+            parts.append((literal, field))
+
+        self.placeholders = frozenset(placeholders)
+        self._parts = tuple(parts)
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Fill placeholders from values (which must cover self.placeholders)"""
+        pieces = []
+        for literal, field in self._parts:
+            if literal:
+                pieces.append(literal)
+            if field is not None:
+                pieces.append(values[field])
+        return ''.join(pieces)
+
+    def __repr__(self):
+        return f"MessageTemplate({self.source!r})"
+
+
+def compile_template(source: str, allowed: FrozenSet[str]) -> MessageTemplate:
+    return MessageTemplate(source, allowed)
+
+
+def compile_templates(sources: Iterable[str], allowed: FrozenSet[str]) -> Tuple[MessageTemplate, ...]:
+    return tuple(MessageTemplate(source, allowed) for source in sources)
+
+
+def validate_template(source: str, allowed: FrozenSet[str]) -> Optional[str]:
+    """Return an error message for an invalid template, or None"""
+    if not isinstance(source, str):
+        return 'Template must be text'
+    try:
+        MessageTemplate(source, allowed)
+        return None
+    except TemplateError as e:
+        return str(e)
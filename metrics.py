@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics
+Counters and histograms for webhooks, pipeline stages, Graph API calls and
+database queries. When PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) every
+gunicorn worker writes its samples there and /metrics aggregates them.
+"""
+
+import functools
+import os
+import re
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+import tracing
+
+# Request-level latencies (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# In-process work such as pipeline stages and SQLite queries
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+WEBHOOK_LATENCY = Histogram(
+    'instagram_bot_webhook_seconds', 'Time from webhook receipt to response',
+    buckets=LATENCY_BUCKETS)
+WEBHOOKS_RECEIVED = Counter(
+    'instagram_bot_webhooks_received_total', 'Webhook deliveries by outcome', ['outcome'])
+
+STAGE_LATENCY = Histogram(
+    'instagram_bot_pipeline_stage_seconds', 'Time spent in each comment pipeline stage',
+    ['stage'], buckets=FAST_BUCKETS)
+COMMENTS_PROCESSED = Counter(
+    'instagram_bot_comments_total', 'Comments entering the pipeline by source', ['source'])
+ACTIONS = Counter(
+    'instagram_bot_actions_total', 'DM and reply attempts by result', ['kind', 'result'])
+
+GRAPH_API_LATENCY = Histogram(
+    'instagram_bot_graph_api_seconds', 'Graph API request latency by endpoint',
+    ['method', 'endpoint'], buckets=LATENCY_BUCKETS)
+GRAPH_API_RESPONSES = Counter(
+    'instagram_bot_graph_api_responses_total', 'Graph API responses by endpoint and status',
+    ['method', 'endpoint', 'status'])
+
+DB_QUERY_LATENCY = Histogram(
+    'instagram_bot_db_query_seconds', 'SQLite query time by Database method',
+    ['query'], buckets=FAST_BUCKETS)
+
+QUEUES = ('graph_api_waiting', 'pipeline_pending')
+QUEUE_DEPTH = Gauge(
+    'instagram_bot_queue_depth', 'Items waiting in internal queues',
+    ['queue'], multiprocess_mode='livesum')
+# This process's depths, kept alongside the gauge so they can be read without prometheus_client internals
+_queue_depths = {queue: 0 for queue in QUEUES}
+_queue_lock = threading.Lock()
+DM_BUDGET_REMAINING = Gauge(
+    'instagram_bot_dm_budget_remaining', 'DMs left before the rate limit is hit',
+    ['account', 'window'], multiprocess_mode='mostrecent')
+
+LEADER = Gauge(
+    'instagram_bot_leader', 'Whether this worker holds the lease of a singleton job (sums to 1 per job)',
+    ['job'], multiprocess_mode='livesum')
+
+STARTUP_SECONDS = Gauge(
+    'instagram_bot_startup_seconds', 'Seconds from process start until serving and until warm-up finished',
+    ['phase'], multiprocess_mode='livemax')
+
+CACHE_REQUESTS = Counter(
+    'instagram_bot_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result'])
+
+JOURNAL_RECORDS = Counter(
+    'instagram_bot_journal_records_total', 'Webhook deliveries appended to the raw journal')
+JOURNAL_BYTES = Counter(
+    'instagram_bot_journal_bytes_total', 'Raw journal bytes written and sealed segment bytes after compression',
+    ['kind'])
+
+_ID_SEGMENT = re.compile(r'^\d+$')
+_VERSION_SEGMENT = re.compile(r'^v\d+(\.\d+)?$')
+
+
+def endpoint_label(url: str) -> str:
+    """Collapse a Graph API URL into a low-cardinality label, e.g. /{id}/comments"""
+    parts = []
+    for segment in urlsplit(url).path.split('/'):
+        if not segment or _VERSION_SEGMENT.match(segment):
+            continue
+        parts.append('{id}' if _ID_SEGMENT.match(segment) else segment)
+    return '/' + '/'.join(parts)
+
+
+def timed_query(func):
+    """Decorator recording a Database method's run time under its name"""
+    histogram = DB_QUERY_LATENCY.labels(func.__name__)
+    span_name = f'db.{func.__name__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with tracing.span(span_name):
+                return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def adjust_queue_depth(queue: str, delta: int):
+    """Add delta items to a queue (negative to remove them)"""
+    with _queue_lock:
+        _queue_depths[queue] += delta
+    QUEUE_DEPTH.labels(queue).inc(delta)
+
+
+def queue_depths() -> Dict[str, int]:
+    """This process's current queue depths"""
+    with _queue_lock:
+        return dict(_queue_depths)
+
+
+def cache_hit(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render():
+    """Exposition for /metrics: (body, content type)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Activity-aware polling scheduler
+Decides which posts are worth a comments fetch on each polling tick
+"""
+
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import graph_client
+from config import Config
+
+
+class PostPollState:
+    """Polling bookkeeping for a single post"""
+
+    def __init__(self, comments_count: int, now: float):
+        self.comments_count = comments_count
+        self.last_polled = now
+        self.interval = None
+        self.tier = 'new'
+
+
+class AdaptivePollScheduler:
+    """
+    Assigns each post a polling interval from its comment activity and age
+
+    The media list (which carries comments_count) is fetched every tick, so
+    posts whose comment count has moved are polled at most every few seconds
+    (hot) or every minute (warm), while unchanged posts are only re-checked
+    on a slow cadence (cool/cold) or not at all once they are old (dormant).
+
+    Picking a post does not change its state: the caller reports a poll
+    that succeeded with mark_polled(), so a failed or partial poll leaves
+    the post due (and at its current tier) for the next tick.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.states: Dict[str, PostPollState] = {}
+        self.logger = logging.getLogger(__name__)
+
+        # (tick time, posts skipped) pairs for the last hour
+        self._skipped = deque()
+
+    def due_posts(self, posts: List[Dict]) -> List[Dict]:
+        """
+        Filter posts down to the ones that should be polled this tick
+
+        Args:
+            posts: Media dictionaries including id, timestamp and comments_count
+
+        Returns:
+            Posts to poll, in their original order
+        """
+        now = self.clock()
+        due = []
+
+        for post in posts:
+            post_id = post['id']
+            count = post.get('comments_count') or 0
+            state = self.states.get(post_id)
+
+            if state is None:
+                # Not polled successfully yet: poll to establish the watermark
+                due.append(post)
+                continue
+
+            since_poll = now - state.last_polled
+            delta = count - state.comments_count
+            rate = max(delta, 0) / max(since_poll / 60.0, 1 / 60.0)
+            state.tier, state.interval = self._classify(rate, delta, post)
+
+            if state.interval is not None and since_poll >= state.interval:
+                due.append(post)
+
+        self._record_skipped(now, len(posts) - len(due))
+        return due
+
+    def mark_polled(self, post_id: str, comments_count: int):
+        """Record a successful poll of a post, with the comments_count it was picked at"""
+        now = self.clock()
+        state = self.states.get(post_id)
+        if state is None:
+            self.states[post_id] = PostPollState(comments_count, now)
+            return
+        state.comments_count = comments_count
+        state.last_polled = now
+
+    def _classify(self, rate: float, delta: int, post: Dict) -> Tuple[str, Optional[int]]:
+        """Pick a tier and minimum seconds between polls for a post"""
+        if delta != 0:
+            if rate >= Config.POLL_HOT_COMMENTS_PER_MINUTE:
+                return 'hot', Config.POLL_INTERVAL_HOT
+            return 'warm', Config.POLL_INTERVAL_WARM
+
+        age_days = self._age_days(post)
+        if age_days is not None and age_days > Config.POLL_MAX_POST_AGE_DAYS:
+            # Old and quiet: only poll again once its comment count moves
+            return 'dormant', None
+        if age_days is not None and age_days > Config.POLL_COLD_AFTER_DAYS:
+            return 'cold', Config.POLL_INTERVAL_COLD
+        return 'cool', Config.POLL_INTERVAL_COOL
+
+    @staticmethod
+    def _age_days(post: Dict) -> Optional[float]:
+        created = graph_client.parse_timestamp(post.get('timestamp'))
+        if not created:
+            return None
+        return (datetime.now(timezone.utc) - created).total_seconds() / 86400
+
+    def _record_skipped(self, now: float, skipped: int):
+        self._skipped.append((now, skipped))
+        while self._skipped and now - self._skipped[0][0] > 3600:
+            self._skipped.popleft()
+
+    def posts_skipped_per_hour(self) -> int:
+        """
+        Post polls skipped over the last hour versus polling every post every tick
+
+        A skipped post costs no comment paging and no pipeline pass; its first
+        comments page arrives with the media list either way, so this is not
+        a count of Graph API requests saved.
+        """
+        return sum(skipped for _, skipped in self._skipped)
+
+    def report(self) -> Dict:
+        """Summary of post tiers and polls skipped"""
+        tiers = {}
+        for state in self.states.values():
+            tiers[state.tier] = tiers.get(state.tier, 0) + 1
+
+        return {
+            'tracked_posts': len(self.states),
+            'tiers': tiers,
+            'posts_skipped_last_hour': self.posts_skipped_per_hour()
+        }
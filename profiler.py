@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling for running workers
+- Sampling: a background thread snapshots every thread's stack at a fixed
+  interval for a bounded time and writes folded stacks (one "frame;frame;frame
+  count" line per stack), readable by flamegraph.pl and speedscope.
+- Per-request: every Nth webhook runs under cProfile and is saved as a pstats
+  .prof file (snakeviz, `python -m pstats`).
+Both are started from admin-only endpoints or SIGUSR2 and write to PROFILE_DIR.
+"""
+
+import cProfile
+import itertools
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import Config
+
+PROFILE_EXTENSIONS = ('.folded', '.prof')
+
+_sampling_lock = threading.Lock()
+_active_sampler = None
+
+_webhook_counter = itertools.count(1)
+
+
+def _profile_path(kind: str, extension: str) -> str:
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    return os.path.join(Config.PROFILE_DIR, f'{kind}-{stamp}-pid{os.getpid()}{extension}')
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f'{module}:{code.co_name}:{frame.f_lineno}'
+
+
+class SamplingProfiler:
+    """Samples all thread stacks of this process for a fixed duration"""
+
+    def __init__(self, duration: float, interval: float):
+        self.duration = duration
+        self.interval = interval
+        self.path = _profile_path('sample', '.folded')
+        self.samples = 0
+        self.stacks = Counter()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        global _active_sampler
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+
+        try:
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+
+            self.write()
+            logging.info(f"🔬 Sampling profile written to {self.path} ({self.samples} samples)")
+
+        except Exception as e:
+            logging.error(f"❌ Sampling profiler failed: {e}")
+
+        finally:
+            with _sampling_lock:
+                _active_sampler = None
+
+    def write(self):
+        with open(self.path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        prune_profiles()
+
+
+def validate_sampling(duration, interval) -> Optional[str]:
+    """Return an error message for invalid sampling parameters (None means the default), or None"""
+    limits = {'duration': (duration, Config.PROFILE_MAX_SECONDS), 'interval': (interval, 1.0)}
+    for name, (value, maximum) in limits.items():
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return f'{name} must be a number of seconds'
+        if not 0 < value <= maximum:
+            return f'{name} must be more than 0 and no more than {maximum:g}s'
+    return None
+
+
+def start_sampling(duration: Optional[float] = None, interval: Optional[float] = None) -> Optional[str]:
+    """
+    Start a time-boxed sampling run in this worker
+
+    Returns:
+        Path the profile will be written to, or None if a run is already in progress
+    """
+    global _active_sampler
+    duration = min(max(float(duration or 30), 1.0), Config.PROFILE_MAX_SECONDS)
+    interval = max(float(interval or Config.PROFILE_SAMPLE_INTERVAL), 0.001)
+
+    with _sampling_lock:
+        if _active_sampler is not None:
+            return None
+        sampler = SamplingProfiler(duration, interval)
+        _active_sampler = sampler
+        sampler.start()
+
+    logging.info(f"🔬 Sampling profile started for {duration:.0f}s every {interval * 1000:.1f}ms")
+    return sampler.path
+
+
+def sampling_status() -> Optional[Dict]:
+    sampler = _active_sampler
+    if sampler is None:
+        return None
+    return {'path': sampler.path, 'duration': sampler.duration, 'samples': sampler.samples}
+
+
+@contextmanager
+def maybe_profile_webhook(trace_id: Optional[str] = None):
+    """Run the body under cProfile for every PROFILE_EVERY_N_WEBHOOKS-th webhook"""
+    every = Config.PROFILE_EVERY_N_WEBHOOKS
+    if every <= 0 or next(_webhook_counter) % every:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler (e.g. a concurrent request) is already active in this thread
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profile.disable()
+        try:
+            path = _profile_path(f'webhook-{trace_id}' if trace_id else 'webhook', '.prof')
+            profile.dump_stats(path)
+            prune_profiles()
+        except Exception as e:
+            logging.error(f"❌ Could not save webhook profile: {e}")
+
+
+def list_profiles() -> List[Dict]:
+    """Saved profiles, newest first"""
+    if not os.path.isdir(Config.PROFILE_DIR):
+        return []
+
+    profiles = []
+    for name in os.listdir(Config.PROFILE_DIR):
+        if not name.endswith(PROFILE_EXTENSIONS):
+            continue
+        stat = os.stat(os.path.join(Config.PROFILE_DIR, name))
+        profiles.append({
+            'name': name,
+            'kind': 'sampling' if name.endswith('.folded') else 'cprofile',
+            'size_kb': round(stat.st_size / 1024, 1),
+            'modified': datetime.fromtimestamp(stat.st_mtime)
+        })
+    return sorted(profiles, key=lambda profile: profile['modified'], reverse=True)
+
+
+def prune_profiles():
+    """Delete the oldest profiles beyond PROFILE_KEEP_FILES"""
+    for profile in list_profiles()[Config.PROFILE_KEEP_FILES:]:
+        try:
+            os.remove(os.path.join(Config.PROFILE_DIR, profile['name']))
+        except OSError:
+            pass
+
+
+def install_signal_handler():
+    """Start a default sampling run when the worker receives SIGUSR2"""
+    if not hasattr(signal, 'SIGUSR2'):
+        return
+    try:
+        # Start from a thread so the handler never blocks on _sampling_lock
+        signal.signal(signal.SIGUSR2, lambda signum, frame: threading.Thread(target=start_sampling, daemon=True).start())
+    except ValueError:
+        # Not in the main thread; the admin endpoint still works
+        pass
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Shared runtime status
+Status flags and counters live in a small SQLite database in WAL mode so every
+gunicorn worker reads and writes the same values: deactivating in one worker
+pauses all of them, and counters are deployment-wide. Increments are single
+UPSERT statements, so concurrent workers never lose updates.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+_DATETIME_TAG = '__datetime__'
+
+
+def _encode(value: Any) -> str:
+    if isinstance(value, datetime):
+        return json.dumps({_DATETIME_TAG: value.isoformat()})
+    return json.dumps(value)
+
+
+def _decode(raw: str) -> Any:
+    value = json.loads(raw)
+    if isinstance(value, dict) and _DATETIME_TAG in value:
+        return datetime.fromisoformat(value[_DATETIME_TAG])
+    return value
+
+
+class SharedStatus:
+    """
+    Dict-like status shared by all worker processes
+
+    Keys listed in counters are integers updated with increment(); other keys
+    hold JSON-serializable values (datetimes are supported). static values are
+    process-local constants merged into snapshot() and never written.
+    """
+
+    def __init__(self, db_file: str, defaults: Dict[str, Any], counters: Iterable[str] = (),
+                 static: Optional[Dict[str, Any]] = None):
+        self.db_file = db_file
+        self.defaults = dict(defaults)
+        self.counters = frozenset(counters)
+        self.static = dict(static or {})
+
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized_pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection, reopened after a fork"""
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == pid:
+            return conn
+
+        conn = sqlite3.connect(self.db_file, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = pid
+
+        if self._initialized_pid != pid:
+            with self._init_lock:
+                if self._initialized_pid != pid:
+                    self._init_schema(conn)
+                    self._initialized_pid = pid
+        return conn
+
+    def _init_schema(self, conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS status_values (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS status_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+    # Mapping interface
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.static:
+            return self.static[key]
+
+        conn = self._connection()
+        if key in self.counters:
+            row = conn.execute('SELECT value FROM status_counters WHERE name = ?', (key,)).fetchone()
+            return row[0] if row else self.defaults.get(key, 0)
+
+        row = conn.execute('SELECT value FROM status_values WHERE key = ?', (key,)).fetchone()
+        if row:
+            return _decode(row[0])
+        if key in self.defaults:
+            return self.defaults[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        conn = self._connection()
+        if key in self.counters:
+            conn.execute('''
+                INSERT INTO status_counters (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = excluded.value
+            ''', (key, int(value)))
+        else:
+            conn.execute('''
+                INSERT INTO status_values (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            ''', (key, _encode(value)))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.static or key in self.defaults or key in self.counters
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # Shared operations
+
+    def increment(self, name: str, by: int = 1, **values) -> None:
+        """Atomically add to a counter, optionally setting other keys in the same transaction"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                INSERT INTO status_counters (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+            ''', (name, by))
+            for key, value in values.items():
+                conn.execute('''
+                    INSERT INTO status_values (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                ''', (key, _encode(value)))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All values as a plain dict, read in one transaction"""
+        status = dict(self.defaults)
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            for key, raw in conn.execute('SELECT key, value FROM status_values'):
+                status[key] = _decode(raw)
+            for name, value in conn.execute('SELECT name, value FROM status_counters'):
+                if name in self.counters:  # rows of counters dropped since are left behind
+                    status[name] = value
+        finally:
+            conn.execute('COMMIT')
+        status.update(self.static)
+        return status
+
+    def reset_connections(self):
+        """Drop this thread's connection (e.g. after fork); the next access reconnects"""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            conn.close()
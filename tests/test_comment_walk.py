@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import graph_client
+from config import Config
+from instagram_business_api import InstagramBusinessAPI
+from reconciliation import ReconciliationSweeper
+
+PAGE_SIZE = 50
+MAX_PAGES = 20
+STARTED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+
+class FakeCommentsEdge:
+    """A post's comments edge, newest first; like Graph's, a cursor points at a comment, not an offset"""
+
+    def __init__(self):
+        self.comments = []
+        self.requests = 0
+
+    def add(self, count):
+        for _ in range(count):
+            number = len(self.comments)
+            timestamp = (STARTED + timedelta(seconds=number)).strftime('%Y-%m-%dT%H:%M:%S+0000')
+            self.comments.insert(0, {'id': f'c{number}', 'text': 'hi', 'timestamp': timestamp})
+
+    def page(self, after=None, limit=PAGE_SIZE):
+        ids = [comment['id'] for comment in self.comments]
+        start = ids.index(after) + 1 if after else 0
+        page = {'data': self.comments[start:start + limit]}
+        if start + limit < len(self.comments):
+            cursor = page['data'][-1]['id']
+            page['paging'] = {'cursors': {'after': cursor}, 'next': f'https://graph.test/next?after={cursor}'}
+        return page
+
+    def get(self, url, params=None):
+        self.requests += 1
+        return FakeResponse(self.page(params.get('after'), params['limit']))
+
+
+@pytest.fixture
+def edge(monkeypatch):
+    edge = FakeCommentsEdge()
+    monkeypatch.setattr(graph_client, 'get', edge.get)
+    return edge
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE_FILE', str(tmp_path / 'bot.db'))
+    monkeypatch.setattr(Config, 'COMMENTS_PAGE_SIZE', PAGE_SIZE)
+    monkeypatch.setattr(Config, 'MAX_COMMENT_PAGES', MAX_PAGES)
+    client = InstagramBusinessAPI()
+    client.logged_in = True
+    return client
+
+
+def poll(client, edge, expanded=True):
+    """One polling cycle for the post: (comment ids handed to the pipeline, comments requests made)"""
+    edge.requests = 0
+    post = {'id': 'p1'}
+    if expanded:
+        post['comments'] = edge.page()  # arrives with the media list
+    (_, walk), = client.fetch_new_comments([post], expanded=expanded)
+    client.save_walk('p1', walk, walk.comments[0] if walk.comments else None)
+    return [comment['id'] for comment in walk.comments], edge.requests
+
+
+def test_long_first_walk_resumes_and_settles_to_one_page(client, edge):
+    edge.add(1200)
+
+    seen, requests = poll(client, edge)
+    assert (len(seen), requests) == (PAGE_SIZE * (MAX_PAGES + 1), MAX_PAGES)
+    assert client.db.get_comment_watermark('p1') is None
+
+    # The next cycle reads only the rest of the history, then the watermark is set
+    more, requests = poll(client, edge)
+    assert (len(more), requests) == (150, 3)
+    assert sorted(seen + more) == sorted(comment['id'] for comment in edge.comments)
+    assert client.db.get_comment_walk('p1') == (('c1199', edge.comments[0]['timestamp']), None)
+
+    # From then on a quiet post costs nothing beyond its embedded first page
+    for _ in range(3):
+        assert poll(client, edge) == ([], 0)
+
+
+def test_burst_larger_than_the_page_cap_is_read_without_gaps(client, edge):
+    edge.add(10)
+    poll(client, edge)
+
+    edge.add(1500)
+    handled = []
+    requests_per_cycle = []
+    for _ in range(4):
+        seen, requests = poll(client, edge)
+        handled += seen
+        requests_per_cycle.append(requests)
+
+    # New comments arriving mid-backfill are read from the top of the post first
+    assert requests_per_cycle[:2] == [MAX_PAGES, 10]
+    assert requests_per_cycle[2:] == [0, 0]
+    assert sorted(handled) == sorted(comment['id'] for comment in edge.comments[:1500])
+
+
+def test_new_comments_during_backfill_are_not_skipped(client, edge):
+    edge.add(1200)
+    first, _ = poll(client, edge, expanded=False)
+
+    edge.add(5)
+    second, _ = poll(client, edge, expanded=False)
+    assert second[:5] == ['c1204', 'c1203', 'c1202', 'c1201', 'c1200']
+    assert sorted(first + second) == sorted(comment['id'] for comment in edge.comments)
+
+    # Without an embedded first page a caught-up post costs exactly one request per cycle
+    for _ in range(3):
+        assert poll(client, edge, expanded=False) == ([], 1)
+
+
+def test_failed_request_keeps_the_resume_point(client, edge, monkeypatch):
+    edge.add(1200)
+    poll(client, edge)
+    _, resume = client.db.get_comment_walk('p1')
+
+    monkeypatch.setattr(graph_client, 'get', lambda url, params=None: FakeResponse({}, 500))
+    assert poll(client, edge) == ([], 0)
+    assert client.db.get_comment_walk('p1') == (None, resume)
+
+
+class FakePipeline:
+    def __init__(self):
+        self.handled = []
+
+    def process_batch(self, comments, source, media_id, raise_errors=False):
+        self.handled += [comment['id'] for comment in comments]
+        return 0
+
+
+def test_reconciliation_sweep_resumes_where_it_stopped(client, edge, monkeypatch):
+    monkeypatch.setattr(Config, 'RECONCILE_LOOKBACK_HOURS', 24 * 365 * 100)
+    edge.add(1200)
+    sweeper = ReconciliationSweeper(SimpleNamespace(db=client.db, pipeline=FakePipeline()), client)
+
+    requests = []
+    for _ in range(3):
+        edge.requests = 0
+        sweeper.sweep_post('p1')
+        requests.append(edge.requests)
+
+    assert requests == [MAX_PAGES, 1 + 4, 1]
+    assert sorted(sweeper.bot.pipeline.handled) == sorted(comment['id'] for comment in edge.comments)
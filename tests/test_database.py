@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from config import Config
+from database import Database
+
+CLAIM_TIMEOUT = 600
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE_FILE', str(tmp_path / 'bot.db'))
+    return Database()
+
+
+def claim(db, comment_id='c1', keyword='info'):
+    return db.claim_comment(comment_id, 'm1', 'alice', 'u1', 'info please', keyword, claim_timeout=CLAIM_TIMEOUT)
+
+
+def age_claim(db, comment_id, seconds):
+    """Move a row's claim time into the past, as if its worker had stopped that long ago"""
+    with sqlite3.connect(db.db_file) as conn:
+        conn.execute("UPDATE processed_comments SET processed_at = datetime('now', ?) WHERE comment_id = ?",
+                     (f'-{seconds} seconds', comment_id))
+
+
+def test_only_the_first_claim_wins(db):
+    assert claim(db)
+    assert not claim(db)
+    assert db.get_processed_comment_ids(['c1', 'c2'], CLAIM_TIMEOUT) == {'c1': 'pending'}
+
+
+def test_released_claim_can_be_claimed_again(db):
+    assert claim(db)
+    db.release_comment('c1')
+
+    assert db.get_processed_comment_ids(['c1'], CLAIM_TIMEOUT) == {}
+    assert claim(db)
+
+
+def test_claim_left_by_a_dead_worker_is_taken_over(db):
+    assert claim(db, keyword='info')
+    age_claim(db, 'c1', CLAIM_TIMEOUT + 60)
+
+    # Dedupe lets the comment through again and exactly one new claim succeeds
+    assert db.get_processed_comment_ids(['c1'], CLAIM_TIMEOUT) == {}
+    assert claim(db, keyword='dm me')
+    assert not claim(db)
+    assert db.get_processed_comment_ids(['c1'], CLAIM_TIMEOUT) == {'c1': 'pending'}
+    assert db.get_recent_processed_comments(10) == []
+
+
+def test_recent_claim_is_not_taken_over(db):
+    assert claim(db)
+    age_claim(db, 'c1', CLAIM_TIMEOUT - 60)
+
+    assert not claim(db)
+    assert db.get_processed_comment_ids(['c1'], CLAIM_TIMEOUT) == {'c1': 'pending'}
+
+
+def test_recorded_comment_is_never_reclaimed(db):
+    assert claim(db)
+    db.add_processed_comment('c1', 'm1', 'alice', 'u1', 'info please', 'info', 'encouraged_to_dm')
+    age_claim(db, 'c1', CLAIM_TIMEOUT * 10)
+
+    assert not claim(db)
+    assert db.get_processed_comment_ids(['c1'], CLAIM_TIMEOUT) == {'c1': 'encouraged_to_dm'}
+
+
+def test_without_a_timeout_claims_never_expire(db):
+    assert db.claim_comment('c1', 'm1', 'alice', 'u1', 'info please', 'info')
+    age_claim(db, 'c1', CLAIM_TIMEOUT * 10)
+
+    assert not db.claim_comment('c1', 'm1', 'alice', 'u1', 'info please', 'info')
+    assert db.get_processed_comment_ids(['c1']) == {'c1': 'pending'}
@@ -0,0 +1,142 @@
+from types import SimpleNamespace
+
+import pytest
+
+from campaigns import CampaignIndex
+from comment_pipeline import NormalizedComment
+from decision_engine import Action, DecisionConfig, KeywordMatcher, decide_batch
+
+
+def settings(**overrides):
+    values = {
+        'KEYWORD_STRATEGY': 'consent_required',
+        'ENABLE_DIRECT_DM': True,
+        'DEFAULT_LINK': 'https://example.com/guide',
+        'KEYWORDS': ['dm me', 'info', 'link'],
+        'CONSENT_KEYWORDS': ['dm me'],
+        'COMMENT_REPLY_CONSENT': 'Hi @{username}! Check your DMs for the {keyword} link',
+        'COMMENT_REPLY_INTEREST': 'Hi @{username}! Here it is: {link}',
+        'COMMENT_REPLY_ENCOURAGEMENT': 'DM us {keyword} @{username}'
+    }
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def comment(text, comment_id='c1', author_id='u1', media_id='m1'):
+    return NormalizedComment(comment_id, text, author_id, 'alice', media_id, 'add', 'webhook')
+
+
+class FakeCampaignDb:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get_campaigns_signature(self):
+        return len(self.rows)
+
+    def get_campaigns(self, active_only=False):
+        return self.rows
+
+
+def test_keyword_matcher_returns_first_configured_keyword():
+    matcher = KeywordMatcher(['link', 'dm me', '', 'DM'])
+
+    assert matcher.keywords == ('link', 'dm me', 'DM')
+    assert matcher.match('please dm me the link') == 'link'
+    assert matcher.match('dm me please') == 'dm me'
+    assert matcher.match('nothing here') is None
+
+
+def test_consent_strategy_sends_dm_with_reply_fallback():
+    cfg = DecisionConfig.from_config(settings())
+
+    decision, = decide_batch([comment('Please DM ME')], cfg)
+
+    assert decision.keyword == 'dm me'
+    assert decision.reason == 'consent'
+    assert [action.kind for action in decision.actions] == ['dm', 'reply']
+    dm, reply = decision.actions
+    assert dm.target == 'u1'
+    assert 'https://example.com/guide' in dm.message
+    assert dm.action_taken == 'direct_dm_sent_with_consent'
+    assert reply.target == 'c1'
+    assert reply.message == 'Hi @alice! Check your DMs for the dm me link'
+
+
+def test_consent_strategy_without_consent_only_encourages():
+    cfg = DecisionConfig.from_config(settings())
+
+    decision, = decide_batch([comment('more info?')], cfg)
+
+    assert decision.keyword == 'info'
+    assert decision.reason == 'no_consent'
+    assert decision.actions == (Action('reply', 'c1', 'DM us info @alice', 'encouraged_to_dm'),)
+
+
+def test_any_keyword_strategy_dms_every_match():
+    cfg = DecisionConfig.from_config(settings(KEYWORD_STRATEGY='any_keyword'))
+
+    decision, = decide_batch([comment('send the link')], cfg)
+
+    assert decision.reason == 'any_keyword'
+    assert [(action.kind, action.action_taken) for action in decision.actions] == [
+        ('dm', 'direct_dm_sent_any_keyword'),
+        ('reply', 'comment_reply_fallback_any_keyword')
+    ]
+    assert decision.actions[1].message == 'Hi @alice! Here it is: https://example.com/guide'
+
+
+@pytest.mark.parametrize('config, text, author_id, reason', [
+    (settings(), 'great post', 'u1', 'no_keyword'),
+    (settings(ENABLE_DIRECT_DM=False), 'dm me', 'u1', 'dm_disabled_or_no_author'),
+    (settings(), 'dm me', None, 'dm_disabled_or_no_author'),
+    (settings(KEYWORD_STRATEGY='something_else'), 'dm me', 'u1', 'unknown_strategy'),
+])
+def test_no_action(config, text, author_id, reason):
+    decision, = decide_batch([comment(text, author_id=author_id)], DecisionConfig.from_config(config))
+
+    assert decision.actions == ()
+    assert decision.reason == reason
+
+
+def test_dm_template_choice_is_deterministic():
+    cfg = DecisionConfig.from_config(settings())
+    batch = [comment('dm me', comment_id=f'c{number}') for number in range(20)]
+
+    first = [decision.actions[0].message for decision in decide_batch(batch, cfg)]
+    second = [decision.actions[0].message for decision in decide_batch(batch, cfg)]
+
+    assert first == second
+    assert len(set(first)) > 1
+
+
+def test_campaign_overrides_apply_to_their_post_only():
+    cfg = DecisionConfig.from_config(settings())
+    campaigns = CampaignIndex(FakeCampaignDb([{
+        'media_id': 'promo',
+        'keywords': ['giveaway'],
+        'strategy': 'any_keyword',
+        'link': 'https://example.com/promo',
+        'dm_message': 'Hey {username}, enter here: {link}',
+        'reply_interest': 'Entered @{username}!'
+    }]))
+    campaigns.refresh(force=True)
+
+    promo, other, promo_default_keyword = decide_batch([
+        comment('giveaway!', comment_id='c1', media_id='promo'),
+        comment('giveaway!', comment_id='c2', media_id='m1'),
+        comment('dm me', comment_id='c3', media_id='promo'),
+    ], cfg, campaigns.config_for)
+
+    assert promo.reason == 'any_keyword'
+    assert promo.actions[0].message == 'Hey alice, enter here: https://example.com/promo'
+    assert promo.actions[1].message == 'Entered @alice!'
+    assert other.reason == 'no_keyword'
+    assert promo_default_keyword.reason == 'no_keyword'
+
+
+def test_invalid_reply_template_falls_back():
+    cfg = DecisionConfig.from_config(settings(COMMENT_REPLY_ENCOURAGEMENT='DM us {coupon}'))
+
+    decision, = decide_batch([comment('info')], cfg)
+
+    assert decision.actions[0].message == "Hi @alice! Please DM me and I'll send you the details! 📩"
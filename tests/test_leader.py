@@ -0,0 +1,133 @@
+import os
+import time
+
+import pytest
+
+from leader import LeaderElection
+
+LEASE_SECONDS = 0.3
+
+
+@pytest.fixture
+def lease_db(tmp_path):
+    return str(tmp_path / 'leases.db')
+
+
+def election(db_file, identity, lease_seconds=LEASE_SECONDS):
+    """An election acting as the worker `identity` without starting its threads"""
+    leader = LeaderElection(db_file, lease_seconds)
+    for name in ('job', 'other'):
+        leader.add_job(name, lambda: None, interval=3600)
+    leader.identity = identity
+    leader._thread_pid = os.getpid()
+    return leader
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_only_one_worker_holds_a_lease(lease_db):
+    first, second = election(lease_db, 'a'), election(lease_db, 'b')
+
+    assert first.try_acquire('job')
+    assert not second.try_acquire('job')
+    assert first.is_leader('job')
+    assert not second.is_leader('job')
+    assert first.leaders()['job']['holder'] == 'a'
+
+
+def test_renewal_keeps_the_lease(lease_db):
+    first, second = election(lease_db, 'a'), election(lease_db, 'b')
+    first.try_acquire('job')
+    acquired_at = first.leaders()['job']['since']
+
+    # Renewing more often than the lease period never lets it expire
+    for _ in range(4):
+        time.sleep(LEASE_SECONDS / 3)
+        assert first.try_acquire('job')
+        assert not second.try_acquire('job')
+
+    lease = first.leaders()['job']
+    assert lease['since'] == acquired_at
+    assert lease['renewed_at'] > acquired_at
+
+
+def test_expired_lease_is_taken_over(lease_db):
+    first, second = election(lease_db, 'a'), election(lease_db, 'b')
+    first.try_acquire('job')
+
+    time.sleep(LEASE_SECONDS * 1.2)
+
+    assert not first.is_leader('job')
+    assert second.try_acquire('job')
+    assert not first.try_acquire('job')
+    assert second.leaders()['job']['holder'] == 'b'
+
+
+def test_release_all_hands_over_immediately_and_keeps_last_run(lease_db):
+    first, second = election(lease_db, 'a', lease_seconds=60), election(lease_db, 'b', lease_seconds=60)
+    first.try_acquire('job')
+    first.try_acquire('other')
+    first.record_run('job', 1234.5)
+
+    first.release_all()
+
+    assert not first.is_leader('job')
+    assert second.try_acquire('job')
+    assert second.try_acquire('other')
+    assert second.last_run_at('job') == 1234.5
+
+
+def test_release_all_leaves_other_holders_alone(lease_db):
+    first, second = election(lease_db, 'a', lease_seconds=60), election(lease_db, 'b', lease_seconds=60)
+    first.try_acquire('job')
+    second.try_acquire('other')
+
+    first.release_all()
+
+    assert second.try_acquire('other')
+    assert not election(lease_db, 'c', lease_seconds=60).try_acquire('other')
+
+
+def test_job_not_due_after_takeover_does_not_run(lease_db):
+    previous = election(lease_db, 'previous')
+    previous.try_acquire('job')
+    previous.record_run('job', time.time())
+    previous.release_all()
+
+    runs = []
+    leader = LeaderElection(lease_db, LEASE_SECONDS)
+    leader.add_job('job', lambda: runs.append(time.time()), interval=3600)
+    leader.start()
+    try:
+        assert wait_for(lambda: leader.is_leader('job'))
+        time.sleep(LEASE_SECONDS)
+        assert runs == []
+    finally:
+        leader.stop()
+
+
+def test_overdue_job_runs_and_records_its_run(lease_db):
+    previous = election(lease_db, 'previous')
+    previous.try_acquire('job')
+    previous.record_run('job', time.time() - 7200)
+    previous.release_all()
+
+    runs = []
+    leader = LeaderElection(lease_db, LEASE_SECONDS)
+    leader.add_job('job', lambda: runs.append(time.time()), interval=3600)
+    leader.start()
+    try:
+        assert wait_for(lambda: runs)
+        assert wait_for(lambda: leader.leaders()['job']['last_run_at'] >= runs[0] - 1)
+        time.sleep(LEASE_SECONDS)
+        assert len(runs) == 1
+        assert leader.leaders()['job']['runs'] == 1
+    finally:
+        leader.stop()
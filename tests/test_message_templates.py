@@ -0,0 +1,52 @@
+import pytest
+
+from message_templates import (DM_PLACEHOLDERS, REPLY_PLACEHOLDERS, TemplateError, compile_template,
+                               validate_template)
+
+
+def test_render_fills_placeholders():
+    template = compile_template('Hi {username}, here is {link} ({keyword})', DM_PLACEHOLDERS)
+
+    assert template.placeholders == {'username', 'link', 'keyword'}
+    assert template.render({'username': 'alice', 'link': 'https://x.y', 'keyword': 'INFO'}) == \
+        'Hi alice, here is https://x.y (INFO)'
+
+
+def test_escaped_braces_stay_literal():
+    template = compile_template('{{not a field}} @{username}', REPLY_PLACEHOLDERS)
+
+    assert template.render({'username': 'bob'}) == '{not a field} @bob'
+
+
+def test_valid_templates_pass():
+    assert validate_template('Hi @{username}! {link}', REPLY_PLACEHOLDERS) is None
+    assert validate_template('You said {comment}', DM_PLACEHOLDERS) is None
+    assert validate_template('No placeholders at all', REPLY_PLACEHOLDERS) is None
+
+
+def test_unknown_placeholder_is_rejected():
+    error = validate_template('Hi {first_name}!', REPLY_PLACEHOLDERS)
+
+    assert "Unknown placeholder '{first_name}'" in error
+    assert '{username}' in error
+
+
+def test_placeholder_allowed_in_dms_only_is_rejected_in_replies():
+    assert validate_template('You said {comment}', REPLY_PLACEHOLDERS).startswith("Unknown placeholder '{comment}'")
+
+
+@pytest.mark.parametrize('source, message', [
+    ('Hi {username', 'Invalid template'),
+    ('Hi {user.name}', "Invalid placeholder '{user.name}'"),
+    ('Hi {0}', "Invalid placeholder '{0}'"),
+    ('Hi {username!r}', 'Formatting options are not supported'),
+    ('Hi {username:>10}', 'Formatting options are not supported'),
+])
+def test_malformed_templates_are_rejected(source, message):
+    assert message in validate_template(source, REPLY_PLACEHOLDERS)
+    with pytest.raises(TemplateError):
+        compile_template(source, REPLY_PLACEHOLDERS)
+
+
+def test_non_text_template_is_rejected():
+    assert validate_template(None, REPLY_PLACEHOLDERS) == 'Template must be text'
@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+
+from config import Config
+from polling_scheduler import AdaptivePollScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def post(comments_count, post_id='p1'):
+    return {'id': post_id, 'comments_count': comments_count, 'timestamp': datetime.now(timezone.utc).isoformat()}
+
+
+def ids(posts):
+    return [item['id'] for item in posts]
+
+
+def test_new_post_stays_due_until_a_poll_succeeds():
+    clock = FakeClock()
+    scheduler = AdaptivePollScheduler(clock)
+
+    assert ids(scheduler.due_posts([post(5)])) == ['p1']
+    clock.now += 1
+    assert ids(scheduler.due_posts([post(5)])) == ['p1']
+
+    scheduler.mark_polled('p1', 5)
+    clock.now += 1
+    assert scheduler.due_posts([post(5)]) == []
+    assert scheduler.states['p1'].tier == 'cool'
+
+
+def test_failed_poll_does_not_demote_a_busy_post():
+    clock = FakeClock()
+    scheduler = AdaptivePollScheduler(clock)
+    scheduler.due_posts([post(0)])
+    scheduler.mark_polled('p1', 0)
+
+    clock.now += Config.POLL_INTERVAL_WARM
+    assert ids(scheduler.due_posts([post(3)])) == ['p1']
+    # The poll failed: nothing is marked, so the new comments still count as activity
+    clock.now += Config.POLL_INTERVAL_WARM
+    assert ids(scheduler.due_posts([post(3)])) == ['p1']
+    assert scheduler.states['p1'].tier == 'warm'
+
+    scheduler.mark_polled('p1', 3)
+    clock.now += Config.POLL_INTERVAL_WARM
+    assert scheduler.due_posts([post(3)]) == []
+    assert scheduler.states['p1'].tier == 'cool'
+
+
+def test_report_counts_skipped_posts():
+    clock = FakeClock()
+    scheduler = AdaptivePollScheduler(clock)
+    posts = [post(0, 'p1'), post(0, 'p2')]
+    scheduler.due_posts(posts)
+    scheduler.mark_polled('p1', 0)
+    scheduler.mark_polled('p2', 0)
+
+    for _ in range(3):
+        clock.now += Config.POLL_TICK_SECONDS
+        scheduler.due_posts(posts)
+
+    report = scheduler.report()
+    assert report['posts_skipped_last_hour'] == 6
+    assert report['tiers'] == {'cool': 2}
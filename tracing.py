@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Lightweight request tracing
+A trace is opened per webhook delivery; spans around pipeline stages, SQLite
+queries and Graph API calls attach to it through a context variable. Finished
+traces go to a per-process ring buffer read by the /debug/traces page.
+Outside a trace, span() costs a single context variable lookup.
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Finished traces kept in memory per worker
+TRACE_BUFFER_SIZE = 500
+
+# Spans recorded per trace before further spans are dropped
+MAX_SPANS_PER_TRACE = 200
+
+_current: ContextVar[Optional['Trace']] = ContextVar('current_trace', default=None)
+
+_buffer = deque(maxlen=TRACE_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+
+class Span:
+    """One timed step inside a trace"""
+
+    __slots__ = ('name', 'depth', 'offset_ms', 'duration_ms', 'attributes')
+
+    def __init__(self, name: str, depth: int, offset_ms: float, attributes: Dict):
+        self.name = name
+        self.depth = depth
+        self.offset_ms = offset_ms
+        self.duration_ms = 0.0
+        self.attributes = attributes
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'offset_ms': round(self.offset_ms, 3),
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes
+        }
+
+
+class Trace:
+    """Spans recorded while handling one unit of work"""
+
+    def __init__(self, name: str, attributes: Dict):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        self.started_at = datetime.now()
+        self.duration_ms = 0.0
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+
+        self._started = time.perf_counter()
+        self._depth = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'attributes': self.attributes,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration_ms, 3),
+            'spans': [span.to_dict() for span in self.spans],
+            'dropped_spans': self.dropped_spans,
+            'breakdown': self.breakdown()
+        }
+
+    def breakdown(self) -> Dict[str, float]:
+        """Total milliseconds per top-level span name"""
+        totals = {}
+        for span in self.spans:
+            if span.depth == 0:
+                totals[span.name] = round(totals.get(span.name, 0.0) + span.duration_ms, 3)
+        return totals
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Open a trace for the current context and record it to the ring buffer when done"""
+    trace = Trace(name, attributes)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.duration_ms = (time.perf_counter() - trace._started) * 1000
+        _current.reset(token)
+        with _buffer_lock:
+            _buffer.append(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a step of the current trace; does nothing when no trace is active"""
+    trace = _current.get()
+    if trace is None:
+        yield None
+        return
+
+    if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+        trace.dropped_spans += 1
+        yield None
+        return
+
+    started = time.perf_counter()
+    record = Span(name, trace._depth, (started - trace._started) * 1000, attributes)
+    trace.spans.append(record)
+    trace._depth += 1
+    try:
+        yield record
+    finally:
+        trace._depth -= 1
+        record.duration_ms = (time.perf_counter() - started) * 1000
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.trace_id if trace else None
+
+
+def recent_traces(limit: int = 50) -> List[Trace]:
+    """Most recent finished traces, newest first"""
+    with _buffer_lock:
+        traces = list(_buffer)
+    return traces[::-1][:limit]
+
+
+def slowest_traces(limit: int = 20, name: Optional[str] = None) -> List[Trace]:
+    """Slowest finished traces in the buffer, optionally only those with a given name"""
+    with _buffer_lock:
+        traces = list(_buffer)
+    if name:
+        traces = [trace for trace in traces if trace.name == name]
+    return sorted(traces, key=lambda trace: trace.duration_ms, reverse=True)[:limit]
+
+
+def find_trace(trace_id: str) -> Optional[Trace]:
+    with _buffer_lock:
+        for trace in _buffer:
+            if trace.trace_id == trace_id:
+                return trace
+    return None
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Background warm-up and readiness
+The web app accepts traffic as soon as it is imported; network work (token
+validation, cache warming) runs afterwards in a
+background thread. Each step's outcome and the time to serve / time to ready
+are recorded for /healthz and /readyz.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import metrics
+
+# Measured from the first import of this module (imported early by web_app)
+STARTED_AT = time.monotonic()
+
+STEP_PENDING = 'pending'
+STEP_RUNNING = 'running'
+STEP_OK = 'ok'
+STEP_SKIPPED = 'skipped'
+STEP_FAILED = 'failed'
+
+
+class SkipStep(Exception):
+    """Raised by a step that has nothing to do (e.g. no credentials configured)"""
+
+
+class WarmUp:
+    """Runs named warm-up steps in order on a background thread"""
+
+    def __init__(self):
+        self.steps: 'OrderedDict[str, Callable[[], None]]' = OrderedDict()
+        self.results: Dict[str, Dict] = {}
+        self.logger = logging.getLogger(__name__)
+
+        self.started_at = STARTED_AT
+        self.serving_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def add_step(self, name: str, func: Callable[[], None]):
+        self.steps[name] = func
+        self.results[name] = {'status': STEP_PENDING, 'duration_ms': None, 'error': None}
+
+    def restart_clock(self):
+        """Measure from now (a freshly forked worker)"""
+        self.started_at = time.monotonic()
+        self.serving_at = None
+        self.ready_at = None
+
+    def mark_serving(self):
+        """Record that the app is importable and can accept requests"""
+        if self.serving_at is None:
+            self.serving_at = time.monotonic()
+            seconds = self.serving_at - self.started_at
+            metrics.STARTUP_SECONDS.labels('serving').set(seconds)
+            self.logger.info(f"⚡ Serving after {seconds * 1000:.0f}ms")
+
+    def start(self):
+        """Start the warm-up thread (once per process; safe to call again after a fork)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self.ready_at = None
+            for result in self.results.values():
+                result.update(status=STEP_PENDING, duration_ms=None, error=None)
+            self._thread = threading.Thread(target=self._run, name='warm-up', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        for name, func in self.steps.items():
+            result = self.results[name]
+            result['status'] = STEP_RUNNING
+            started = time.perf_counter()
+            try:
+                func()
+                result['status'] = STEP_OK
+            except SkipStep as e:
+                result['status'] = STEP_SKIPPED
+                result['error'] = str(e) or None
+            except Exception as e:
+                result['status'] = STEP_FAILED
+                result['error'] = str(e)
+                self.logger.error(f"❌ Warm-up step '{name}' failed: {e}")
+            result['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+        self.ready_at = time.monotonic()
+        seconds = self.ready_at - self.started_at
+        metrics.STARTUP_SECONDS.labels('warm').set(seconds)
+        self.logger.info(f"✅ Warm-up finished after {seconds * 1000:.0f}ms")
+
+    @property
+    def finished(self) -> bool:
+        return self.ready_at is not None
+
+    def status(self) -> Dict:
+        return {
+            'finished': self.finished,
+            'degraded': any(result['status'] == STEP_FAILED for result in self.results.values()),
+            'time_to_serve_ms': self._elapsed_ms(self.serving_at),
+            'time_to_ready_ms': self._elapsed_ms(self.ready_at),
+            'uptime_seconds': round(time.monotonic() - self.started_at, 1),
+            'steps': {name: dict(result) for name, result in self.results.items()}
+        }
+
+    def _elapsed_ms(self, at: Optional[float]) -> Optional[float]:
+        return round((at - self.started_at) * 1000, 1) if at is not None else None
@@ -5,17 +5,34 @@ import os
 import json
 import logging
 from datetime import datetime, timedelta
-from threading import Thread
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from threading import Thread, Lock
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
+import warmup
 from instagram_bot import InstagramBot
 from config import Config
 from database import Database
+from reconciliation import ReconciliationSweeper
+from campaigns import validate_campaign
+from decision_engine import DecisionConfig
+from comment_pipeline import DMRateLimiter
+from message_templates import DM_PLACEHOLDERS, REPLY_PLACEHOLDERS, validate_template
+from status_store import SharedStatus
+from live_events import LiveFeed
+from account_registry import AccountRegistry
+from leader import LeaderElection
+from webhook_journal import WebhookJournal
+from instagram_business_api import request_token_refresh
 import time
 import random
-import requests
+import graph_client
+import metrics
+import tracing
+import profiler
 import secrets
+import hmac
 import urllib.parse
+from functools import wraps
 
 # Configure logging
 logging.basicConfig(
@@ -34,36 +51,82 @@ CORS(app)
 
 # Global variables
 bot = None
-bot_status = {
-    'webhook_active': False,
-    'authenticated': False,
-    'last_webhook_received': None,
-    'total_webhooks_processed': 0,
-    'total_dms_sent': 0,
-    'error_message': None,
-    'capabilities': {
-        'real_time_webhooks': True,
-        'direct_dm_sending': True,
-        'consent_detection': True,
-        'instant_response': True
+bot_init_lock = Lock()
+bot_init_failed_at = None
+BOT_INIT_RETRY_SECONDS = 60
+
+# Shared by all workers: activating or deactivating in one worker applies everywhere
+bot_status = SharedStatus(
+    Config.STATUS_DATABASE_FILE,
+    defaults={
+        'webhook_active': False,
+        'authenticated': False,
+        'last_webhook_received': None,
+        'total_webhooks_processed': 0,
+        'error_message': None
+    },
+    counters=('total_webhooks_processed',),
+    static={
+        'capabilities': {
+            'real_time_webhooks': True,
+            'direct_dm_sending': True,
+            'consent_detection': True,
+            'instant_response': True
+        }
     }
-}
+)
+
+def require_admin(view):
+    """Allow a view only with the ADMIN_TOKEN (X-Admin-Token header or ?token=)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        supplied = request.headers.get('X-Admin-Token') or request.args.get('token') or ''
+        if not Config.ADMIN_TOKEN or not hmac.compare_digest(supplied, Config.ADMIN_TOKEN):
+            return jsonify({'success': False, 'message': 'Admin token required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+# Bots for every account this deployment serves, keyed by Instagram user id
+accounts = AccountRegistry()
+
+# Pushes new activity and counters to open dashboards (one producer per worker)
+live_feed = LiveFeed(bot_status)
+
+# Raw webhook bodies for audit and replay (python webhook_journal.py --help)
+journal = WebhookJournal(
+    Config.WEBHOOK_JOURNAL_DIR,
+    segment_bytes=Config.WEBHOOK_JOURNAL_SEGMENT_BYTES,
+    segment_seconds=Config.WEBHOOK_JOURNAL_SEGMENT_SECONDS,
+    buffer_bytes=Config.WEBHOOK_JOURNAL_BUFFER_BYTES,
+    flush_seconds=Config.WEBHOOK_JOURNAL_FLUSH_SECONDS,
+    max_bytes=Config.WEBHOOK_JOURNAL_MAX_BYTES
+)
+
+# Account info shown on the dashboard is cached instead of fetched per page load
+ACCOUNT_INFO_CACHE_SECONDS = 300
+account_info_cache = {'key': None, 'value': None, 'fetched_at': 0.0}
+
+@app.before_request
+def refresh_config():
+    """Pick up configuration saved by other workers (one stat per second at most)"""
+    Config.refresh_if_changed()
 
 @app.context_processor
 def inject_bot_status():
     """Make bot_status available to all templates"""
-    return dict(bot_status=bot_status)
+    return dict(bot_status=bot_status.snapshot())
 
-def init_bot():
+def init_bot(subscribe_webhooks=True):
     """Initialize the Instagram bot (authentication only)"""
     global bot
     try:
         bot = InstagramBot()
         if bot.login():
+            accounts.register(bot)
             bot_status['authenticated'] = True
             bot_status['error_message'] = None
             # Set up webhooks if not already done
-            if hasattr(bot, 'setup_webhooks'):
+            if subscribe_webhooks and hasattr(bot, 'setup_webhooks'):
                 bot.setup_webhooks()
             return True
         else:
@@ -76,6 +139,106 @@ def init_bot():
         logging.error(f"Bot initialization error: {e}")
         return False
 
+# Startup: network work runs in the background so the app serves immediately
+warm_up = warmup.WarmUp()
+
+def warm_authenticate():
+    """Validate the stored token and create this worker's bot"""
+    if not Config.INSTAGRAM_ACCESS_TOKEN or not Config.INSTAGRAM_USER_ID:
+        raise warmup.SkipStep('Instagram account not connected')
+    if not init_bot(subscribe_webhooks=False):
+        raise Exception(bot_status['error_message'])
+
+def warm_caches():
+    """Open the Graph API pool and build the per-config caches before the first comment"""
+    graph_client.get_session()
+    Config.derived('decision_config', DecisionConfig.from_config)
+    refresh_campaigns()
+    get_instagram_account_info()
+
+warm_up.add_step('auth', warm_authenticate)
+warm_up.add_step('caches', warm_caches)
+
+def ensure_bot():
+    """
+    Return this worker's logged-in bot, initializing it if processing was
+    activated in another worker (failed attempts are retried after a delay)
+    
+    Runs on the webhook request path, so it only logs in: warm-up logs in at
+    startup and the webhook_subscription job keeps the subscription in place.
+    """
+    global bot_init_failed_at
+    if bot and bot.logged_in:
+        return bot
+    if not bot_status['webhook_active']:
+        return None
+    
+    with bot_init_lock:
+        if bot and bot.logged_in:
+            return bot
+        if bot_init_failed_at and time.time() - bot_init_failed_at < BOT_INIT_RETRY_SECONDS:
+            return None
+        
+        logging.info(f"🔄 Initializing bot in worker {os.getpid()} (activated by another worker)")
+        if init_bot(subscribe_webhooks=False):
+            bot_init_failed_at = None
+            return bot
+        bot_init_failed_at = time.time()
+        return None
+
+def bot_for_entry(entry):
+    """Route a webhook entry to the bot of the account it belongs to (entry id = account user id)"""
+    account_id = entry.get('id')
+    if not account_id or str(account_id) == str(Config.INSTAGRAM_USER_ID or ''):
+        return ensure_bot()
+    return accounts.get(account_id)
+
+def refresh_campaigns():
+    """Reload the campaign index of every loaded account"""
+    for account_bot in accounts.loaded():
+        account_bot.pipeline.campaigns.refresh(force=True)
+
+def run_reconciliation():
+    """Backfill comments missed by webhooks (only while processing is active)"""
+    worker_bot = ensure_bot()
+    if not worker_bot:
+        logging.info("⏭️ Skipping reconciliation sweep - webhook processing inactive")
+        return None
+    return ReconciliationSweeper(worker_bot).sweep()
+
+def run_webhook_subscription():
+    """Make sure the account is subscribed to comment webhooks (one worker per deployment, not one per boot)"""
+    worker_bot = ensure_bot()
+    if not worker_bot:
+        logging.info("⏭️ Skipping webhook subscription check - webhook processing inactive")
+        return None
+    if not worker_bot.setup_webhooks():
+        raise Exception('Webhook subscription failed')
+
+def run_token_refresh():
+    """Extend the long-lived tokens of the OAuth-connected account and every stored account"""
+    if Config.INSTAGRAM_ACCESS_TOKEN:
+        refreshed = request_token_refresh(Config.INSTAGRAM_ACCESS_TOKEN)
+        if refreshed:
+            Config.update(INSTAGRAM_ACCESS_TOKEN=refreshed[0])
+            logging.info(f"✅ Access token refreshed (expires in {refreshed[1]} seconds)")
+    
+    db = Database()
+    for account in db.get_accounts(active_only=True):
+        if not account['access_token']:
+            continue
+        refreshed = request_token_refresh(account['access_token'])
+        if refreshed:
+            db.save_account({**account, 'access_token': refreshed[0]})
+            accounts.invalidate(account['user_id'])
+            logging.info(f"✅ Access token refreshed for account {account['user_id']}")
+
+# Periodic jobs run by exactly one worker, chosen through leases in the shared status database
+jobs = LeaderElection(Config.STATUS_DATABASE_FILE, Config.LEADER_LEASE_SECONDS)
+jobs.add_job('reconciliation', run_reconciliation, Config.RECONCILE_INTERVAL_SECONDS)
+jobs.add_job('token_refresh', run_token_refresh, Config.TOKEN_REFRESH_INTERVAL_SECONDS)
+jobs.add_job('webhook_subscription', run_webhook_subscription, Config.WEBHOOK_SUBSCRIPTION_CHECK_SECONDS)
+
 @app.route('/')
 def dashboard():
     """Main dashboard page"""
@@ -84,12 +247,19 @@ def dashboard():
         db = Database()
         recent_comments = db.get_recent_processed_comments(10)
         
-        # Update webhook statistics
-        bot_status['total_dms_sent'] = len([c for c in recent_comments if 'dm_sent' in str(c)])
+        # Update webhook statistics (the live feed keeps these current after page load)
+        live_stats = live_feed.current_stats()
+        if live_stats:
+            total_processed = live_stats['total_processed']
+            total_dms_sent = live_stats['total_dms_sent']
+        else:
+            total_processed = db.count_processed_comments()
+            total_dms_sent = db.count_sent_dms()
         
         # Get bot statistics
         stats = {
-            'total_processed': len(db.get_recent_processed_comments(1000)),
+            'total_processed': total_processed,
+            'total_dms_sent': total_dms_sent,
             'recent_activity': recent_comments,
             'keywords': Config.KEYWORDS,
             'consent_keywords': Config.CONSENT_KEYWORDS,
@@ -114,7 +284,7 @@ def dashboard():
         account_info = get_instagram_account_info()
         
         return render_template('dashboard.html', 
-                             bot_status=bot_status, 
+                             bot_status=bot_status.snapshot(), 
                              stats=stats,
                              account_info=account_info)
                              
@@ -122,7 +292,7 @@ def dashboard():
         logging.error(f"Dashboard error: {e}")
         flash(f"Error loading dashboard: {str(e)}", 'error')
         return render_template('dashboard.html', 
-                             bot_status=bot_status, 
+                             bot_status=bot_status.snapshot(), 
                              stats={},
                              account_info=None)
 
@@ -206,12 +376,12 @@ def config_page():
             'webhook_verify_token': Config.WEBHOOK_VERIFY_TOKEN
         }
         
-        return render_template('config.html', config=config_data, bot_status=bot_status)
+        return render_template('config.html', config=config_data, bot_status=bot_status.snapshot())
         
     except Exception as e:
         logging.error(f"Config page error: {e}")
         flash(f'Error loading configuration: {str(e)}', 'error')
-        return render_template('config.html', config={}, bot_status=bot_status)
+        return render_template('config.html', config={}, bot_status=bot_status.snapshot())
 
 @app.route('/logs')
 def logs_page():
@@ -226,17 +396,127 @@ def logs_page():
                 log_entries = lines[-100:] if len(lines) > 100 else lines
                 log_entries.reverse()  # Show newest first
         
-        return render_template('logs.html', logs=log_entries, bot_status=bot_status)
+        return render_template('logs.html', logs=log_entries, bot_status=bot_status.snapshot())
         
     except Exception as e:
         logging.error(f"Logs page error: {e}")
         flash(f'Error loading logs: {str(e)}', 'error')
-        return render_template('logs.html', logs=[], bot_status=bot_status)
+        return render_template('logs.html', logs=[], bot_status=bot_status.snapshot())
+
+@app.route('/debug/profiles')
+def profiles_page():
+    """Saved profiles from all workers"""
+    try:
+        return render_template('profiles.html', profiles=profiler.list_profiles(),
+                               sampling=profiler.sampling_status(), bot_status=bot_status.snapshot())
+    except Exception as e:
+        logging.error(f"Profiles page error: {e}")
+        flash(f'Error loading profiles: {str(e)}', 'error')
+        return render_template('profiles.html', profiles=[], sampling=None, bot_status=bot_status.snapshot())
+
+@app.route('/debug/profiles/<path:name>')
+@require_admin
+def download_profile(name):
+    """Download a saved profile"""
+    if not name.endswith(profiler.PROFILE_EXTENSIONS):
+        return 'Not Found', 404
+    return send_from_directory(os.path.abspath(Config.PROFILE_DIR), name, as_attachment=True)
+
+@app.route('/api/profile', methods=['POST'])
+@require_admin
+def api_start_profile():
+    """Start a time-boxed sampling profile of the worker handling this request"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Expected a JSON object'}), 400
+    error = profiler.validate_sampling(data.get('duration'), data.get('interval'))
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    path = profiler.start_sampling(data.get('duration'), data.get('interval'))
+    if not path:
+        return jsonify({
+            'success': False,
+            'message': 'A sampling profile is already running in this worker',
+            'sampling': profiler.sampling_status()
+        }), 409
+    
+    return jsonify({
+        'success': True,
+        'message': f'Sampling profile started in worker {os.getpid()}',
+        'profile': os.path.basename(path)
+    })
 
 @app.route('/api/status')
 def api_status():
     """API endpoint for bot status"""
-    return jsonify(bot_status)
+    status = bot_status.snapshot()
+    status['accounts'] = accounts.stats()  # Bots loaded in the worker answering this request
+    status['leaders'] = jobs.leaders()
+    status['worker'] = jobs.identity
+    status['journal'] = journal.stats()
+    return jsonify(status)
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok', 'pid': os.getpid(), 'uptime_seconds': warm_up.status()['uptime_seconds']})
+
+@app.route('/readyz')
+def readyz():
+    """
+    Readiness: local dependencies answer (database, shared status, config).
+    Warm-up progress is reported; with ?full=1 it must also have finished.
+    """
+    checks = {}
+    try:
+        Database().get_last_processed_comment_row_id()
+        checks['database'] = 'ok'
+    except Exception as e:
+        checks['database'] = f'error: {e}'
+    try:
+        bot_status['webhook_active']
+        checks['status_store'] = 'ok'
+    except Exception as e:
+        checks['status_store'] = f'error: {e}'
+    checks['config_version'] = Config.snapshot().version
+    
+    warm = warm_up.status()
+    ready = checks['database'] == 'ok' and checks['status_store'] == 'ok'
+    if request.args.get('full'):
+        ready = ready and warm['finished']
+    
+    return jsonify({'ready': ready, 'checks': checks, 'warm_up': warm}), 200 if ready else 503
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus exposition, aggregated across workers in multiprocess mode"""
+    try:
+        # Refresh the DM budget gauges so they are current at scrape time
+        DMRateLimiter(Database()).remaining()
+    except Exception as e:
+        logging.error(f"Error refreshing DM budget metrics: {e}")
+    
+    body, content_type = metrics.render()
+    return body, 200, {'Content-Type': content_type}
+
+@app.route('/api/events')
+def api_events():
+    """Server-sent events: new processed comments ('comment') and counter changes ('stats')"""
+    retry_seconds = Config.LIVE_EVENTS_RETRY_SECONDS
+    subscriber = live_feed.subscribe(limit=Config.LIVE_EVENTS_MAX_STREAMS)
+    if subscriber is None:
+        return jsonify({'error': 'Too many live event streams on this worker'}), 503, \
+            {'Retry-After': str(int(retry_seconds))}
+    
+    response = Response(
+        stream_with_context(live_feed.stream(subscriber, Config.LIVE_EVENTS_STREAM_SECONDS, retry_seconds)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # A client that disconnects before the stream starts never runs the generator's cleanup
+    response.call_on_close(lambda: live_feed.unsubscribe(subscriber))
+    return response
 
 @app.route('/api/stats')
 def api_stats():
@@ -246,13 +526,28 @@ def api_stats():
     
     return jsonify({
         'total_processed': len(db.get_recent_processed_comments(1000)),
-        'total_dms_sent': len([c for c in recent_comments if 'dm_sent' in str(c)]),
+        'total_dms_sent': db.count_sent_dms(),
         'webhook_active': bot_status['webhook_active'],
         'authenticated': bot_status['authenticated'],
         'recent_activity': recent_comments[:5],  # Last 5 for API
         'last_update': datetime.now().isoformat()
     })
 
+@app.route('/api/reconcile', methods=['POST'])
+def api_reconcile():
+    """Run a reconciliation sweep now"""
+    try:
+        summary = run_reconciliation()
+        if summary is None:
+            return jsonify({
+                'success': False,
+                'message': 'Webhook processing not active or bot not authenticated'
+            }), 400
+        return jsonify({'success': True, 'summary': summary})
+    except Exception as e:
+        logging.error(f"Error running reconciliation: {e}")
+        return jsonify({'success': False, 'message': f'Error running reconciliation: {str(e)}'}), 500
+
 @app.route('/api/update-post-monitoring', methods=['POST'])
 def api_update_post_monitoring():
     """Update post monitoring configuration"""
@@ -261,12 +556,8 @@ def api_update_post_monitoring():
         monitor_all = data.get('monitor_all_posts', False)
         monitored_ids = data.get('monitored_post_ids', [])
         
-        # Update configuration
-        Config.MONITOR_ALL_POSTS = monitor_all
-        Config.MONITORED_POST_IDS = monitored_ids
-        
-        # Save to runtime config
-        if Config.save_runtime_config():
+        # Update and save configuration in one atomic step
+        if Config.update(MONITOR_ALL_POSTS=monitor_all, MONITORED_POST_IDS=monitored_ids):
             logging.info(f"Updated post monitoring: all_posts={monitor_all}, specific_ids={len(monitored_ids)}")
             return jsonify({
                 'success': True,
@@ -298,11 +589,8 @@ def api_update_keyword_strategy():
                 'message': 'Invalid keyword strategy. Must be "consent_required" or "any_keyword"'
             }), 400
         
-        # Update configuration
-        Config.KEYWORD_STRATEGY = strategy
-        
-        # Save to runtime config
-        if Config.save_runtime_config():
+        # Update and save configuration in one atomic step
+        if Config.update(KEYWORD_STRATEGY=strategy):
             strategy_name = "Consent Required (ManyChat Style)" if strategy == 'consent_required' else "Any Keyword (Traditional)"
             logging.info(f"Updated keyword strategy to: {strategy}")
             return jsonify({
@@ -328,13 +616,27 @@ def api_save_comment_templates():
     try:
         data = request.get_json()
         
-        # Update Config with new templates
-        Config.COMMENT_REPLY_CONSENT = data.get('consent_reply', Config.COMMENT_REPLY_CONSENT)
-        Config.COMMENT_REPLY_INTEREST = data.get('interest_reply', Config.COMMENT_REPLY_INTEREST)
-        Config.COMMENT_REPLY_ENCOURAGEMENT = data.get('encouragement_reply', Config.COMMENT_REPLY_ENCOURAGEMENT)
+        templates = {
+            'COMMENT_REPLY_CONSENT': data.get('consent_reply', Config.COMMENT_REPLY_CONSENT),
+            'COMMENT_REPLY_INTEREST': data.get('interest_reply', Config.COMMENT_REPLY_INTEREST),
+            'COMMENT_REPLY_ENCOURAGEMENT': data.get('encouragement_reply', Config.COMMENT_REPLY_ENCOURAGEMENT)
+        }
+        
+        # Reject bad placeholders now rather than at send time
+        errors = {}
+        for name, template in templates.items():
+            error = validate_template(template, REPLY_PLACEHOLDERS)
+            if error:
+                errors[name] = error
+        if errors:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid comment templates: ' + '; '.join(errors.values()),
+                'errors': errors
+            }), 400
         
-        # Save to runtime config
-        if Config.save_runtime_config():
+        # Update and save templates in one atomic step
+        if Config.update(**templates):
             logging.info("Comment reply templates updated successfully")
             return jsonify({
                 'success': True,
@@ -353,6 +655,100 @@ def api_save_comment_templates():
             'message': f'Error saving comment templates: {str(e)}'
         }), 500
 
+@app.route('/api/campaigns', methods=['GET'])
+def api_list_campaigns():
+    """List per-post campaign rules"""
+    db = Database()
+    return jsonify({'success': True, 'campaigns': db.get_campaigns()})
+
+@app.route('/api/campaigns', methods=['POST'])
+def api_save_campaign():
+    """Create or replace the campaign for a post"""
+    try:
+        data = request.get_json() or {}
+        
+        error = validate_campaign(data)
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
+        
+        db = Database()
+        db.save_campaign(data)
+        refresh_campaigns()
+        
+        logging.info(f"📣 Saved campaign for post {data['media_id']}")
+        return jsonify({'success': True, 'message': f"Campaign saved for post {data['media_id']}"})
+        
+    except Exception as e:
+        logging.error(f"Error saving campaign: {e}")
+        return jsonify({'success': False, 'message': f'Error saving campaign: {str(e)}'}), 500
+
+@app.route('/api/campaigns/<media_id>', methods=['DELETE'])
+def api_delete_campaign(media_id):
+    """Delete the campaign for a post"""
+    try:
+        db = Database()
+        if not db.delete_campaign(media_id):
+            return jsonify({'success': False, 'message': f'No campaign for post {media_id}'}), 404
+        refresh_campaigns()
+        return jsonify({'success': True, 'message': f'Campaign deleted for post {media_id}'})
+        
+    except Exception as e:
+        logging.error(f"Error deleting campaign: {e}")
+        return jsonify({'success': False, 'message': f'Error deleting campaign: {str(e)}'}), 500
+
+@app.route('/api/accounts', methods=['GET'])
+def api_list_accounts():
+    """List the accounts this deployment serves (tokens are never returned)"""
+    db = Database()
+    stored = [{key: value for key, value in account.items() if key != 'access_token'}
+              for account in db.get_accounts()]
+    return jsonify({
+        'success': True,
+        'primary_account_id': Config.INSTAGRAM_USER_ID,
+        'accounts': stored,
+        'loaded': accounts.stats()
+    })
+
+@app.route('/api/accounts', methods=['POST'])
+@require_admin
+def api_save_account():
+    """Add or update an account whose webhooks should be routed to its own bot"""
+    try:
+        data = request.get_json() or {}
+        if not str(data.get('user_id') or '').strip():
+            return jsonify({'success': False, 'message': 'user_id is required'}), 400
+        
+        data['user_id'] = str(data['user_id']).strip()
+        db = Database()
+        existing = db.get_account(data['user_id']) or {}
+        if not data.get('access_token') and not existing.get('access_token'):
+            return jsonify({'success': False, 'message': 'access_token is required'}), 400
+        
+        db.save_account({**existing, **data})
+        accounts.invalidate(data['user_id'])
+        
+        logging.info(f"👤 Saved account {data['user_id']}")
+        return jsonify({'success': True, 'message': f"Account {data['user_id']} saved"})
+        
+    except Exception as e:
+        logging.error(f"Error saving account: {e}")
+        return jsonify({'success': False, 'message': f'Error saving account: {str(e)}'}), 500
+
+@app.route('/api/accounts/<user_id>', methods=['DELETE'])
+@require_admin
+def api_delete_account(user_id):
+    """Stop serving an account"""
+    try:
+        db = Database()
+        if not db.delete_account(user_id):
+            return jsonify({'success': False, 'message': f'No account {user_id}'}), 404
+        accounts.invalidate(user_id)
+        return jsonify({'success': True, 'message': f'Account {user_id} deleted'})
+        
+    except Exception as e:
+        logging.error(f"Error deleting account: {e}")
+        return jsonify({'success': False, 'message': f'Error deleting account: {str(e)}'}), 500
+
 @app.route('/manage_keywords')
 def manage_keywords():
     """Manage keywords and filtering settings (simplified for webhook architecture)"""
@@ -368,13 +764,13 @@ def manage_keywords():
         
         return render_template('manage_keywords.html', 
                              settings=current_settings,
-                             bot_status=bot_status)
+                             bot_status=bot_status.snapshot())
                              
     except Exception as e:
         logging.error(f"Error in manage_keywords: {e}")
         return render_template('manage_keywords.html', 
                              error=f"Error loading settings: {e}",
-                             bot_status=bot_status)
+                             bot_status=bot_status.snapshot())
 
 @app.route('/update_keywords', methods=['POST'])
 def update_keywords():
@@ -382,23 +778,28 @@ def update_keywords():
     try:
         # Update keywords
         keywords_text = request.form.get('keywords', '').strip()
-        Config.KEYWORDS = [k.strip() for k in keywords_text.split('\n') if k.strip()]
         
         # Update consent keywords (for direct DM)
         consent_text = request.form.get('consent_keywords', '').strip()
-        Config.CONSENT_KEYWORDS = [k.strip() for k in consent_text.split('\n') if k.strip()]
         
         # Update interest keywords (for public reply)
         interest_text = request.form.get('interest_keywords', '').strip()
-        Config.INTEREST_KEYWORDS = [k.strip() for k in interest_text.split('\n') if k.strip()]
         
-        # Update DM settings
-        Config.DM_MESSAGE = request.form.get('dm_message', Config.DM_MESSAGE)
-        Config.DEFAULT_LINK = request.form.get('default_link', Config.DEFAULT_LINK)
-        Config.ENABLE_DIRECT_DM = 'enable_direct_dm' in request.form
+        dm_message = request.form.get('dm_message', Config.DM_MESSAGE)
+        error = validate_template(dm_message, DM_PLACEHOLDERS)
+        if error:
+            flash(f"❌ Invalid DM message: {error}", 'error')
+            return redirect('/manage_keywords')
         
-        # Save configuration changes to persist across restarts
-        Config.save_runtime_config()
+        # Apply all keyword and DM settings as one change so readers never see a partial update
+        Config.update(
+            KEYWORDS=[k.strip() for k in keywords_text.split('\n') if k.strip()],
+            CONSENT_KEYWORDS=[k.strip() for k in consent_text.split('\n') if k.strip()],
+            INTEREST_KEYWORDS=[k.strip() for k in interest_text.split('\n') if k.strip()],
+            DM_MESSAGE=dm_message,
+            DEFAULT_LINK=request.form.get('default_link', Config.DEFAULT_LINK),
+            ENABLE_DIRECT_DM='enable_direct_dm' in request.form
+        )
         
         flash("✅ Keyword settings updated successfully!", 'success')
         
@@ -409,6 +810,73 @@ def update_keywords():
         flash(f"❌ Error updating settings: {e}", 'error')
         return redirect('/manage_keywords')
 
+def process_webhook_entries(data, source='webhook'):
+    """Route every comment change in a webhook body to its account's bot; returns the outcome"""
+    outcome = 'processed'
+    for entry in data.get('entry', []):
+        # Process comment changes
+        for changes in entry.get('changes', []):
+            if changes.get('field') == 'comments':
+                comment_data = changes.get('value', {})
+                
+                # Process comments (Instagram webhooks for comments are typically 'add' events)
+                # Only skip if explicitly marked as 'remove' or 'hide'
+                comment_verb = comment_data.get('verb', 'add')  # Default to 'add' if not specified
+                
+                if comment_verb not in ['remove', 'hide']:
+                    logging.info(f"🔄 Processing comment webhook (verb: {comment_verb})")
+                    worker_bot = bot_for_entry(entry)
+                    if worker_bot:
+                        # Process comment using ManyChat strategy
+                        success = worker_bot.process_comment_webhook(comment_data, source=source)
+                        accounts.record_comment(worker_bot.user_id, success)
+                        if success:
+                            logging.info(f"✅ Comment processed successfully - DM sent!")
+                        else:
+                            logging.warning(f"⚠️ Comment processed but no DM sent")
+                    else:
+                        outcome = 'bot_unavailable'
+                        logging.warning("❌ Bot not initialized or not logged in")
+                else:
+                    logging.info(f"⏭️ Skipping {comment_verb} comment event")
+    return outcome
+
+def handle_webhook_delivery(trace):
+    """Process one webhook POST; runs inside the delivery's trace"""
+    started = time.perf_counter()
+    outcome = 'processed'
+    try:
+        # Journal the body exactly as received, before anything can fail on it
+        raw = request.get_data()
+        journal.append(raw, trace_id=trace.trace_id)
+        
+        data = request.get_json()
+        trace.attributes['entries'] = len(data.get('entry', []))
+        logging.info(f"🔔 Instagram webhook received (trace {trace.trace_id}): "
+                     f"{trace.attributes['entries']} entries, {len(raw)} bytes")
+        
+        # Update webhook stats (one atomic update shared by all workers)
+        bot_status.increment('total_webhooks_processed', last_webhook_received=datetime.now())
+        
+        # Only process if webhook is active
+        if not bot_status['webhook_active']:
+            logging.warning("⚠️ Webhook received but processing is deactivated")
+            outcome = 'inactive'
+            return 'OK', 200
+        
+        outcome = process_webhook_entries(data)
+        return 'OK', 200
+        
+    except Exception as e:
+        outcome = 'error'
+        logging.error(f"❌ Error processing Instagram webhook: {e}")
+        return 'Error', 500
+    
+    finally:
+        metrics.WEBHOOK_LATENCY.observe(time.perf_counter() - started)
+        metrics.WEBHOOKS_RECEIVED.labels(outcome).inc()
+        trace.attributes['outcome'] = outcome
+
 @app.route('/webhook/instagram', methods=['GET', 'POST'])
 def instagram_webhook():
     """Handle Instagram webhook notifications (ManyChat approach)"""
@@ -425,52 +893,10 @@ def instagram_webhook():
             return 'Forbidden', 403
     
     elif request.method == 'POST':
-        # Process webhook notification
-        try:
-            data = request.get_json()
-            logging.info(f"🔔 Instagram webhook received: {data}")
-            
-            # Update webhook stats
-            bot_status['last_webhook_received'] = datetime.now()
-            bot_status['total_webhooks_processed'] += 1
-            
-            # Only process if webhook is active
-            if not bot_status['webhook_active']:
-                logging.warning("⚠️ Webhook received but processing is deactivated")
-                return 'OK', 200
-            
-            # Process each entry in the webhook data
-            for entry in data.get('entry', []):
-                # Process comment changes
-                for changes in entry.get('changes', []):
-                    if changes.get('field') == 'comments':
-                        comment_data = changes.get('value', {})
-                        
-                        # Process comments (Instagram webhooks for comments are typically 'add' events)
-                        # Only skip if explicitly marked as 'remove' or 'hide'
-                        comment_verb = comment_data.get('verb', 'add')  # Default to 'add' if not specified
-                        
-                        if comment_verb not in ['remove', 'hide']:
-                            logging.info(f"🔄 Processing comment webhook (verb: {comment_verb})")
-                            global bot
-                            if bot and bot.logged_in:
-                                # Process comment using ManyChat strategy
-                                success = bot.process_comment_webhook(comment_data)
-                                if success:
-                                    bot_status['total_dms_sent'] += 1
-                                    logging.info(f"✅ Comment processed successfully - DM sent!")
-                                else:
-                                    logging.warning(f"⚠️ Comment processed but no DM sent")
-                            else:
-                                logging.warning("❌ Bot not initialized or not logged in")
-                        else:
-                            logging.info(f"⏭️ Skipping {comment_verb} comment event")
-            
-            return 'OK', 200
-            
-        except Exception as e:
-            logging.error(f"❌ Error processing Instagram webhook: {e}")
-            return 'Error', 500
+        # Process webhook notification under one trace per delivery
+        with tracing.start_trace('webhook') as trace:
+            with profiler.maybe_profile_webhook(trace.trace_id):
+                return handle_webhook_delivery(trace)
 
 @app.route('/webhook/test', methods=['POST'])
 def test_webhook():
@@ -511,10 +937,37 @@ def test_webhook():
         logging.error(f"Error in test webhook: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/dry-run', methods=['POST'])
+def api_dry_run():
+    """Show what the current strategy would do with a list of comments, without sending anything"""
+    try:
+        data = request.get_json() or {}
+        comments = data.get('comments', [])
+        
+        dry_run_bot = bot or InstagramBot()
+        decisions = dry_run_bot.pipeline.dry_run(comments, media_id=data.get('media_id'))
+        
+        return jsonify({
+            'success': True,
+            'evaluated': len(comments),
+            'decisions': [
+                {
+                    'comment_id': decision.comment_id,
+                    'keyword': decision.keyword,
+                    'reason': decision.reason,
+                    'actions': [action._asdict() for action in decision.actions]
+                }
+                for decision in decisions
+            ]
+        })
+    except Exception as e:
+        logging.error(f"Error in dry run: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/webhook-test')
 def webhook_test_page():
     """Webhook testing interface page"""
-    return render_template('webhook_test.html', bot_status=bot_status)
+    return render_template('webhook_test.html', bot_status=bot_status.snapshot())
 
 @app.route('/instagram-setup')
 def instagram_setup():
@@ -530,13 +983,38 @@ def instagram_login():
         instagram_app_id = Config.INSTAGRAM_APP_ID or ''
         return render_template('instagram_login.html', 
                              instagram_app_id=instagram_app_id,
-                             bot_status=bot_status)
+                             bot_status=bot_status.snapshot())
                              
     except Exception as e:
         logging.error(f"Error in Instagram login page: {e}")
         flash(f'Error loading Instagram login: {str(e)}', 'error')
         return redirect(url_for('dashboard'))
 
+@app.route('/debug/traces')
+def debug_traces():
+    """Slowest recent traces with their stage breakdown"""
+    name = request.args.get('name', 'webhook')
+    limit = request.args.get('limit', 20, type=int)
+    traces = [trace.to_dict() for trace in tracing.slowest_traces(limit, name=name or None)]
+    return render_template('traces.html', traces=traces, name=name, bot_status=bot_status.snapshot())
+
+@app.route('/api/traces')
+def api_traces():
+    """Recent or slowest traces from this worker as JSON"""
+    trace_id = request.args.get('trace_id')
+    if trace_id:
+        trace = tracing.find_trace(trace_id)
+        if not trace:
+            return jsonify({'success': False, 'message': 'Trace not found'}), 404
+        return jsonify({'success': True, 'trace': trace.to_dict()})
+    
+    limit = request.args.get('limit', 20, type=int)
+    if request.args.get('sort') == 'recent':
+        traces = tracing.recent_traces(limit)
+    else:
+        traces = tracing.slowest_traces(limit, name=request.args.get('name'))
+    return jsonify({'success': True, 'traces': [trace.to_dict() for trace in traces]})
+
 @app.route('/debug/oauth-config')
 def debug_oauth_config():
     """Debug route to show OAuth configuration"""
@@ -629,20 +1107,22 @@ def auth_instagram_callback():
         
         logging.info(f"🔄 Token exchange using redirect URI: {redirect_uri}")
         
-        response = requests.post(token_url, data=token_data)
+        response = graph_client.post(token_url, data=token_data)
         
         if response.status_code == 200:
             token_info = response.json()
-            Config.INSTAGRAM_ACCESS_TOKEN = token_info.get('access_token')
-            Config.INSTAGRAM_USER_ID = token_info.get('user_id')
+            changes = {
+                'INSTAGRAM_ACCESS_TOKEN': token_info.get('access_token'),
+                'INSTAGRAM_USER_ID': token_info.get('user_id')
+            }
             
             # Update webhook base URL to current host if not set properly
             if not Config.WEBHOOK_BASE_URL or Config.WEBHOOK_BASE_URL == 'https://your-app.onrender.com':
-                Config.WEBHOOK_BASE_URL = request.host_url.rstrip('/')
-                logging.info(f"📍 Updated WEBHOOK_BASE_URL to: {Config.WEBHOOK_BASE_URL}")
+                changes['WEBHOOK_BASE_URL'] = request.host_url.rstrip('/')
+                logging.info(f"📍 Updated WEBHOOK_BASE_URL to: {changes['WEBHOOK_BASE_URL']}")
             
             # Save configuration
-            Config.save_runtime_config()
+            Config.update(**changes)
             
             # Initialize bot with new credentials
             global bot
@@ -677,19 +1157,33 @@ def update_instagram_login():
     return redirect(url_for('instagram_login'))
 
 def get_instagram_account_info():
-    """Get current Instagram account information for dashboard display"""
+    """Get current Instagram account information for dashboard display (cached for a few minutes)"""
+    if not Config.INSTAGRAM_ACCESS_TOKEN or not Config.INSTAGRAM_USER_ID:
+        return None
+    
+    cache_key = (Config.INSTAGRAM_USER_ID, Config.INSTAGRAM_ACCESS_TOKEN)
+    if (account_info_cache['key'] == cache_key and account_info_cache['value'] is not None
+            and time.time() - account_info_cache['fetched_at'] < ACCOUNT_INFO_CACHE_SECONDS):
+        metrics.cache_hit('account_info', True)
+        return account_info_cache['value']
+    
+    metrics.cache_hit('account_info', False)
+    account_info = fetch_instagram_account_info()
+    if account_info:
+        account_info_cache.update(key=cache_key, value=account_info, fetched_at=time.time())
+    return account_info
+
+def fetch_instagram_account_info():
+    """Fetch account information from the Instagram Business API"""
     try:
-        if not Config.INSTAGRAM_ACCESS_TOKEN or not Config.INSTAGRAM_USER_ID:
-            return None
-            
         # Get account info from Instagram Business API
-        url = f"https://graph.instagram.com/v21.0/{Config.INSTAGRAM_USER_ID}"
+        url = graph_client.api_url(Config.INSTAGRAM_USER_ID)
         params = {
             'fields': 'id,username,account_type,profile_picture_url,followers_count,media_count',
             'access_token': Config.INSTAGRAM_ACCESS_TOKEN
         }
         
-        response = requests.get(url, params=params)
+        response = graph_client.get(url, params=params)
         
         if response.status_code == 200:
             account_data = response.json()
@@ -719,14 +1213,14 @@ def manage_posts():
             return redirect(url_for('instagram_login'))
         
         # Fetch recent posts from Instagram Business API
-        posts_url = f"https://graph.instagram.com/v21.0/{Config.INSTAGRAM_USER_ID}/media"
+        posts_url = graph_client.api_url(f"{Config.INSTAGRAM_USER_ID}/media")
         params = {
             'fields': 'id,caption,media_type,media_url,thumbnail_url,permalink,timestamp',
             'limit': 25,  # Get last 25 posts
             'access_token': Config.INSTAGRAM_ACCESS_TOKEN
         }
         
-        response = requests.get(posts_url, params=params)
+        response = graph_client.get(posts_url, params=params)
         
         if response.status_code == 200:
             posts_data = response.json()
@@ -748,16 +1242,16 @@ def manage_posts():
             return render_template('manage_posts.html', 
                                  posts=posts,
                                  monitor_all=Config.MONITOR_ALL_POSTS,
-                                 bot_status=bot_status)
+                                 bot_status=bot_status.snapshot())
         else:
             error_data = response.json() if response.text else {}
             flash(f'❌ Failed to fetch posts: {error_data.get("error", {}).get("message", "Unknown error")}', 'error')
-            return render_template('manage_posts.html', posts=[], monitor_all=Config.MONITOR_ALL_POSTS, bot_status=bot_status)
+            return render_template('manage_posts.html', posts=[], monitor_all=Config.MONITOR_ALL_POSTS, bot_status=bot_status.snapshot())
             
     except Exception as e:
         logging.error(f"Error in manage posts: {e}")
         flash(f'❌ Error loading posts: {str(e)}', 'error')
-        return render_template('manage_posts.html', posts=[], monitor_all=Config.MONITOR_ALL_POSTS, bot_status=bot_status)
+        return render_template('manage_posts.html', posts=[], monitor_all=Config.MONITOR_ALL_POSTS, bot_status=bot_status.snapshot())
 
 @app.route('/update-monitored-posts', methods=['POST'])
 def update_monitored_posts():
@@ -766,11 +1260,11 @@ def update_monitored_posts():
         monitor_all = 'monitor_all' in request.form
         selected_posts = request.form.getlist('monitored_posts')
         
-        Config.MONITOR_ALL_POSTS = monitor_all
-        Config.MONITORED_POST_IDS = selected_posts if not monitor_all else []
-        
         # Save configuration
-        Config.save_runtime_config()
+        Config.update(
+            MONITOR_ALL_POSTS=monitor_all,
+            MONITORED_POST_IDS=selected_posts if not monitor_all else []
+        )
         
         if monitor_all:
             flash('✅ Now monitoring ALL posts for comments!', 'success')
@@ -786,14 +1280,39 @@ def update_monitored_posts():
         flash(f'❌ Error updating posts: {str(e)}', 'error')
         return redirect(url_for('manage_posts'))
 
-if __name__ == '__main__':
-    # Load runtime configuration on startup
-    print("🔧 Loading runtime configuration...")
-    Config.load_runtime_config()
+def after_fork():
+    """
+    Reset per-process state inherited from the gunicorn master (preload_app):
+    HTTP pools, SQLite handles, locks and the live feed's producer
+    """
+    global live_feed, bot_init_lock
+    graph_client.reset_after_fork()
+    bot_status.reset_connections()
+    accounts.reset()
+    journal.reset()
+    live_feed = LiveFeed(bot_status)
+    bot_init_lock = Lock()
+    warm_up.restart_clock()
+
+def start_background_work():
+    """Start this process's background threads and signal handlers"""
+    # Accept traffic now; authentication and cache warming follow in the background
+    warm_up.mark_serving()
+    warm_up.start()
     
-    # Initialize on startup
-    print("🤖 Initializing Instagram bot for webhook processing...")
-    init_bot()
+    # Singleton jobs (reconciliation, token refresh, webhook subscription) run in whichever worker holds their lease
+    jobs.start()
+    
+    # SIGUSR2 to a worker pid starts a sampling profile of that worker
+    profiler.install_signal_handler()
+
+# With preload_app the gunicorn master imports this module; gunicorn.conf.py
+# then starts background work in each worker after the fork instead
+if not os.environ.get('WEB_APP_DEFER_STARTUP'):
+    start_background_work()
+
+if __name__ == '__main__':
+    print("🤖 Initializing Instagram bot for webhook processing in the background...")
     
     # Check if running in production
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Raw webhook journal
+Every delivery body is appended, exactly as received, to an append-only
+journal for audit and replay. Records are buffered in memory and written in
+large chunks; each worker appends to its own active file, which is sealed
+into a gzip segment once it reaches a size or age limit. Sealed segments are
+listed in index.jsonl with the time range they cover, so a time window can be
+read without opening every segment. The oldest segments are deleted once all
+of them together exceed max_bytes.
+
+    python webhook_journal.py segments --since 2024-06-01T12:00
+    python webhook_journal.py cat --since 2024-06-01T12:00 --until 2024-06-01T13:00
+    python webhook_journal.py replay --since 2024-06-01T12:00 [--dry-run]
+
+Replayed comments go through the normal pipeline with source 'replay', so
+comments that were already handled are skipped.
+"""
+
+import argparse
+import atexit
+import contextlib
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Union
+
+import metrics
+
+INDEX_FILE = 'index.jsonl'
+SEGMENT_DIR = 'segments'
+
+_ACTIVE = re.compile(r'^active-(\d+)\.jsonl$')
+_PENDING = re.compile(r'^pending-(\d+)-(\w+)\.jsonl$')
+_CLAIMED = re.compile(r'^r(\d+)(?:_(\w+))?$')
+
+
+def _origin(pid: int, tag: str) -> str:
+    """Name of a pending file as its first writer created it, undoing the renames of orphan claims"""
+    match = _CLAIMED.match(tag)
+    while match:
+        pid, tag = int(match.group(1)), match.group(2)
+        if tag is None:
+            return f'{pid}-active'
+        match = _CLAIMED.match(tag)
+    return f'{pid}-{tag}'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WebhookJournal:
+    """Per-process writer; every worker can share one journal directory"""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, segment_seconds: float = 3600,
+                 buffer_bytes: int = 256 * 1024, flush_seconds: float = 1.0,
+                 max_bytes: Optional[int] = 1024 * 1024 * 1024):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.buffer_bytes = buffer_bytes
+        self.flush_seconds = flush_seconds
+        self.logger = logging.getLogger(__name__)
+        self.reset()
+
+    def reset(self):
+        """Forget state inherited from a parent process; the next append starts this process's writer"""
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._thread = None
+        self._buffer: List[bytes] = []
+        self._buffered_bytes = 0
+        self._file = None
+        self._file_bytes = 0
+        self._file_opened_at = 0.0
+        self._seal_lock = threading.Lock()
+        self.records = 0
+        self.bytes_written = 0
+        self.segments_sealed = 0
+        self.segments_pruned = 0
+        self.last_error: Optional[str] = None
+
+    # Writing
+
+    def append(self, body: Union[bytes, str], received_at: Optional[float] = None, trace_id: Optional[str] = None):
+        """Queue one delivery; it reaches disk within flush_seconds (or sooner when the buffer fills)"""
+        if not self.enabled:
+            return
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', errors='replace')
+        record = {'at': received_at or time.time(), 'trace': trace_id, 'body': body}
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+        if self._pid != os.getpid():
+            self._start()
+        with self._lock:
+            self._buffer.append(line)
+            self._buffered_bytes += len(line)
+            self.records += 1
+            if self._buffered_bytes >= self.buffer_bytes:
+                self._flush_locked()
+        metrics.JOURNAL_RECORDS.inc()
+
+    def flush(self, seal: bool = False):
+        """Write buffered records; with seal=True also close the active file into a segment"""
+        if not self.enabled or self._pid != os.getpid():
+            return
+        with self._lock:
+            self._flush_locked()
+            if seal:
+                self._rotate_locked()
+        if seal:
+            self._seal_pending()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        try:
+            if self._file is None:
+                self._file = open(self._path(f'active-{self._pid}.jsonl'), 'ab')
+                self._file_bytes = self._file.tell()
+                self._file_opened_at = time.time()
+            data = b''.join(self._buffer)
+            self._file.write(data)
+            self._file.flush()
+            self._file_bytes += len(data)
+            self.bytes_written += len(data)
+            metrics.JOURNAL_BYTES.labels('raw').inc(len(data))
+        except OSError as e:
+            self.last_error = str(e)
+            self.logger.error(f"❌ Webhook journal write failed, {len(self._buffer)} records dropped: {e}")
+        finally:
+            self._buffer = []
+            self._buffered_bytes = 0
+
+        if self._file_bytes >= self.segment_bytes:
+            self._rotate_locked()
+
+    def _rotate_locked(self):
+        """Hand the active file to the sealer (a cheap rename, so appends are never held up by gzip)"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        # Millisecond tag: a restarted worker may get the same pid while its old files are still pending
+        try:
+            os.rename(self._path(f'active-{self._pid}.jsonl'),
+                      self._path(f'pending-{self._pid}-{int(time.time() * 1000)}.jsonl'))
+        except OSError as e:
+            self.last_error = str(e)
+            self.logger.error(f"❌ Webhook journal rotation failed: {e}")
+        self._wake.set()
+
+    # Sealing
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(os.path.join(self.directory, SEGMENT_DIR), exist_ok=True)
+            self._claim_orphans()
+            self._thread = threading.Thread(target=self._run, name='webhook-journal', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush, seal=True)
+
+    def _claim_orphans(self):
+        """Take over files left by workers that died before sealing them (rename decides the race)"""
+        for name in os.listdir(self.directory):
+            match = _ACTIVE.match(name) or _PENDING.match(name)
+            if not match or int(match.group(1)) == self._pid or _pid_alive(int(match.group(1))):
+                continue
+            tag = f"r{match.group(1)}_{match.group(2)}" if match.lastindex > 1 else f"r{match.group(1)}"
+            try:
+                os.rename(self._path(name), self._path(f'pending-{self._pid}-{tag}.jsonl'))
+            except FileNotFoundError:
+                continue  # another worker claimed it first
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            with self._lock:
+                self._flush_locked()
+                if self._file is not None and time.time() - self._file_opened_at >= self.segment_seconds:
+                    self._rotate_locked()
+            self._seal_pending()
+
+    def _seal_pending(self):
+        with self._seal_lock:
+            for name in sorted(os.listdir(self.directory)):
+                match = _PENDING.match(name)
+                if match and int(match.group(1)) == self._pid:
+                    try:
+                        self._seal(name, match.group(2))
+                    except OSError as e:
+                        self.last_error = str(e)
+                        self.logger.error(f"❌ Sealing webhook journal file {name} failed: {e}")
+            self._prune()
+
+    def _prune(self):
+        """Delete the oldest sealed segments while all of them together exceed max_bytes"""
+        if not self.max_bytes:
+            return
+        directory = self._path(SEGMENT_DIR)
+        segments = []
+        for name in sorted(os.listdir(directory)):  # names start with the first record's time
+            if name.endswith('.jsonl.gz') and not name.startswith('.'):
+                with contextlib.suppress(FileNotFoundError):
+                    segments.append((name, os.path.getsize(os.path.join(directory, name))))
+
+        total = sum(size for _, size in segments)
+        for name, size in segments:
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):  # pruned by another worker
+                os.remove(os.path.join(directory, name))
+                self.segments_pruned += 1
+                self.logger.info(f"🗑️ Deleted webhook journal segment {name} (journal over {self.max_bytes} bytes)")
+            total -= size
+
+    def _seal(self, name: str, tag: str):
+        """Compress one pending file into a segment, record it in the index, then delete the original"""
+        source = self._path(name)
+        first_at = last_at = None
+        records = 0
+        partial = self._path(f'{SEGMENT_DIR}/.{name}.gz')
+        with open(source, 'rb') as plain, gzip.open(partial, 'wb', compresslevel=6) as compressed:
+            for line in plain:
+                if not line.endswith(b'\n'):
+                    break  # torn final write from a crash
+                try:
+                    at = json.loads(line)['at']
+                except (ValueError, KeyError):
+                    self.logger.warning(f"⚠️ Skipping unreadable webhook journal line in {name}")
+                    continue
+                first_at = at if first_at is None else first_at
+                last_at = at
+                records += 1
+                compressed.write(line)
+
+        if not records:
+            os.remove(partial)
+            os.remove(source)
+            return
+
+        # Named after the original file: if we crash before removing the source, whoever
+        # claims it re-seals it to the same segment and index entry instead of a duplicate
+        stamp = datetime.fromtimestamp(first_at, timezone.utc).strftime('%Y%m%dT%H%M%S')
+        segment = f'{SEGMENT_DIR}/{stamp}-{_origin(self._pid, tag)}.jsonl.gz'
+        os.replace(partial, self._path(segment))
+
+        entry = {'segment': segment, 'first_at': first_at, 'last_at': last_at, 'records': records,
+                 'bytes': os.path.getsize(source), 'compressed_bytes': os.path.getsize(self._path(segment))}
+        # One O_APPEND write per entry keeps lines from different workers whole
+        fd = os.open(self._path(INDEX_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(entry) + '\n').encode('utf-8'))
+        finally:
+            os.close(fd)
+        os.remove(source)
+
+        self.segments_sealed += 1
+        metrics.JOURNAL_BYTES.labels('compressed').inc(entry['compressed_bytes'])
+        self.logger.info(f"🗄️ Sealed webhook journal segment {segment}: {records} records, "
+                         f"{entry['bytes']} -> {entry['compressed_bytes']} bytes")
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'directory': self.directory,
+            'records': self.records,
+            'bytes_written': self.bytes_written,
+            'buffered_bytes': self._buffered_bytes,
+            'active_file_bytes': self._file_bytes if self._file is not None else 0,
+            'segments_sealed': self.segments_sealed,
+            'segments_pruned': self.segments_pruned,
+            'last_error': self.last_error
+        }
+
+
+# Reading
+
+def read_index(directory: str) -> List[Dict]:
+    """Sealed segments still on disk, oldest first (an entry re-written after a crash is listed once)"""
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    entries = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry['segment']] = entry
+    # Entries of pruned segments stay in the append-only index
+    present = [entry for entry in entries.values() if os.path.exists(os.path.join(directory, entry['segment']))]
+    return sorted(present, key=lambda entry: entry['first_at'])
+
+
+def _file_records(path: str, since: float, until: float) -> Iterator[Dict]:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since <= record['at'] <= until:
+                yield record
+
+
+def iter_records(directory: str, since: Optional[float] = None, until: Optional[float] = None,
+                 include_unsealed: bool = True) -> Iterator[Dict]:
+    """Records received in [since, until], merged across workers in time order"""
+    since = since if since is not None else float('-inf')
+    until = until if until is not None else float('inf')
+    paths = [os.path.join(directory, entry['segment']) for entry in read_index(directory)
+             if entry['last_at'] >= since and entry['first_at'] <= until]
+    if include_unsealed and os.path.isdir(directory):
+        paths += [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                  if _ACTIVE.match(name) or _PENDING.match(name)]
+    sources = [_file_records(path, since, until) for path in paths if os.path.exists(path)]
+    return heapq.merge(*sources, key=lambda record: record['at'])
+
+
+# Command line
+
+def parse_time(value: str) -> float:
+    """Epoch seconds or an ISO date/time (local time unless it carries an offset)"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def replay(records: Iterator[Dict], dry_run: bool = False) -> Dict:
+    """Feed journaled deliveries back through the webhook processing path"""
+    os.environ.setdefault('WEB_APP_DEFER_STARTUP', '1')  # no serving, leases or warm-up in the CLI
+    import web_app
+    from instagram_bot import InstagramBot
+
+    dry_run_bot = None
+    totals = {'deliveries': 0, 'comments': 0, 'decisions': 0, 'errors': 0}
+    for record in records:
+        totals['deliveries'] += 1
+        try:
+            data = json.loads(record['body'])
+        except ValueError:
+            totals['errors'] += 1
+            continue
+
+        if not dry_run:
+            outcome = web_app.process_webhook_entries(data, source='replay')
+            totals['errors'] += outcome != 'processed'
+            totals['comments'] += sum(len(entry.get('changes', [])) for entry in data.get('entry', []))
+            continue
+
+        values = [change.get('value', {}) for entry in data.get('entry', []) for change in entry.get('changes', [])
+                  if change.get('field') == 'comments']
+        totals['comments'] += len(values)
+        dry_run_bot = dry_run_bot or web_app.bot or InstagramBot()
+        for decision in dry_run_bot.pipeline.dry_run(values, source='replay'):
+            totals['decisions'] += 1
+            print(json.dumps({'at': record['at'], 'comment_id': decision.comment_id, 'keyword': decision.keyword,
+                              'reason': decision.reason,
+                              'actions': [action._asdict() for action in decision.actions]}, ensure_ascii=False))
+    return totals
+
+
+def main(argv=None) -> int:
+    # Keep config's startup notices out of `cat` output
+    with contextlib.redirect_stdout(sys.stderr):
+        from config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('segments', 'cat', 'replay'))
+    parser.add_argument('--dir', default=Config.WEBHOOK_JOURNAL_DIR, help='Journal directory')
+    parser.add_argument('--since', type=parse_time, help='Epoch seconds or ISO time')
+    parser.add_argument('--until', type=parse_time, help='Epoch seconds or ISO time')
+    parser.add_argument('--sealed-only', action='store_true', help='Skip files that are still being written')
+    parser.add_argument('--dry-run', action='store_true', help='replay: print decisions instead of acting')
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error('the journal is disabled: pass --dir or set WEBHOOK_JOURNAL_DIR')
+
+    if args.command == 'segments':
+        for entry in read_index(args.dir):
+            if args.since is not None and entry['last_at'] < args.since:
+                continue
+            if args.until is not None and entry['first_at'] > args.until:
+                continue
+            print(json.dumps(entry))
+        return 0
+
+    records = iter_records(args.dir, args.since, args.until, include_unsealed=not args.sealed_only)
+    if args.command == 'cat':
+        for record in records:
+            print(json.dumps(record, ensure_ascii=False))
+        return 0
+
+    totals = replay(records, dry_run=args.dry_run)
+    print(f"🔁 Replayed {totals['deliveries']} deliveries ({totals['comments']} comments, "
+          f"{totals['decisions']} dry-run decisions, {totals['errors']} errors)", file=sys.stderr)
+    return 1 if totals['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())